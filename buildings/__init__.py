@@ -5,6 +5,8 @@ from qgis.core import QgsProject
 
 from .settings_picker_dialog import SettingsPickerDialog
 from .work_areas_dialog import WorkAreasDialog
+from .batch_queue import BatchQueue
+from .batch_queue_dialog import BatchQueueDialog
 from .json_settings import JsonSettings
 
 class MinimalPlugin:
@@ -13,6 +15,7 @@ class MinimalPlugin:
         self.plugin_dir = os.path.dirname(__file__)
         self.actions = []
         self.settings = JsonSettings()
+        self.batch_queue = None
 
     def add_action(self, text, callback, enabled_flag=True, add_to_toolbar=True, status_tip=None, parent=None):
         action = QAction(text, parent)
@@ -27,6 +30,8 @@ class MinimalPlugin:
 
     def initGui(self):
         print("Initializing GUI")
+        self.batch_queue = BatchQueue(self.plugin_dir, self.settings)
+        self.batch_queue.schedule()
         self.add_action(
             text='🏠',
             callback=self.run,
@@ -35,29 +40,34 @@ class MinimalPlugin:
 
     def run(self):
         print("Running plugin")
-        self.dialog = MinimalDialog(self.iface, self.settings)
-        self.dialog.setFixedSize(200, 100)
+        self.dialog = MinimalDialog(self.iface, self.settings, self.batch_queue)
+        self.dialog.setFixedSize(200, 130)
         self.dialog.show()
 
     def unload(self):
         print("Unloading plugin")
+        if self.batch_queue:
+            self.batch_queue.shutdown()
         for action in self.actions:
             self.iface.removeToolBarIcon(action)
 
 
 class MinimalDialog(QDialog):
-    def __init__(self, iface, settings, parent=None):
+    def __init__(self, iface, settings, batch_queue, parent=None):
         super().__init__(parent)
         self.iface = iface
         self.settings = settings
+        self.batch_queue = batch_queue
         self.setWindowTitle('Buildings Detector')
         layout = QVBoxLayout()
 
         self.create_sample_button = QPushButton('Workflow')
+        self.batch_queue_button = QPushButton('Batch Queue')
         self.settings_button = QPushButton('Settings')
         self.clear_layers_button = QPushButton('Clear Layers')
 
         layout.addWidget(self.create_sample_button)
+        layout.addWidget(self.batch_queue_button)
         layout.addWidget(self.settings_button)
         layout.addWidget(self.clear_layers_button)
 
@@ -66,6 +76,7 @@ class MinimalDialog(QDialog):
         self.update_training_button_state()
 
         self.create_sample_button.clicked.connect(self.create_sample)
+        self.batch_queue_button.clicked.connect(self.open_batch_queue)
         self.settings_button.clicked.connect(self.open_settings)
         self.clear_layers_button.clicked.connect(self.clear_layers)
 
@@ -74,6 +85,11 @@ class MinimalDialog(QDialog):
         self.work_areas_dialog = WorkAreasDialog(self.iface)
         self.work_areas_dialog.show()
 
+    def open_batch_queue(self):
+        self.close()
+        self.batch_queue_dialog = BatchQueueDialog(self.batch_queue, self.settings)
+        self.batch_queue_dialog.show()
+
     def open_settings(self):
         self.close()
         self.settings_dialog = SettingsPickerDialog(self)
@@ -97,8 +113,10 @@ class MinimalDialog(QDialog):
         keys_to_check = ['raster_inliers_extractor', 'objects_bounds_finder', 'roof_locator', 'multiview_building_reconstructor', 'result_folder']
         if self.settings.check_keys_have_values(keys_to_check):
             self.create_sample_button.setEnabled(True)
+            self.batch_queue_button.setEnabled(True)
         else:
             self.create_sample_button.setEnabled(False)
+            self.batch_queue_button.setEnabled(False)
 
 
 def classFactory(iface):
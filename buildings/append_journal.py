@@ -0,0 +1,187 @@
+import base64
+import hashlib
+import json
+import os
+import struct
+import uuid
+
+journal_suffix = '.append.json'
+# Bytes at the start of each file that an append rewrites: the .shp/.shx
+# headers (file length, extent) and the .dbf header (update date, record count).
+header_sizes = {'.shp': 100, '.shx': 100, '.dbf': 32}
+# The .dbf end-of-file marker is overwritten by the first appended record.
+tail_size = 1
+# Every .shx record is an offset and a length, 4 bytes each.
+shx_record_size = 8
+
+
+def encode(data):
+    return base64.b64encode(data).decode()
+
+
+def batch_id(entries):
+    """Identifies a batch of appended features by the (variant file, WKB) pairs they were read from.
+
+    The geometries are part of the id, so a stage rerun that writes
+    different geometries to the same variant paths gives a new batch.
+    """
+    digest = hashlib.sha1()
+    for path, wkb in entries:
+        digest.update(path.encode() + b'\n')
+        digest.update(hashlib.sha1(wkb).digest())
+    return digest.hexdigest()
+
+
+def journal_files(path):
+    """The append journal and spatial index of a shapefile, which must be removed along with it."""
+    base, ext = os.path.splitext(path)
+    if ext.lower() != '.shp':
+        return []
+    return [base + journal_suffix, base + '.qix']
+
+
+def file_state(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class AppendJournal:
+    """Transaction log for features appended in place to an existing shapefile.
+
+    Appending to a shapefile only adds records at the end of the .shp, .shx
+    and .dbf and rewrites their headers. ``begin`` records the size, header
+    and last byte of each file before the append; ``commit`` drops that
+    record. If the append is interrupted, ``recover`` truncates the files
+    back and restores the saved bytes, which gives back the shapefile as it
+    was, so an interrupted write cannot corrupt existing results.
+
+    The journal also keeps the ids of the batches already written to the
+    shapefile (see batch_id), so rerunning a stage with the same selection
+    does not append its features a second time. It also keeps the size and
+    mtime of the files as of its last write; a journal that no longer
+    matches its shapefile (rewritten by a tool, restored from the cache) is
+    ignored, so its batches and pending append never apply to other
+    features. ``generation`` is renewed whenever the shapefile is written
+    anew, so readers that saw the same generation know its earlier records
+    are unchanged. The shapefile must not be open in OGR while ``recover``
+    runs.
+    """
+
+    def __init__(self, shapefile_path):
+        self.shapefile_path = shapefile_path
+        base = os.path.splitext(shapefile_path)[0]
+        self.journal_path = base + journal_suffix
+        self.files = [base + ext for ext in header_sizes]
+        self.feature_count = None
+        self.added = 0
+
+    def load(self):
+        if not os.path.exists(self.journal_path):
+            return {'batches': [], 'pending': None}
+        with open(self.journal_path, 'r') as f:
+            journal = json.load(f)
+        if not self.matches(journal):
+            print(f"Ignoring the append journal of {self.shapefile_path}, the shapefile was rewritten since")
+            return {'batches': [], 'pending': None}
+        return journal
+
+    def file_states(self):
+        return {path: file_state(path) for path in self.files if os.path.exists(path)}
+
+    def matches(self, journal):
+        """Whether ``journal`` was written for the shapefile now on disk.
+
+        Without a pending append the files must be as the journal last saw
+        them. During one they must be the same files (same inode), at least
+        as large as before the append.
+        """
+        pending = journal.get('pending')
+        if pending is None:
+            return journal.get('files') == self.file_states()
+        for path, state in pending['files'].items():
+            if not os.path.exists(path):
+                return False
+            stat = os.stat(path)
+            if stat.st_ino != state['inode'] or stat.st_size < state['size']:
+                return False
+        return True
+
+    def save(self, journal):
+        temp_path = f"{self.journal_path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(journal, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.journal_path)
+
+    def recover(self):
+        journal = self.load()
+        pending = journal['pending']
+        if pending is None:
+            return False
+        for path, state in pending['files'].items():
+            with open(path, 'r+b') as f:
+                f.truncate(state['size'])
+                f.seek(0)
+                f.write(base64.b64decode(state['header']))
+                f.seek(state['size'] - len(base64.b64decode(state['tail'])))
+                f.write(base64.b64decode(state['tail']))
+                f.flush()
+                os.fsync(f.fileno())
+        journal['pending'] = None
+        journal['files'] = self.file_states()
+        self.save(journal)
+        print(f"Rolled back an interrupted append to {self.shapefile_path} "
+              f"({pending['feature_count']} features kept)")
+        return True
+
+    def is_applied(self, batch):
+        return batch in self.load()['batches']
+
+    def begin(self, feature_count, batch):
+        files = {}
+        for path in self.files:
+            if not os.path.exists(path):
+                continue
+            size = os.path.getsize(path)
+            with open(path, 'rb') as f:
+                header = f.read(header_sizes[os.path.splitext(path)[1]])
+                f.seek(max(size - tail_size, 0))
+                tail = f.read(tail_size)
+            files[path] = {'size': size, 'inode': os.stat(path).st_ino, 'header': encode(header),
+                           'tail': encode(tail)}
+
+        journal = self.load()
+        journal.setdefault('generation', uuid.uuid4().hex)
+        journal['pending'] = {'batch': batch, 'feature_count': feature_count, 'files': files}
+        self.save(journal)
+        self.feature_count = feature_count
+
+        # A stale spatial index would hide the appended features from spatial queries.
+        qix_path = os.path.splitext(self.shapefile_path)[0] + '.qix'
+        if os.path.exists(qix_path):
+            os.remove(qix_path)
+
+    def commit(self):
+        journal = self.load()
+        if journal['pending'] is not None:
+            journal['batches'].append(journal['pending']['batch'])
+            journal['pending'] = None
+            journal['files'] = self.file_states()
+            self.save(journal)
+
+    def record(self, batch):
+        """Starts the journal of a newly written shapefile holding the features of ``batch``."""
+        self.save({'batches': [batch], 'pending': None, 'files': self.file_states(), 'generation': uuid.uuid4().hex})
+
+    def record_counts(self):
+        """Returns the number of records in the .shx and in the .dbf header, read from the files.
+
+        Read without OGR, so the counts are what is on disk once the layer
+        has been released.
+        """
+        base = os.path.splitext(self.shapefile_path)[0]
+        shx_count = (os.path.getsize(base + '.shx') - header_sizes['.shx']) // shx_record_size
+        with open(base + '.dbf', 'rb') as f:
+            dbf_count = struct.unpack('<I', f.read(8)[4:8])[0]
+        return shx_count, dbf_count
@@ -0,0 +1,177 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+
+from .append_journal import journal_files
+from .stage_manifest import related_files
+
+# Files above this size are identified by size, mtime and sampled blocks instead of a full read.
+full_digest_limit = 64 * 1024 * 1024
+sample_block_size = 1024 * 1024
+# Metadata file of a cache entry; its mtime is the entry's last use.
+entry_file_name = '.entry.json'
+temp_suffix = '.tmp'
+# Temporary entry folders older than this were left by an interrupted store.
+stale_temp_age = 3600
+
+
+def content_digest(path):
+    digest = hashlib.sha256()
+    for file_path in related_files(path):
+        if not os.path.exists(file_path):
+            continue
+        stat = os.stat(file_path)
+        digest.update(os.path.basename(file_path).encode())
+        digest.update(str(stat.st_size).encode())
+        with open(file_path, 'rb') as f:
+            if stat.st_size <= full_digest_limit:
+                for block in iter(lambda: f.read(sample_block_size), b''):
+                    digest.update(block)
+            else:
+                digest.update(str(stat.st_mtime_ns).encode())
+                for offset in (0, stat.st_size // 2, stat.st_size - sample_block_size):
+                    f.seek(offset)
+                    digest.update(f.read(sample_block_size))
+    return digest.hexdigest()
+
+
+def link_or_copy(source, destination):
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+class ArtifactCache:
+    """Content-addressed store of stage outputs shared between work areas.
+
+    Entries are keyed by a hash of the tool, its arguments and the content of
+    its inputs, and are materialised into a work area with hardlinks (or
+    copies across filesystems). The least recently used entries are evicted
+    once the cache grows over ``max_size`` bytes.
+
+    The cache folder is shared by the GUI, batch queue tasks and job queue
+    workers on several nodes, so there is no common index: each entry folder
+    holds an ``.entry.json`` with its size, and the mtime of that file is the
+    entry's last use. Replacing entries and evicting take an exclusive flock
+    on ``cache.lock``, fetching takes a shared one, so an entry is never
+    removed while another process links from it.
+    """
+
+    def __init__(self, cache_folder, max_size):
+        self.cache_folder = cache_folder
+        self.max_size = max_size
+        self.lock_path = os.path.join(cache_folder, 'cache.lock')
+        os.makedirs(cache_folder, exist_ok=True)
+
+    def key(self, tool, arguments, inputs):
+        data = {
+            'tool': content_digest(tool) if tool and os.path.exists(tool) else tool,
+            'arguments': arguments,
+            'inputs': [content_digest(path) for path in inputs],
+        }
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+    def entry_folder(self, key):
+        return os.path.join(self.cache_folder, key[:2], key)
+
+    def metadata_path(self, key):
+        return os.path.join(self.entry_folder(key), entry_file_name)
+
+    @contextmanager
+    def locked(self, operation):
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def fetch(self, key, outputs):
+        with self.locked(fcntl.LOCK_SH):
+            entry_folder = self.entry_folder(key)
+            metadata_path = self.metadata_path(key)
+            if not os.path.exists(metadata_path):
+                return False
+
+            for output in outputs:
+                os.makedirs(os.path.dirname(output), exist_ok=True)
+                for file_path in journal_files(output):
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+                for file_path in related_files(output):
+                    cached_path = os.path.join(entry_folder, os.path.basename(file_path))
+                    if os.path.exists(cached_path):
+                        link_or_copy(cached_path, file_path)
+
+            os.utime(metadata_path)
+        print(f"Restored {', '.join(outputs)} from cache entry {key}")
+        return True
+
+    def store(self, key, outputs):
+        files = [file_path for output in outputs for file_path in related_files(output) if os.path.exists(file_path)]
+        if not files:
+            return
+
+        # The entry is built under a temporary name without the lock, only the rename is locked.
+        entry_folder = self.entry_folder(key)
+        temp_folder = f"{entry_folder}.{uuid.uuid4().hex}{temp_suffix}"
+        os.makedirs(temp_folder)
+        for file_path in files:
+            link_or_copy(file_path, os.path.join(temp_folder, os.path.basename(file_path)))
+        with open(os.path.join(temp_folder, entry_file_name), 'w') as f:
+            json.dump({'size': sum(os.path.getsize(file_path) for file_path in files)}, f)
+
+        with self.locked(fcntl.LOCK_EX):
+            if os.path.exists(entry_folder):
+                shutil.rmtree(entry_folder)
+            os.rename(temp_folder, entry_folder)
+            self.evict()
+        print(f"Stored {', '.join(outputs)} in cache entry {key}")
+
+    def entries(self):
+        """Returns (last used, size, key) of every complete entry and removes abandoned folders.
+
+        Folders without metadata are left by an interrupted store or by an
+        older cache layout and are never used, so they are removed; a
+        temporary folder is removed once it is older than ``stale_temp_age``
+        since another process may still be filling it.
+        """
+        entries = []
+        for prefix in os.listdir(self.cache_folder):
+            prefix_folder = os.path.join(self.cache_folder, prefix)
+            if not os.path.isdir(prefix_folder):
+                continue
+            for name in os.listdir(prefix_folder):
+                folder = os.path.join(prefix_folder, name)
+                if name.endswith(temp_suffix):
+                    if time.time() - os.path.getmtime(folder) > stale_temp_age:
+                        shutil.rmtree(folder, ignore_errors=True)
+                    continue
+                try:
+                    metadata_path = os.path.join(folder, entry_file_name)
+                    with open(metadata_path, 'r') as f:
+                        size = json.load(f)['size']
+                    entries.append((os.path.getmtime(metadata_path), size, name))
+                except (OSError, ValueError, KeyError):
+                    shutil.rmtree(folder, ignore_errors=True)
+                    print(f"Removed abandoned cache folder {folder}")
+        return entries
+
+    def evict(self):
+        """Removes the least recently used entries over ``max_size``, the exclusive lock must be held."""
+        entries = sorted(self.entries())
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(self.entry_folder(key), ignore_errors=True)
+            total_size -= size
+            print(f"Evicted cache entry {key}")
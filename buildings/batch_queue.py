@@ -0,0 +1,204 @@
+import json
+import os
+import time
+import uuid
+from functools import partial
+
+from qgis.core import QgsApplication
+
+from .json_settings import JsonSettings
+from .pipeline_task import PipelineTask
+from .tiled_pipeline import create_headless_tool
+from .variant_selector import VariantSelector
+from .work_area import WorkArea
+from .work_area_manager import WorkAreaManager
+
+default_batch_max_concurrent = 1
+
+
+def run_work_area(work_area_id, task):
+    """Runs the whole pipeline for a saved work area inside a batch task.
+
+    The pickers are replaced by VariantSelector, so no dialog is shown;
+    the ``batch_selection_policy`` setting chooses its policy.
+    """
+    work_area_data = WorkAreaManager(os.path.dirname(__file__)).get_work_area(work_area_id)
+    if work_area_data is None:
+        raise ValueError(f"Work area {work_area_id} no longer exists")
+    settings = JsonSettings()
+    tool = create_headless_tool(WorkArea.from_dict(work_area_data), settings,
+                                VariantSelector(settings.value('batch_selection_policy', 'first')))
+    tool.task = task
+    if not tool.run() and not task.isCanceled():
+        raise RuntimeError(f"Pipeline for '{work_area_data['name']}' did not finish")
+
+
+class BatchQueue:
+    """Runs saved work areas one after another without user interaction.
+
+    Items are started by descending priority, then in the order they were
+    enqueued, with at most ``batch_max_concurrent`` running at once. The
+    queue is stored in batch_queue.json next to work_areas.json, so it
+    survives a QGIS restart; items that were running when QGIS quit are put
+    back to pending, and an active queue resumes when it is loaded again.
+    ``listeners`` are called on the main thread after every change.
+    """
+
+    def __init__(self, plugin_dir, settings, run_item=run_work_area):
+        self.file_path = os.path.join(plugin_dir, 'batch_queue.json')
+        self.settings = settings
+        self.run_item = run_item
+        self.items = []
+        self.active = False
+        self.tasks = {}
+        self.listeners = []
+        self.shutting_down = False
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error reading batch queue {self.file_path}: {e}")
+            return
+        self.items = data.get('items', [])
+        self.active = data.get('active', False)
+        for item in self.items:
+            if item['status'] == 'running':
+                item['status'] = 'pending'
+                item['message'] = 'Interrupted, queued again'
+
+    def save(self):
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'active': self.active, 'items': self.items}, f, indent=4)
+        os.replace(temp_path, self.file_path)
+
+    def changed(self):
+        self.save()
+        for listener in self.listeners:
+            listener()
+
+    def max_concurrent(self):
+        return max(int(self.settings.value('batch_max_concurrent', default_batch_max_concurrent)), 1)
+
+    def find(self, item_id):
+        for item in self.items:
+            if item['id'] == item_id:
+                return item
+        return None
+
+    def enqueue(self, work_area_data, priority=0):
+        item = {
+            'id': str(uuid.uuid4()),
+            'work_area_id': work_area_data['id'],
+            'name': work_area_data['name'],
+            'priority': priority,
+            'status': 'pending',
+            'message': '',
+            'enqueued_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+        }
+        self.items.append(item)
+        self.changed()
+        self.schedule()
+        return item
+
+    def set_priority(self, item_id, priority):
+        item = self.find(item_id)
+        if item:
+            item['priority'] = priority
+            self.changed()
+
+    def remove(self, item_id):
+        self.items = [item for item in self.items if item['id'] != item_id or item['status'] == 'running']
+        self.changed()
+
+    def remove_finished(self):
+        self.items = [item for item in self.items if item['status'] in ('pending', 'running')]
+        self.changed()
+
+    def cancel(self, item_id):
+        item = self.find(item_id)
+        if item is None:
+            return
+        if item['status'] == 'running':
+            self.tasks[item_id].cancel()
+        elif item['status'] == 'pending':
+            item['status'] = 'canceled'
+            self.changed()
+
+    def retry(self, item_id):
+        item = self.find(item_id)
+        if item and item['status'] in ('failed', 'canceled'):
+            item['status'] = 'pending'
+            item['message'] = ''
+            self.changed()
+            self.schedule()
+
+    def start(self):
+        self.active = True
+        self.changed()
+        self.schedule()
+
+    def pause(self):
+        self.active = False
+        self.changed()
+
+    def pending_items(self):
+        pending = [item for item in self.items if item['status'] == 'pending']
+        return sorted(pending, key=lambda item: (-item['priority'], item['enqueued_at']))
+
+    def running_count(self):
+        return sum(1 for item in self.items if item['status'] == 'running')
+
+    def schedule(self):
+        if not self.active:
+            return
+        free_slots = self.max_concurrent() - self.running_count()
+        for item in self.pending_items()[:max(free_slots, 0)]:
+            self.launch(item)
+        if not self.pending_items() and not self.running_count():
+            print("Batch queue finished")
+            self.active = False
+        self.changed()
+
+    def launch(self, item):
+        item['status'] = 'running'
+        item['message'] = ''
+        item['started_at'] = time.time()
+        item['finished_at'] = None
+        task = PipelineTask(f"Batch: {item['name']}", partial(self.run_item, item['work_area_id']),
+                            partial(self.on_item_finished, item['id']))
+        self.tasks[item['id']] = task
+        QgsApplication.taskManager().addTask(task)
+
+    def on_item_finished(self, item_id, result, exception):
+        self.tasks.pop(item_id, None)
+        if self.shutting_down:
+            return
+        item = self.find(item_id)
+        if item is None:
+            return
+        item['finished_at'] = time.time()
+        if result:
+            item['status'] = 'done'
+        elif exception is not None:
+            item['status'] = 'failed'
+            item['message'] = str(exception)
+        else:
+            item['status'] = 'canceled'
+        print(f"Batch item '{item['name']}' {item['status']}")
+        self.changed()
+        self.schedule()
+
+    def shutdown(self):
+        """Cancels running items; they are queued again on the next load."""
+        self.shutting_down = True
+        self.listeners.clear()
+        for task in list(self.tasks.values()):
+            task.cancel()
@@ -4,11 +4,14 @@ import re
 from PyQt5 import QtCore, QtGui
 from PyQt5.QtWidgets import QDialog, QFileDialog, QVBoxLayout, QLabel, QLineEdit, QPushButton, QComboBox, QHBoxLayout, \
     QCheckBox, QMessageBox
-from qgis.core import QgsRasterLayer, QgsVectorLayer, QgsProject
+from qgis.core import QgsRasterLayer, QgsVectorLayer, QgsProject, QgsFeedback, QgsApplication
 
 from .draw_vectors_tools import DrawRedVectorTool
 from .draw_work_region_tool import DrawWorkRegionTool
-from .run_console_command_tool import ConsoleCommandTool
+from .json_settings import JsonSettings
+from .pipeline_task import PipelineTask
+from .tiled_pipeline import create_pipeline_tool
+from .vector_store import settings_vector_store
 from .work_area_manager import WorkAreaManager
 
 
@@ -160,6 +163,7 @@ class CreateWorkAreaDialog(QDialog):
         self.image_paths = self.ensure_five_elements(work_area.image_path)
         self.vector_paths = self.ensure_five_elements(work_area.vector_path)
         self.image_layers = [None] * 5
+        self.ingest_task = None
 
         if self.work_area.name:
             self.load_work_area_data()
@@ -307,12 +311,60 @@ class CreateWorkAreaDialog(QDialog):
         print(f"Raster layer loaded: {file_path}")
 
     def select_vector(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "Select Vector", "", "Vectors (*.shp)")
-        if file_path:
-            self.work_area.vectors = file_path
-            self.ui.labelVectorsPath.setText(self.elide_text(file_path))
-            self.load_vector_layer(file_path)
-            self.bring_to_front()
+        file_path, _ = QFileDialog.getOpenFileName(self, "Select Vector", "", "Vectors (*.shp *.gpkg)")
+        if not file_path:
+            return
+        store = settings_vector_store(JsonSettings())
+        if store is None:
+            self.use_vector(file_path)
+            return
+        source_path, store_path = store.resolve(file_path)
+        if store.is_ingested(store_path):
+            self.use_vector(store_path)
+            return
+        self.ingest_vector(store, source_path)
+
+    def use_vector(self, file_path):
+        self.work_area.vectors = file_path
+        self.ui.labelVectorsPath.setText(self.elide_text(file_path))
+        self.load_vector_layer(file_path)
+        self.bring_to_front()
+
+    def ingest_vector(self, store, source_path):
+        """Ingests an OSM source into its indexed GeoPackage copy in a background task, then uses the copy.
+
+        The dialog is disabled until the task finishes; a failed or canceled
+        ingestion uses the source as is.
+        """
+        ingested = []
+
+        def ingest(task):
+            task.begin_stage(f"Indexing {os.path.basename(source_path)}")
+            feedback = QgsFeedback()
+
+            def report_progress(percent):
+                task.stage_progress(percent)
+                if task.isCanceled():
+                    feedback.cancel()
+
+            feedback.progressChanged.connect(report_progress)
+            ingested.append(store.ingest(source_path, feedback))
+            task.end_stage()
+
+        def on_finished(result, exception):
+            self.ingest_task = None
+            self.setEnabled(True)
+            if result:
+                self.use_vector(ingested[0])
+                return
+            if exception is not None:
+                QMessageBox.warning(self, "Indexing failed", f"Using {source_path} as is: {exception}")
+            self.use_vector(source_path)
+
+        self.setEnabled(False)
+        self.iface.statusBarIface().showMessage(f"Indexing {os.path.basename(source_path)}...", 5000)
+        self.ingest_task = PipelineTask(f"Indexing {os.path.basename(source_path)}", ingest, on_finished)
+        QgsApplication.taskManager().addTask(self.ingest_task)
 
     def elide_text(self, text, max_width=200):
         font_metrics = QtGui.QFontMetrics(self.ui.labelName.font())
@@ -330,7 +382,7 @@ class CreateWorkAreaDialog(QDialog):
     def calculate(self):
         self.save_work_area()
         self.block_ui_elements(True)
-        ConsoleCommandTool(self.work_area).execute(self.iface)
+        create_pipeline_tool(self.work_area).execute(self.iface)
         self.remove_layers_by_name()
         self.accept()
 
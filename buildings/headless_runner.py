@@ -0,0 +1,113 @@
+"""Runs the buildings pipeline without the QGIS GUI.
+
+Run from the QGIS plugins folder with the QGIS Python environment, e.g.::
+
+    QT_QPA_PLATFORM=offscreen python3 -m buildings.headless_runner \\
+        --work-area my_area --settings settings.json --auto-select first
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+
+from qgis.core import QgsApplication
+
+from .json_settings import JsonSettings
+from .merge_vectors import VectorLayerProcessor
+from .run_console_command_tool import ConsoleCommandTool
+from .shades_and_projections_layer_processor import ShadesAndProjectionsLayerProcessor
+from .variant_selector import VariantSelector, selection_policies
+from .work_area import WorkArea
+from .work_area_manager import WorkAreaManager
+
+
+class HeadlessConsoleCommandTool(ConsoleCommandTool):
+    def __init__(self, work_area, settings, variant_selector, stop_requested=None):
+        super().__init__(work_area, settings)
+        self.variant_selector = variant_selector
+        self.stop_requested = stop_requested or threading.Event()
+
+    def should_cancel(self):
+        if self.stop_requested.is_set():
+            self.scheduler.abort.set()
+        return super().should_cancel()
+
+    def run(self):
+        print(f"Running buildings pipeline for '{self.work_area.name}' without GUI")
+        self.start_run()
+        if self.task is not None:
+            self.task.stage_count = max(self.scheduler.pending_background_count(), 1)
+        try:
+            main_thread_stages = self.scheduler.run(self.task)
+            while main_thread_stages:
+                for stage in main_thread_stages:
+                    self.scheduler.run_main_thread_stage(stage)
+                main_thread_stages = self.scheduler.run(self.task)
+        finally:
+            self.trace.save()
+        return self.scheduler.is_finished()
+
+    def pick_roofs(self):
+        with self.scheduler.span("VariantSelector.select_roofs", 'picker'):
+            self.variant_selector.select_roofs(self.root_folder)
+        with self.scheduler.span("VectorLayerProcessor.run", 'postprocess'):
+            VectorLayerProcessor(work_area_folder=self.root_folder, chunk_size=self.feature_chunk_size(),
+                                 read_workers=self.wkt_read_workers()).run()
+
+    def pick_structures(self):
+        with self.scheduler.span("VariantSelector.select_structures", 'picker'):
+            self.variant_selector.select_structures(self.root_folder)
+        with self.scheduler.span("ShadesAndProjectionsLayerProcessor.run", 'postprocess'):
+            ShadesAndProjectionsLayerProcessor(work_area_folder=self.root_folder,
+                                               chunk_size=self.feature_chunk_size(),
+                                               read_workers=self.wkt_read_workers()).run()
+
+    def load_layers(self):
+        print(f"Results for '{self.work_area.name}' are in {self.root_folder}")
+
+
+def load_work_area(args):
+    if args.spec:
+        with open(args.spec, 'r') as f:
+            return WorkArea.from_dict(json.load(f))
+
+    work_areas_file = args.work_areas_file or os.path.join(os.path.dirname(__file__), 'work_areas.json')
+    work_area_manager = WorkAreaManager(os.path.dirname(os.path.abspath(work_areas_file)), work_areas_file)
+    for work_area_data in work_area_manager.get_all_work_areas():
+        if args.work_area in (work_area_data["id"], work_area_data["name"]):
+            return WorkArea.from_dict(work_area_data)
+    raise ValueError(f"Work area '{args.work_area}' not found in {work_areas_file}")
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Run the buildings pipeline without the QGIS GUI.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--work-area', help="Name or id of a work area saved in work_areas.json")
+    source.add_argument('--spec', help="Standalone JSON file describing the work area")
+    parser.add_argument('--work-areas-file', help="work_areas.json to look the work area up in")
+    parser.add_argument('--settings', help="Settings JSON file (defaults to the plugin settings.json)")
+    parser.add_argument('--decisions', help="JSON file with picker decisions")
+    parser.add_argument('--auto-select', choices=selection_policies, default='first',
+                        help="Policy for subfolders without a decision")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    settings = JsonSettings(os.path.abspath(args.settings) if args.settings else None)
+
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+    try:
+        # tiled_pipeline imports this module, so it cannot be imported at the top.
+        from .tiled_pipeline import create_headless_tool
+        tool = create_headless_tool(load_work_area(args), settings, VariantSelector(args.auto_select, args.decisions))
+        finished = tool.run()
+    finally:
+        qgs.exitQgis()
+    return 0 if finished else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
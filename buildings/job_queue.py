@@ -0,0 +1,278 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+
+def write_json_atomic(path, data):
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(temp_path, path)
+
+
+def read_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+# How long a claim that is briefly missing or unreadable is waited for before
+# its lease counts as lost, see JobQueue.break_stale_claim.
+claim_recheck_delay = 0.5
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class JobClaim:
+    def __init__(self, queue, job, worker_id, token):
+        self.queue = queue
+        self.job = job
+        self.worker_id = worker_id
+        self.token = token
+        self.path = queue.claim_path(job['id'])
+
+    def is_held(self):
+        data = read_json(self.path)
+        if data is None:
+            # A worker checking a stale claim may have moved it away and is putting it back.
+            time.sleep(claim_recheck_delay)
+            data = read_json(self.path)
+        return data is not None and data.get('token') == self.token
+
+    def heartbeat(self):
+        """Renews the lease, returns False when another worker took it over."""
+        if not self.is_held():
+            return False
+        try:
+            os.utime(self.path)
+        except FileNotFoundError:
+            return False
+        return True
+
+
+class JobQueue:
+    """Work area queue kept in a folder shared by several nodes.
+
+    Layout of ``folder``::
+
+        jobs/<id>.json      queued jobs
+        claims/<id>.claim   lease of the worker running the job
+        done/<id>.json      results of finished jobs
+        failed/<id>.json    results of failed jobs
+
+    A job is claimed by creating its claim file with O_CREAT | O_EXCL, so
+    only one worker can win it. The owner refreshes the claim's mtime while
+    the job runs; a claim older than ``lease_timeout`` seconds belongs to a
+    dead worker and is taken over by renaming it away, which again only one
+    worker can do. The renamed claim is checked again before it is dropped:
+    if it is not the claim judged stale, because its owner renewed it or
+    another worker took the job over meanwhile, it is linked back in place.
+    A job whose lease expired ``max_attempts`` times is moved to failed.
+    Job and result files are written to a temporary name and renamed, so
+    readers never see partial JSON. The shared folder must support
+    exclusive creation, rename and hard links.
+    """
+
+    def __init__(self, folder, lease_timeout=300, max_attempts=3):
+        self.folder = folder
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        for name in ['jobs', 'claims', 'done', 'failed']:
+            os.makedirs(os.path.join(folder, name), exist_ok=True)
+
+    def job_path(self, job_id):
+        return os.path.join(self.folder, 'jobs', f'{job_id}.json')
+
+    def claim_path(self, job_id):
+        return os.path.join(self.folder, 'claims', f'{job_id}.claim')
+
+    def result_path(self, state, job_id):
+        return os.path.join(self.folder, state, f'{job_id}.json')
+
+    def enqueue(self, work_area_data, priority=0, options=None):
+        job = {
+            'id': f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}",
+            'work_area': work_area_data,
+            'priority': priority,
+            'options': options or {},
+            'attempts': 0,
+            'enqueued_at': time.time(),
+        }
+        write_json_atomic(self.job_path(job['id']), job)
+        return job
+
+    def job_ids(self, state='jobs'):
+        return sorted(name[:-len('.json')] for name in os.listdir(os.path.join(self.folder, state))
+                      if name.endswith('.json'))
+
+    def is_stale(self, claim_path):
+        try:
+            return time.time() - os.path.getmtime(claim_path) > self.lease_timeout
+        except FileNotFoundError:
+            return False
+
+    def pending_jobs(self):
+        finished = set(self.job_ids('done')) | set(self.job_ids('failed'))
+        jobs = []
+        for job_id in self.job_ids():
+            if job_id in finished:
+                continue
+            claim_path = self.claim_path(job_id)
+            if os.path.exists(claim_path) and not self.is_stale(claim_path):
+                continue
+            job = read_json(self.job_path(job_id))
+            if job is not None:
+                jobs.append(job)
+        return sorted(jobs, key=lambda job: (-job['priority'], job['enqueued_at'], job['id']))
+
+    def stale_claim_token(self, claim_path):
+        """Returns the token of the claim at ``claim_path`` when its lease expired, None otherwise."""
+        if not self.is_stale(claim_path):
+            return None
+        data = read_json(claim_path)
+        return None if data is None else data.get('token')
+
+    def claim(self, job, worker_id):
+        claim_path = self.claim_path(job['id'])
+        token = uuid.uuid4().hex
+        for _ in range(2):
+            try:
+                fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                stale_token = self.stale_claim_token(claim_path)
+                if stale_token is None or not self.break_stale_claim(claim_path, stale_token, worker_id):
+                    return None
+                continue
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'worker': worker_id, 'token': token, 'claimed_at': time.time()}, f)
+            return self.start_attempt(JobClaim(self, job, worker_id, token))
+        return None
+
+    def break_stale_claim(self, claim_path, stale_token, worker_id):
+        """Removes the claim with ``stale_token``, returns False when the claim found is another one.
+
+        The claim may have been renewed or replaced since it was judged
+        stale, so the moved file is checked again and put back when it is
+        not the stale one. Putting it back with a hard link never replaces
+        a claim created in the meantime.
+        """
+        stale_path = f"{claim_path}.stale-{uuid.uuid4().hex}"
+        try:
+            os.rename(claim_path, stale_path)
+        except FileNotFoundError:
+            return False
+        previous = read_json(stale_path) or {}
+        if previous.get('token') != stale_token or not self.is_stale(stale_path):
+            try:
+                os.link(stale_path, claim_path)
+            except FileExistsError:
+                pass
+            os.remove(stale_path)
+            return False
+        os.remove(stale_path)
+        print(f"{worker_id}: recovered lease of {previous.get('worker', 'unknown worker')} on "
+              f"{os.path.basename(claim_path)}")
+        return True
+
+    def start_attempt(self, claim):
+        # Re-read the job, the previous owner may have finished it meanwhile.
+        job_id = claim.job['id']
+        job = read_json(self.job_path(job_id))
+        if job is None or os.path.exists(self.result_path('done', job_id)) or \
+                os.path.exists(self.result_path('failed', job_id)):
+            self.release(claim)
+            return None
+        job['attempts'] = job.get('attempts', 0) + 1
+        if job['attempts'] > self.max_attempts:
+            claim.job = job
+            self.finish(claim, 'failed', {'error': f"Lease expired {self.max_attempts} times"})
+            return None
+        write_json_atomic(self.job_path(job_id), job)
+        claim.job = job
+        return claim
+
+    def claim_next(self, worker_id):
+        for job in self.pending_jobs():
+            claim = self.claim(job, worker_id)
+            if claim is not None:
+                return claim
+        return None
+
+    def release(self, claim):
+        """Gives the job back to the queue without a result."""
+        if claim.is_held():
+            try:
+                os.remove(claim.path)
+            except FileNotFoundError:
+                pass
+
+    def finish(self, claim, state, result):
+        job_id = claim.job['id']
+        if not claim.is_held():
+            print(f"{claim.worker_id}: lease on job {job_id} was lost, not recording it as {state}")
+            return False
+        record = dict(claim.job, state=state, worker=claim.worker_id, finished_at=time.time(), **result)
+        write_json_atomic(self.result_path(state, job_id), record)
+        for path in [self.job_path(job_id), claim.path]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return True
+
+    def complete(self, claim, result=None):
+        return self.finish(claim, 'done', result or {})
+
+    def fail(self, claim, error):
+        return self.finish(claim, 'failed', {'error': error})
+
+    def status(self):
+        running = []
+        for job_id in self.job_ids():
+            claim = read_json(self.claim_path(job_id))
+            if claim is not None and not self.is_stale(self.claim_path(job_id)):
+                running.append({'id': job_id, 'worker': claim.get('worker')})
+        return {
+            'pending': [job['id'] for job in self.pending_jobs()],
+            'running': running,
+            'done': self.job_ids('done'),
+            'failed': self.job_ids('failed'),
+        }
+
+
+class Heartbeat:
+    """Renews a claim from a background thread while its job runs.
+
+    ``on_lost`` is called once if the lease was taken over by another worker.
+    """
+
+    def __init__(self, claim, interval, on_lost):
+        self.claim = claim
+        self.interval = interval
+        self.on_lost = on_lost
+        self.lost = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.beat, name=f"heartbeat-{claim.job['id']}", daemon=True)
+
+    def beat(self):
+        while not self.stopped.wait(self.interval):
+            if not self.claim.heartbeat():
+                self.lost = True
+                print(f"Lost the lease on job {self.claim.job['id']}")
+                self.on_lost()
+                return
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
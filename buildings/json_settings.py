@@ -3,9 +3,9 @@ import os
 
 
 class JsonSettings:
-    def __init__(self):
+    def __init__(self, file_path=None):
         self.plugin_directory = os.path.dirname(__file__)
-        self.file_path = os.path.join(self.plugin_directory, "settings.json")
+        self.file_path = file_path or os.path.join(self.plugin_directory, "settings.json")
 
         if not os.path.exists(self.file_path):
             with open(self.file_path, 'w') as f:
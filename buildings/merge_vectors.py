@@ -6,30 +6,87 @@ from qgis.core import (
     QgsVectorLayer,
     QgsField,
     QgsFeature,
-    QgsGeometry,
     QgsProject,
     QgsVectorFileWriter,
     QgsCoordinateReferenceSystem
 )
 
+from .append_journal import AppendJournal, batch_id
+from .variant_pack import VariantPacks
+from .wkt_reader import read_wkt_geometries, default_wkt_read_workers
+
+# Features added to a layer with one addFeatures call.
+default_feature_chunk_size = 1000
+
+
+def add_feature_chunks(provider, features, chunk_size):
+    """Adds features with one addFeatures call per chunk, returns how many were added."""
+    added_count = 0
+    for start in range(0, len(features), chunk_size):
+        chunk = features[start:start + chunk_size]
+        added, _ = provider.addFeatures(chunk)
+        if not added:
+            print(f"Error adding {len(chunk)} features: {provider.lastError()}")
+        else:
+            added_count += len(chunk)
+    return added_count
+
+
+def commit_append(journal, layers, key):
+    """Commits an in place append to an existing shapefile, or rolls it back when features are missing.
+
+    The layer is popped from ``layers`` and released before anything is
+    checked: OGR flushes and closes the shapefile, so the counts are read
+    from the files on disk and a rollback cannot be overwritten by a later
+    flush. Callers must not keep other references to the layer.
+    """
+    layer = layers.pop(key)
+    layer.dataProvider().forceReload()
+    del layer
+    expected = journal.feature_count + journal.added
+    actual = journal.record_counts()
+    if actual != (expected, expected):
+        print(f"Append to {journal.shapefile_path} left {actual} .shx/.dbf records instead of {expected}, "
+              f"rolling back")
+        journal.recover()
+        return False
+    journal.commit()
+    print(f"Appended {journal.added} features to {journal.shapefile_path}")
+    return True
+
 
 class VectorLayerProcessor:
-    def __init__(self, work_area_folder):
+    def __init__(self, work_area_folder, chunk_size=default_feature_chunk_size,
+                 read_workers=default_wkt_read_workers):
         print("VectorLayerProcessor initialized", work_area_folder)
         self.work_area_folder = work_area_folder
         self.crs = QgsCoordinateReferenceSystem('EPSG:3395')
         self.roof_layers = {}
-
-    def create_layer(self, map_folder):
+        self.chunk_size = max(int(chunk_size), 1)
+        self.read_workers = int(read_workers)
+        self.pending_features = {}
+        # Existing roofs.shp files get new features appended in place, see AppendJournal.
+        self.journals = {}
+        # Batch ids of the layers created in memory, recorded once they are saved.
+        self.batches = {}
+
+    def create_layer(self, map_folder, batch):
         file_path = os.path.join(self.work_area_folder, map_folder, 'roofs.shp')
+        journal = AppendJournal(file_path)
         if os.path.exists(file_path):
             print(f"Loading existing layer: {file_path}")
+            journal.recover()
+            if journal.is_applied(batch):
+                print(f"The selected roofs are already in {file_path}, skipping")
+                return None, None
             layer = QgsVectorLayer(file_path, 'roof_layer', 'ogr')
             if not layer.isValid():
                 print(f"Failed to load layer: {file_path}")
                 return None, None
             else:
                 provider = layer.dataProvider()
+                journal.begin(provider.featureCount(), batch)
+                self.journals[map_folder] = journal
                 return layer, provider
         else:
             print(f"Creating new in-memory layer for: {map_folder}")
@@ -37,27 +94,30 @@ class VectorLayerProcessor:
             provider = layer.dataProvider()
             provider.addAttributes([QgsField('FID', QVariant.Int)])
             layer.updateFields()
+            self.batches[map_folder] = batch
             return layer, provider
 
-    def add_features_from_wkt_file(self, wkt_file, provider, folder_id):
-        if os.path.exists(wkt_file):
-            try:
-                with open(wkt_file, 'r') as file:
-                    wkt = file.read().strip()
-                    geom = QgsGeometry.fromWkt(wkt)
-                    if not geom.isNull():
-                        feature = QgsFeature()
-                        feature.setGeometry(geom)
-                        feature.setAttributes([folder_id])
-                        provider.addFeature(feature)
-                    else:
-                        print(f"Invalid geometry: {wkt}")
-            except Exception as e:
-                print(f"Error reading {wkt_file}: {e}")
-        else:
-            print(f"File does not exist: {wkt_file}")
+    def add_feature(self, map_folder, geom, folder_id):
+        """Queues a feature; layers get them in chunks of ``chunk_size``."""
+        feature = QgsFeature()
+        feature.setGeometry(geom)
+        feature.setAttributes([folder_id])
+        pending = self.pending_features.setdefault(map_folder, [])
+        pending.append(feature)
+        if len(pending) >= self.chunk_size:
+            self.flush_features(map_folder)
+
+    def flush_features(self, map_folder=None):
+        map_folders = [map_folder] if map_folder is not None else list(self.pending_features)
+        for folder in map_folders:
+            features = self.pending_features.pop(folder, [])
+            if features:
+                added = add_feature_chunks(self.roof_layers[folder].dataProvider(), features, self.chunk_size)
+                if folder in self.journals:
+                    self.journals[folder].added += added
 
     def process_roof_files(self, selection_data):
+        roof_files = []
         for entry in selection_data:
             map_folder = entry["map_folder"]
             image_path = entry.get("image_path")
@@ -65,12 +125,27 @@ class VectorLayerProcessor:
             if image_path:
                 roof_file = os.path.splitext(image_path)[0] + '.roof'
                 print(f"Processing roof file: {roof_file}")
-
-                if map_folder not in self.roof_layers:
-                    self.roof_layers[map_folder], _ = self.create_layer(map_folder)
-
-                layer, provider = self.roof_layers[map_folder], self.roof_layers[map_folder].dataProvider()
-                self.add_features_from_wkt_file(roof_file, provider, folder_id)
+                roof_files.append((roof_file, map_folder, folder_id))
+
+        # Geometries are read before the layers are opened, the batch ids are taken from their WKB.
+        features = {map_folder: [] for _, map_folder, _ in roof_files}
+        with VariantPacks() as packs:
+            geometries = read_wkt_geometries([roof_file for roof_file, _, _ in roof_files], self.read_workers, packs)
+            for (roof_file, map_folder, folder_id), (geom, message) in zip(roof_files, geometries):
+                if geom is None:
+                    print(message)
+                    continue
+                features[map_folder].append((roof_file, geom, folder_id))
+
+        for map_folder, entries in features.items():
+            batch = batch_id([(roof_file, bytes(geom.asWkb())) for roof_file, geom, _ in entries])
+            layer, _ = self.create_layer(map_folder, batch)
+            if layer is None:
+                continue
+            self.roof_layers[map_folder] = layer
+            for _, geom, folder_id in entries:
+                self.add_feature(map_folder, geom, folder_id)
+        self.flush_features()
 
     def save_layer(self, layer, output_directory):
         file_path = os.path.join(self.work_area_folder, output_directory, 'roofs.shp')
@@ -84,8 +159,9 @@ class VectorLayerProcessor:
         )
         if error[0] != QgsVectorFileWriter.NoError:
             print(f"Error saving roof layer: {error}")
-        else:
-            print(f"Roof layer saved successfully at {file_path}")
+            return False
+        print(f"Roof layer saved successfully at {file_path}")
+        return True
 
     def load_selection_file(self):
         selection_file_path = os.path.join(self.work_area_folder, 'selection_results.json')
@@ -119,8 +195,12 @@ class VectorLayerProcessor:
 
         self.process_roof_files(selection_data)
 
-        for map_folder, layer in self.roof_layers.items():
-            self.save_layer(layer, map_folder)
+        for map_folder in list(self.roof_layers):
+            if map_folder in self.journals:
+                commit_append(self.journals.pop(map_folder), self.roof_layers, map_folder)
+            elif self.save_layer(self.roof_layers.pop(map_folder), map_folder):
+                AppendJournal(os.path.join(self.work_area_folder, map_folder, 'roofs.shp')).record(
+                    self.batches.pop(map_folder))
 
         self.delete_selection_file()
 
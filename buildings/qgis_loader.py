@@ -9,8 +9,16 @@ from PyQt5.QtWidgets import QMessageBox
 
 
 class QGISLayerLoader:
-    def __init__(self, root_folder):
+    """Loads the roofs, shades and projes of every map folder and groups them with their image.
+
+    With ``geopackage_path`` (see update_results_geopackage) the layers are
+    read from the work area's GeoPackage, filtered by ``map_folder``,
+    instead of the per map folder shapefiles.
+    """
+
+    def __init__(self, root_folder, geopackage_path=None):
         self.root_folder = root_folder
+        self.geopackage_path = geopackage_path
         self.project = QgsProject.instance()
 
     def find_map_folders(self):
@@ -31,6 +39,23 @@ class QGISLayerLoader:
         QgsProject.instance().addMapLayer(layer, False)
         return layer
 
+    def load_geopackage_layer(self, table, map_name, layer_name):
+        layer = QgsVectorLayer(f"{self.geopackage_path}|layername={table}", layer_name, "ogr")
+        if not layer.isValid():
+            print(f"Layer {layer_name} could not be loaded from {self.geopackage_path}.")
+            return None
+        map_name = map_name.replace("'", "''")
+        layer.setSubsetString(f"\"map_folder\" = '{map_name}'")
+
+        QgsProject.instance().addMapLayer(layer, False)
+        return layer
+
+    def load_result_layer(self, map_folder, table):
+        map_name = os.path.basename(map_folder)
+        if self.geopackage_path and os.path.exists(self.geopackage_path):
+            return self.load_geopackage_layer(table, map_name, f"{map_name}_{table}")
+        return self.load_vector_layer(os.path.join(map_folder, f"{table}.shp"), f"{map_name}_{table}")
+
     def find_existing_raster_layer(self, map_name):
         for layer in self.project.mapLayers().values():
             if isinstance(layer, QgsRasterLayer) and map_name in layer.name():
@@ -68,13 +93,9 @@ class QGISLayerLoader:
         for map_folder in map_folders:
             map_name = os.path.basename(map_folder)
 
-            projes_path = os.path.join(map_folder, "projes.shp")
-            roofs_path = os.path.join(map_folder, "roofs.shp")
-            shades_path = os.path.join(map_folder, "shades.shp")
-
-            projes_layer = self.load_vector_layer(projes_path, f"{map_name}_projes")
-            roofs_layer = self.load_vector_layer(roofs_path, f"{map_name}_roofs")
-            shades_layer = self.load_vector_layer(shades_path, f"{map_name}_shades")
+            projes_layer = self.load_result_layer(map_folder, "projes")
+            roofs_layer = self.load_result_layer(map_folder, "roofs")
+            shades_layer = self.load_result_layer(map_folder, "shades")
 
             raster_layer = self.find_existing_raster_layer(map_name)
 
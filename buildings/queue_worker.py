@@ -0,0 +1,155 @@
+"""Distributes buildings work areas over nodes that share a result folder.
+
+Enqueue work areas once, then start any number of workers on any node that
+mounts the same folder, e.g.::
+
+    python3 -m buildings.queue_worker enqueue --settings settings.json --work-area my_area
+    QT_QPA_PLATFORM=offscreen python3 -m buildings.queue_worker worker --settings settings.json
+    python3 -m buildings.queue_worker status --settings settings.json
+
+The queue lives in ``<result_folder>/.job_queue`` unless ``--queue`` is given.
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+
+from qgis.core import QgsApplication
+
+from .headless_runner import load_work_area
+from .job_queue import JobQueue, Heartbeat, default_worker_id
+from .json_settings import JsonSettings
+from .tiled_pipeline import create_headless_tool
+from .variant_selector import VariantSelector, selection_policies
+from .work_area import WorkArea
+
+default_lease_timeout = 300
+default_heartbeat_interval = 30
+default_poll_interval = 10
+
+
+def queue_folder(args, settings):
+    if args.queue:
+        return args.queue
+    result_folder = settings.value("result_folder")
+    if not result_folder:
+        raise ValueError("Pass --queue or set result_folder in the settings")
+    return os.path.join(result_folder, '.job_queue')
+
+
+def enqueue(args, settings, job_queue):
+    work_area = load_work_area(args)
+    options = {'auto_select': args.auto_select,
+               'decisions': os.path.abspath(args.decisions) if args.decisions else None}
+    job = job_queue.enqueue(work_area.to_dict(), args.priority, options)
+    print(f"Enqueued '{work_area.name}' as job {job['id']}")
+    return 0
+
+
+def status(args, settings, job_queue):
+    print(json.dumps(job_queue.status(), indent=4))
+    return 0
+
+
+def run_job(claim, settings, job_stop, heartbeat_interval):
+    options = claim.job['options']
+    tool = create_headless_tool(WorkArea.from_dict(claim.job['work_area']), settings,
+                                VariantSelector(options.get('auto_select', 'first'), options.get('decisions')),
+                                job_stop)
+    with Heartbeat(claim, heartbeat_interval, on_lost=job_stop.set) as heartbeat:
+        finished = tool.run()
+    return finished, heartbeat.lost
+
+
+def worker(args, settings, job_queue):
+    worker_id = args.worker_id or default_worker_id()
+    stop_requested = threading.Event()
+    job_stop = threading.Event()
+
+    def request_stop(signum, frame):
+        print(f"{worker_id}: stopping, the current job goes back to the queue")
+        stop_requested.set()
+        job_stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+    try:
+        while not stop_requested.is_set():
+            claim = job_queue.claim_next(worker_id)
+            if claim is None:
+                if args.exit_when_empty:
+                    break
+                stop_requested.wait(args.poll_interval)
+                continue
+
+            name = claim.job['work_area']['name']
+            print(f"{worker_id}: running job {claim.job['id']} ('{name}'), attempt {claim.job['attempts']}")
+            started = time.time()
+            job_stop.clear()
+            try:
+                finished, lost = run_job(claim, settings, job_stop, args.heartbeat_interval)
+            except Exception as e:
+                traceback.print_exc()
+                job_queue.fail(claim, str(e))
+                continue
+
+            if lost:
+                print(f"{worker_id}: job {claim.job['id']} was taken over, dropping its result")
+            elif finished:
+                job_queue.complete(claim, {'seconds': round(time.time() - started, 1)})
+                print(f"{worker_id}: job {claim.job['id']} done")
+            else:
+                # Interrupted: hand the job back so another worker can pick it up.
+                job_queue.release(claim)
+    finally:
+        qgs.exitQgis()
+    return 0
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Shared-folder job queue for the buildings pipeline.")
+    parser.add_argument('--settings', help="Settings JSON file (defaults to the plugin settings.json)")
+    parser.add_argument('--queue', help="Queue folder (defaults to <result_folder>/.job_queue)")
+    parser.add_argument('--lease-timeout', type=float, default=default_lease_timeout,
+                        help="Seconds without heartbeat after which a claim is considered dead")
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    enqueue_parser = subparsers.add_parser('enqueue', help="Add a work area to the queue")
+    source = enqueue_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--work-area', help="Name or id of a work area saved in work_areas.json")
+    source.add_argument('--spec', help="Standalone JSON file describing the work area")
+    enqueue_parser.add_argument('--work-areas-file', help="work_areas.json to look the work area up in")
+    enqueue_parser.add_argument('--priority', type=int, default=0, help="Higher priorities run first")
+    enqueue_parser.add_argument('--decisions', help="JSON file with picker decisions, on the shared folder")
+    enqueue_parser.add_argument('--auto-select', choices=selection_policies, default='first',
+                                help="Policy for subfolders without a decision")
+    enqueue_parser.set_defaults(handler=enqueue)
+
+    worker_parser = subparsers.add_parser('worker', help="Run queued jobs until stopped")
+    worker_parser.add_argument('--worker-id', help="Name of this worker (defaults to host-pid)")
+    worker_parser.add_argument('--heartbeat-interval', type=float, default=default_heartbeat_interval)
+    worker_parser.add_argument('--poll-interval', type=float, default=default_poll_interval)
+    worker_parser.add_argument('--exit-when-empty', action='store_true', help="Exit when no job is pending")
+    worker_parser.set_defaults(handler=worker)
+
+    status_parser = subparsers.add_parser('status', help="Print pending, running, done and failed jobs")
+    status_parser.set_defaults(handler=status)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    settings = JsonSettings(os.path.abspath(args.settings) if args.settings else None)
+    job_queue = JobQueue(queue_folder(args, settings), lease_timeout=args.lease_timeout)
+    return args.handler(args, settings, job_queue)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
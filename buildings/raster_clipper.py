@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+import uuid
+
+from osgeo import gdal
+from qgis.core import QgsVectorLayer
+
+default_raster_clip_margin = 200
+raster_clip_formats = {'vrt': ('VRT', '.vrt'), 'gtiff': ('GTiff', '.tif')}
+
+
+class RasterClipper:
+    """Cuts input rasters down to the work region before the tools read them.
+
+    The window is the work region's bounding box grown by ``margin`` map
+    units. ``vrt`` writes a GDAL VRT that only references the window of the
+    source image, ``gtiff`` copies the window into a tiled GeoTIFF for tools
+    that cannot read VRT. Clipped files are shared between work areas in
+    ``cache_folder``: the name is derived from the image path, size and
+    modification time and the window, so a changed image or region gets a
+    new file and an unchanged pair is reused.
+    """
+
+    def __init__(self, work_region_path, cache_folder, margin=default_raster_clip_margin, output_format='vrt'):
+        self.cache_folder = cache_folder
+        self.margin = margin
+        self.driver, self.extension = raster_clip_formats[output_format]
+        self.window, self.crs_wkt = self.region_window(work_region_path)
+
+    def region_window(self, work_region_path):
+        layer = QgsVectorLayer(work_region_path, 'work_region', 'ogr')
+        if not layer.isValid():
+            raise ValueError(f"Cannot read work region {work_region_path}")
+        extent = layer.extent()
+        extent.grow(self.margin)
+        # GDAL's projWin is upper left x, upper left y, lower right x, lower right y.
+        window = [extent.xMinimum(), extent.yMaximum(), extent.xMaximum(), extent.yMinimum()]
+        return [round(value, 3) for value in window], layer.crs().toWkt()
+
+    def output_path(self, image_path):
+        stat = os.stat(image_path)
+        key = hashlib.sha256(json.dumps([os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns,
+                                         self.window, self.crs_wkt, self.driver]).encode()).hexdigest()
+        image_name = os.path.splitext(os.path.basename(image_path))[0]
+        return os.path.join(self.cache_folder, f"{image_name}_{key[:16]}{self.extension}")
+
+    def clip(self, image_path, output_path):
+        if os.path.exists(output_path):
+            return {'clip': 'reused'}
+        os.makedirs(self.cache_folder, exist_ok=True)
+        temp_path = f"{os.path.splitext(output_path)[0]}.{uuid.uuid4().hex}.tmp{self.extension}"
+        options = {'format': self.driver, 'projWin': self.window, 'projWinSRS': self.crs_wkt}
+        if self.driver == 'GTiff':
+            options['creationOptions'] = ['TILED=YES', 'BIGTIFF=IF_SAFER']
+        gdal.UseExceptions()
+        try:
+            dataset = gdal.Translate(temp_path, os.path.abspath(image_path), **options)
+        except RuntimeError as e:
+            raise RuntimeError(f"Cannot clip {image_path} to the work region: {e}")
+        size = [dataset.RasterXSize, dataset.RasterYSize]
+        dataset = None
+        os.replace(temp_path, output_path)
+        print(f"Clipped {image_path} to {size[0]}x{size[1]} pixels: {output_path}")
+        return {'clip': 'created', 'size': size}
@@ -0,0 +1,116 @@
+import os
+import threading
+
+clock_ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def read_stat(pid):
+    with open(f'/proc/{pid}/stat', 'r') as f:
+        data = f.read()
+    # The command name may contain spaces, the fields after it may not.
+    fields = data[data.rindex(')') + 2:].split()
+    return {
+        'ppid': int(fields[1]),
+        'cpu_ticks': int(fields[11]) + int(fields[12]),
+        'start_time': int(fields[19]),
+        'rss_pages': int(fields[21]),
+    }
+
+
+def read_io(pid):
+    counters = {}
+    try:
+        with open(f'/proc/{pid}/io', 'r') as f:
+            for line in f:
+                key, value = line.split(':')
+                counters[key] = int(value)
+    except (OSError, ValueError):
+        pass
+    return counters
+
+
+class ResourceSampler:
+    """Polls /proc for a process and all of its descendants.
+
+    Tracks the peak resident set size of the whole tree, and the CPU time and
+    bytes read and written summed over every process seen while sampling.
+    ``read_bytes``/``write_bytes`` count storage I/O, ``read_chars``/``write_chars``
+    everything passed through read() and write(), page cache included.
+    """
+
+    def __init__(self, pid, interval=1.0):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self.samples = 0
+        self.processes = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.poll, name=f'resource-sampler-{pid}', daemon=True)
+
+    def process_tree(self):
+        children = {}
+        stats = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                stat = read_stat(int(entry))
+            except (OSError, ValueError, IndexError):
+                continue
+            stats[int(entry)] = stat
+            children.setdefault(stat['ppid'], []).append(int(entry))
+
+        tree = {}
+        pending = [self.pid]
+        while pending:
+            pid = pending.pop()
+            if pid in stats:
+                tree[pid] = stats[pid]
+                pending.extend(children.get(pid, []))
+        return tree
+
+    def sample(self):
+        tree = self.process_tree()
+        if not tree:
+            return
+        self.samples += 1
+        self.peak_rss = max(self.peak_rss, sum(stat['rss_pages'] for stat in tree.values()) * page_size)
+        for pid, stat in tree.items():
+            counters = read_io(pid)
+            self.processes[(pid, stat['start_time'])] = {
+                'cpu_ticks': stat['cpu_ticks'],
+                'read_bytes': counters.get('read_bytes', 0),
+                'write_bytes': counters.get('write_bytes', 0),
+                'read_chars': counters.get('rchar', 0),
+                'write_chars': counters.get('wchar', 0),
+            }
+
+    def poll(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+
+    def start(self):
+        if os.path.isdir('/proc'):
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        return self.summary()
+
+    def summary(self):
+        processes = self.processes.values()
+        return {
+            'peak_rss_bytes': self.peak_rss,
+            'cpu_seconds': round(sum(process['cpu_ticks'] for process in processes) / clock_ticks, 2),
+            'read_bytes': sum(process['read_bytes'] for process in processes),
+            'write_bytes': sum(process['write_bytes'] for process in processes),
+            'read_chars': sum(process['read_chars'] for process in processes),
+            'write_chars': sum(process['write_chars'] for process in processes),
+            'processes': len(self.processes),
+            'samples': self.samples,
+        }
@@ -0,0 +1,201 @@
+import json
+import os
+import uuid
+
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import (
+    QgsVectorLayer,
+    QgsFeature,
+    QgsField,
+    QgsFields,
+    QgsVectorFileWriter,
+    QgsCoordinateTransformContext,
+    QgsWkbTypes
+)
+
+from .append_journal import AppendJournal
+from .merge_vectors import default_feature_chunk_size, add_feature_chunks
+from .stage_manifest import path_signature
+
+results_geopackage_name = 'results.gpkg'
+result_layers = ['roofs', 'shades', 'projes']
+# What each map folder's rows in the GeoPackage were last synced from, see update_results_geopackage.
+sync_state_suffix = '.sync.json'
+
+
+def results_geopackage_path(root_folder):
+    return os.path.join(root_folder, results_geopackage_name)
+
+
+def result_map_folders(root_folder):
+    return sorted(folder for folder in os.listdir(root_folder)
+                  if any(os.path.exists(os.path.join(root_folder, folder, f'{layer_name}.shp'))
+                         for layer_name in result_layers))
+
+
+def map_folder_filter(map_folder):
+    map_folder = map_folder.replace("'", "''")
+    return f"\"map_folder\" = '{map_folder}'"
+
+
+def result_features(source, fields, map_folder, skip=0):
+    """Features of ``source`` after the first ``skip``, with the ``fields`` of a GeoPackage table."""
+    features = []
+    for index, source_feature in enumerate(source.getFeatures()):
+        if index < skip:
+            continue
+        feature = QgsFeature(fields)
+        geometry = source_feature.geometry()
+        geometry.convertToMultiType()
+        feature.setGeometry(geometry)
+        feature.setAttribute('map_folder', map_folder)
+        for field in source.fields():
+            if fields.indexOf(field.name()) >= 0:
+                feature.setAttribute(field.name(), source_feature.attribute(field.name()))
+        features.append(feature)
+    return features
+
+
+def create_table(geopackage_path, table, source, map_folder, chunk_size):
+    """Creates ``table`` with the fields of ``source`` plus ``map_folder`` and the features of ``source``."""
+    fields = QgsFields()
+    fields.append(QgsField('map_folder', QVariant.String, '', 254))
+    for field in source.fields():
+        fields.append(field)
+    layer = QgsVectorLayer(f'{QgsWkbTypes.displayString(QgsWkbTypes.multiType(source.wkbType()))}'
+                           f'?crs={source.crs().authid()}', table, 'memory')
+    layer.dataProvider().addAttributes(fields.toList())
+    layer.updateFields()
+    add_feature_chunks(layer.dataProvider(), result_features(source, layer.fields(), map_folder), chunk_size)
+
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = "GPKG"
+    options.layerName = table
+    options.layerOptions = ['SPATIAL_INDEX=YES']
+    if os.path.exists(geopackage_path):
+        options.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteLayer
+    error = QgsVectorFileWriter.writeAsVectorFormatV3(layer, geopackage_path, QgsCoordinateTransformContext(), options)
+    if error[0] != QgsVectorFileWriter.NoError:
+        raise RuntimeError(f"Error saving {table} to {geopackage_path}: {error[1]}")
+
+
+def open_table(geopackage_path, table):
+    if not os.path.exists(geopackage_path):
+        return None
+    layer = QgsVectorLayer(f"{geopackage_path}|layername={table}", table, 'ogr')
+    return layer if layer.isValid() else None
+
+
+def count_rows(geopackage_path, table, map_folder):
+    layer = QgsVectorLayer(f"{geopackage_path}|layername={table}", table, 'ogr')
+    layer.setSubsetString(map_folder_filter(map_folder))
+    return layer.featureCount()
+
+
+def delete_rows(table_layer, map_folder):
+    table_layer.setSubsetString(map_folder_filter(map_folder))
+    ids = [feature.id() for feature in table_layer.getFeatures()]
+    table_layer.setSubsetString('')
+    if ids and not table_layer.dataProvider().deleteFeatures(ids):
+        raise RuntimeError(f"Error removing the {map_folder} rows of {table_layer.name()}")
+    return len(ids)
+
+
+def load_sync_state(geopackage_path):
+    state_path = geopackage_path + sync_state_suffix
+    if not os.path.exists(geopackage_path) or not os.path.exists(state_path):
+        return {}
+    with open(state_path, 'r') as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError:
+            print(f"Error loading GeoPackage sync state: {state_path}")
+            return {}
+
+
+def save_sync_state(geopackage_path, state):
+    state_path = geopackage_path + sync_state_suffix
+    temp_path = f"{state_path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(state, f, indent=4)
+    os.replace(temp_path, state_path)
+
+
+def sync_map_folder(geopackage_path, table, shapefile_path, map_folder, previous, chunk_size):
+    """Brings the ``map_folder`` rows of ``table`` up to date with its shapefile, returns the new sync state and action.
+
+    When the shapefile only got features appended in place since the last
+    sync (its AppendJournal has the generation synced then, so its first
+    records are the ones synced, its batches extend the batches synced then
+    and the table still has the rows synced then), only the new features
+    are added. Otherwise the map folder's rows are replaced.
+    """
+    journal = AppendJournal(shapefile_path).load()
+    if journal['pending'] is not None:
+        print(f"Skipping {shapefile_path}, an append to it was interrupted")
+        return previous, 'skipped'
+    source = QgsVectorLayer(shapefile_path, table, 'ogr')
+    if not source.isValid():
+        print(f"Skipping unreadable result layer {shapefile_path}")
+        return previous, 'skipped'
+    state = {'signature': path_signature(shapefile_path), 'generation': journal.get('generation'),
+             'batches': journal['batches'], 'count': source.featureCount()}
+
+    table_layer = open_table(geopackage_path, table)
+    if table_layer is None:
+        create_table(geopackage_path, table, source, map_folder, chunk_size)
+        return state, 'replaced'
+
+    synced_batches = previous['batches'] if previous else []
+    if synced_batches and state['generation'] is not None and \
+            previous.get('generation') == state['generation'] and \
+            journal['batches'][:len(synced_batches)] == synced_batches and \
+            previous['count'] <= state['count'] and \
+            count_rows(geopackage_path, table, map_folder) == previous['count']:
+        features = result_features(source, table_layer.fields(), map_folder, skip=previous['count'])
+        action = 'appended'
+    else:
+        delete_rows(table_layer, map_folder)
+        features = result_features(source, table_layer.fields(), map_folder)
+        action = 'replaced'
+    added = add_feature_chunks(table_layer.dataProvider(), features, chunk_size)
+    if added != len(features):
+        raise RuntimeError(f"Only {added} of {len(features)} features of {shapefile_path} were written "
+                           f"to {geopackage_path}")
+    return state, action
+
+
+def update_results_geopackage(root_folder, chunk_size=default_feature_chunk_size):
+    """Keeps ``<root_folder>/results.gpkg`` in step with the roofs, shades and projes of every map folder.
+
+    One table per layer type, each with an R-tree spatial index and a
+    ``map_folder`` column telling which image a feature belongs to. Only
+    the map folders whose shapefiles changed since the last run are
+    written, see sync_map_folder, and the rows of removed map folders are
+    deleted. Each write is a GeoPackage transaction, so readers never see
+    half-written rows.
+    """
+    output_path = results_geopackage_path(root_folder)
+    state = load_sync_state(output_path)
+    map_folders = result_map_folders(root_folder)
+    actions = {}
+    for table in result_layers:
+        table_state = state.setdefault(table, {})
+        for map_folder in sorted(set(map_folders) | set(table_state)):
+            shapefile_path = os.path.join(root_folder, map_folder, f'{table}.shp')
+            previous = table_state.get(map_folder)
+            if not os.path.exists(shapefile_path):
+                table_layer = open_table(output_path, table)
+                if table_layer is not None:
+                    delete_rows(table_layer, map_folder)
+                table_state.pop(map_folder, None)
+                action = 'removed'
+            elif previous and previous['signature'] == path_signature(shapefile_path):
+                action = 'unchanged'
+            else:
+                table_state[map_folder], action = sync_map_folder(output_path, table, shapefile_path, map_folder,
+                                                                  previous, chunk_size)
+            actions[action] = actions.get(action, 0) + 1
+        save_sync_state(output_path, state)
+    print(f"Results of {len(map_folders)} map folders synced to {output_path}: {actions}")
+    return {'map_folders': actions}
@@ -1,25 +1,55 @@
 import os
-from os import popen
+from functools import partial
 
 from .image_picker_dialog import ImagePicker
 from .json_settings import JsonSettings
-from .merge_vectors import VectorLayerProcessor
+from .merge_vectors import VectorLayerProcessor, default_feature_chunk_size
 from .multi_image_picker import MultiImagePicker
 from .shades_and_projections_layer_processor import ShadesAndProjectionsLayerProcessor
 from .qgis_loader import QGISLayerLoader
+from .raster_clipper import RasterClipper, default_raster_clip_margin
+from .results_geopackage import update_results_geopackage, results_geopackage_path
+from .pipeline_task import PipelineTask
+from .process_runner import ProcessRunner, CommandFailed
+from .append_journal import journal_files
+from .artifact_cache import ArtifactCache
+from .resource_sampler import ResourceSampler
+from .stage_manifest import StageManifest, related_files
+from .stage_scheduler import Stage, StageScheduler
+from .trace_recorder import TraceRecorder
+from .variant_pack import pack_variant_geometries
+from .wkb_pack import pack_path
+from .vector_clipper import VectorClipper
+from .vector_store import settings_vector_store
+from .wkt_reader import default_wkt_read_workers
 import shutil
 
+from PyQt5.QtWidgets import QMessageBox
+from qgis.core import QgsApplication
+
 map_for_mode = {
     'Manual': '-n external',
     'Automatic': '-m auto',
     'Semiautomatic': '-m on_demand -n external',
 }
 
+
+default_cache_max_size_gb = 20
+default_resource_sample_interval = 1.0
+
+
+def default_max_parallel_jobs():
+    return min(4, os.cpu_count() or 1)
+
+
+# Keeps tools alive while their background tasks are queued or running.
+running_tools = []
+
 class ConsoleCommandTool:
-    def __init__(self, work_area):
+    def __init__(self, work_area, settings=None):
         self.work_area = work_area
-        self.settings = JsonSettings()
-        pass
+        self.settings = settings or JsonSettings()
+        self.task = None
 
     def remove_empty_strings(self, arr):
         return [element for element in arr if element != ""]
@@ -29,110 +59,375 @@ class ConsoleCommandTool:
         file_name, _ = os.path.splitext(file_name_with_ext)
         return file_name
 
-    def remove_related_files_and_variants(self, result_folder):
-        file_types = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
-        target_files = ['roofs', 'shades', 'projes']
-
-        for foldername, subfolders, filenames in os.walk(result_folder):
-            for target in target_files:
-                for file_type in file_types:
-                    file_path = os.path.join(foldername, target + file_type)
-                    if os.path.exists(file_path):
-                        try:
-                            os.remove(file_path)
-                            print(f"Removed: {file_path}")
-                        except Exception as e:
-                            print(f"Error removing {file_path}: {e}")
-
-            # Remove 'variants' folder if it exists
-            if 'variants' in subfolders:
-                variants_folder_path = os.path.join(foldername, 'variants')
+    def remove_stage_artifacts(self, paths):
+        for path in paths:
+            if os.path.isdir(path):
                 try:
-                    shutil.rmtree(variants_folder_path)
-                    print(f"Removed folder and its contents: {variants_folder_path}")
+                    shutil.rmtree(path)
+                    print(f"Removed folder and its contents: {path}")
                 except Exception as e:
-                    print(f"Error removing folder {variants_folder_path}: {e}")
-                subfolders.remove('variants')  # Prevent further recursion into 'variants'
+                    print(f"Error removing folder {path}: {e}")
+                continue
+            for file_path in related_files(path) + journal_files(path):
+                if os.path.exists(file_path):
+                    try:
+                        os.remove(file_path)
+                        print(f"Removed: {file_path}")
+                    except Exception as e:
+                        print(f"Error removing {file_path}: {e}")
 
-    def execute(self, iface):
-        print("Executing Console Command Tool")
-        raster_inliers_extractor = self.settings.value("raster_inliers_extractor")
-        objects_bounds_finder = self.settings.value("objects_bounds_finder")
-        roof_locator = self.settings.value("roof_locator")
-        multiview_building_reconstructor = self.settings.value("multiview_building_reconstructor")
-        result_folder = os.path.join(self.settings.value("result_folder"), self.work_area.name) + "/"
-        self.remove_related_files_and_variants(result_folder)
+    def run_stage_command(self, command, clean=None):
+        self.remove_stage_artifacts(clean or [])
+        result = self.run_command(command)
+        return {'resources': result.resources}
+
+    def run_variant_stage_command(self, command, clean, variant_folders):
+        """Runs a stage producing variants and packs their WKT files, see pack_variant_geometries."""
+        details = self.run_stage_command(command, clean)
+        if self.settings.value("pack_variant_geometries", True):
+            with self.scheduler.span("pack_variant_geometries", 'postprocess'):
+                for variants_folder, subfolder in variant_folders:
+                    if os.path.isdir(os.path.join(variants_folder, subfolder)):
+                        pack_variant_geometries(variants_folder, subfolder, self.wkt_read_workers())
+        return details
+
+    def artifact_cache(self):
+        max_size_gb = float(self.settings.value("cache_max_size_gb", default_cache_max_size_gb))
+        if max_size_gb <= 0:
+            return None
+        cache_folder = self.settings.value("cache_folder") or os.path.join(self.settings.value("result_folder"),
+                                                                            ".artifact_cache")
+        return ArtifactCache(cache_folder, int(max_size_gb * 1024 ** 3))
+
+    def run_cached_stage_command(self, command, tool, inputs, outputs):
+        if self.cache is None:
+            return self.run_stage_command(command)
+
+        # Work area folders differ between work areas, so they are left out of the key.
+        with self.scheduler.span("ArtifactCache.fetch", 'cache') as span_args:
+            key = self.cache.key(tool, command.replace(self.root_folder, "<work_area>"), inputs)
+            span_args['hit'] = self.cache.fetch(key, outputs)
+        if span_args['hit']:
+            return {'cache': 'hit'}
+        # Outputs may be hardlinks into the cache and must not be rewritten in place.
+        self.remove_stage_artifacts(outputs)
+        result = self.run_command(command)
+        with self.scheduler.span("ArtifactCache.store", 'cache'):
+            self.cache.store(key, outputs)
+        return {'cache': 'miss', 'resources': result.resources}
 
-        map_path = self.work_area.image_path[0]
-        vector_path = self.work_area.vectors
+    def raster_clipper(self):
+        if not self.settings.value("clip_rasters", True) or not self.work_area.work_area or \
+                not os.path.exists(self.work_area.work_area):
+            return None
+        cache_folder = self.settings.value("clipped_rasters_folder") or \
+            os.path.join(self.settings.value("result_folder"), ".clipped_rasters")
+        return RasterClipper(self.work_area.work_area, cache_folder,
+                             float(self.settings.value("raster_clip_margin", default_raster_clip_margin)),
+                             self.settings.value("raster_clip_format", "vrt"))
+
+    def resolve_reference_vector(self):
+        """Source of the OSM vector and the indexed GeoPackage copy the pipeline reads."""
+        store = settings_vector_store(self.settings)
+        if store is None or not self.work_area.vectors:
+            return self.work_area.vectors, self.work_area.vectors
+        return store.resolve(self.work_area.vectors)
+
+    def ingest_reference_vector(self):
+        return {'store': settings_vector_store(self.settings).ingest(self.vector_source)}
+
+    def clipped_reference_vector(self):
+        if not self.settings.value("clip_reference_vector", True) or not self.work_area.vectors or \
+                not self.work_area.work_area or not os.path.exists(self.work_area.work_area):
+            return None
+        return os.path.join(self.root_folder, "reference_clip.shp")
+
+    def clip_reference_vector(self, output_path):
+        margin = float(self.settings.value("raster_clip_margin", default_raster_clip_margin))
+        return VectorClipper(self.work_area.work_area, margin).clip(self.indexed_vector, output_path)
+
+    def tool_image(self, map_path):
+        """The image the tools read for map_path, clipped to the work region when enabled."""
+        return self.tool_images.get(map_path, map_path)
+
+    def image_result_folder(self, map_path):
+        image_name_without_ext = self.split_path_and_filename(map_path)
+        return os.path.join(self.settings.value("result_folder"), self.work_area.name,
+                            image_name_without_ext) + "/"
+
+    def run_command(self, command):
+        print(command)
+        task = self.task
+        samplers = []
+        runner = ProcessRunner(on_line=task.log_output if task else None,
+                               on_progress=task.stage_progress if task else None,
+                               should_cancel=self.should_cancel,
+                               on_start=lambda process: samplers.append(self.start_resource_sampler(process)))
+        resources = {}
+        try:
+            with self.scheduler.span(os.path.basename(command.split()[0]), 'command', command=command) as span_args:
+                try:
+                    result = runner.run(command, check=True)
+                    span_args['returncode'] = result.returncode
+                finally:
+                    for sampler in samplers:
+                        if sampler is not None:
+                            resources.update(sampler.stop())
+                    span_args['resources'] = resources
+        except CommandFailed as e:
+            e.details['resources'] = resources
+            raise
+        result.resources = resources
+        print(f"Resources used by {os.path.basename(command.split()[0])}: {resources}")
+        return result
+
+    def start_resource_sampler(self, process):
+        interval = float(self.settings.value("resource_sample_interval", default_resource_sample_interval))
+        if interval <= 0:
+            return None
+        return ResourceSampler(process.pid, interval).start()
+
+    def should_cancel(self):
+        if self.task is not None and self.task.isCanceled():
+            return True
+        return self.scheduler.abort.is_set()
+
+    def prepare(self):
+        self.root_folder = os.path.join(self.settings.value("result_folder"), self.work_area.name)
+        self.all_images = self.remove_empty_strings(self.work_area.image_path)
+        self.mode = map_for_mode[self.work_area.work_mode]
+        self.clipper = self.raster_clipper()
+        self.tool_images = {map_path: self.clipper.output_path(map_path) for map_path in self.all_images} \
+            if self.clipper else {}
+        self.vector_source, self.indexed_vector = self.resolve_reference_vector()
+        self.reference_vector = self.clipped_reference_vector() or self.indexed_vector
+        print("all_images", self.all_images)
+
+    def inliers_command(self):
+        raster_inliers_extractor = self.settings.value("raster_inliers_extractor")
+        map_path = self.tool_image(self.work_area.image_path[0])
+        vector_path = self.reference_vector
         work_region_file_path = self.work_area.work_area
+        return f"{raster_inliers_extractor} -r {map_path} -v {vector_path} -i {work_region_file_path} -o {self.root_folder + '/'} -f"
+
+    def bounds_command(self, index, map_path):
+        objects_bounds_finder = self.settings.value("objects_bounds_finder")
+        work_vectors_file_path = self.work_area.vector_path[index]
+        image_result_folder = self.image_result_folder(map_path)
+        return f"{objects_bounds_finder} -v {self.root_folder + '/inliers.shp'} -r {self.tool_image(map_path)} -i {work_vectors_file_path} -l 80 -m 100 -o {image_result_folder} -f"
 
-        first_command = f"{raster_inliers_extractor} -r {map_path} -v {vector_path} -i {work_region_file_path} -o {result_folder} -f"
-        first_command_result = popen(first_command)
-        first_command_result_str = first_command_result.read()
-        first_command_result.close()
-        print(first_command_result_str)
-
-        print(first_command)
-        print("-------------------")
-        all_images = self.remove_empty_strings(self.work_area.image_path)
-        print("all_images", all_images)
-        for index, map_path in enumerate(all_images):
-            work_vectors_file_path = self.work_area.vector_path[index]
-
-            image_name_without_ext = self.split_path_and_filename(map_path)
-            image_result_folder = os.path.join(self.settings.value("result_folder"), self.work_area.name,
-                                               image_name_without_ext) + "/"
-            second_command = f"{objects_bounds_finder} -v {os.path.join(self.settings.value('result_folder'), self.work_area.name) + '/inliers.shp'} -r {map_path} -i {work_vectors_file_path} -l 80 -m 100 -o {image_result_folder} -f"
-            second_command_result = popen(second_command)
-            second_command_result_str = second_command_result.read()
-            print(second_command_result_str)
-            second_command_result.close()
-            print(second_command)
-
-        print("-------------------")
+    def roofs_command(self, map_path):
+        roof_locator = self.settings.value("roof_locator")
+        image_result_folder = self.image_result_folder(map_path)
         use_asm = "--use_sam" if self.work_area.use_segment_anything else ''
-        mode = map_for_mode[self.work_area.work_mode]
-        for index, map_path in enumerate(all_images):
-            image_name_without_ext = self.split_path_and_filename(map_path)
-            image_result_folder = os.path.join(self.settings.value("result_folder"), self.work_area.name,
-                                               image_name_without_ext) + "/"
-
-            third_command = f"{roof_locator} -r {map_path} -v {image_result_folder + 'bounds.shp'} -o {image_result_folder} {use_asm} {mode} -f"
-            third_command_result = popen(third_command)
-            third_command_result_str = third_command_result.read()
-            print(third_command_result_str)
-            third_command_result.close()
-            print(third_command)
-
-        ImagePicker(iface, result_folder, self.work_area.id)
-        VectorLayerProcessor(
-            work_area_folder=os.path.join(self.settings.value("result_folder"), self.work_area.name)).run()
-
-        print("-------------------")
+        return f"{roof_locator} -r {self.tool_image(map_path)} -v {image_result_folder + 'bounds.shp'} -o {image_result_folder} {use_asm} {self.mode} -f"
+
+    def multiview_command(self):
+        multiview_building_reconstructor = self.settings.value("multiview_building_reconstructor")
         roofs = []
         bounds = []
         output = []
-        for index, map_path in enumerate(all_images):
-            image_name_without_ext = self.split_path_and_filename(map_path)
-            image_result_folder = os.path.join(self.settings.value("result_folder"), self.work_area.name,
-                                               image_name_without_ext) + "/"
+        for map_path in self.all_images:
+            image_result_folder = self.image_result_folder(map_path)
             output.append(image_result_folder)
             roofs.append(image_result_folder + "roofs.shp")
             bounds.append(image_result_folder + "bounds.shp")
 
         use_predict = "--predict" if self.work_area.predict else ''
-        last_command = f"{multiview_building_reconstructor} -v {','.join(roofs)} -b {','.join(bounds)} -r {','.join(all_images)} -o {','.join(output)} {use_predict} {mode} -f"
-        last_command_result = popen(last_command)
-        last_command_result_str = last_command_result.read()
-        print(last_command_result_str)
-        last_command_result.close()
-        print(last_command)
-
-        root_folder = os.path.join(self.settings.value("result_folder"), self.work_area.name)
-        MultiImagePicker(iface=iface,
-                         root_folder=root_folder,
-                         work_area_id=self.work_area.id)
-        ShadesAndProjectionsLayerProcessor(
-            work_area_folder=root_folder).run()
-        QGISLayerLoader(root_folder=root_folder).run()
+        return f"{multiview_building_reconstructor} -v {','.join(roofs)} -b {','.join(bounds)} -r {','.join([self.tool_image(map_path) for map_path in self.all_images])} -o {','.join(output)} {use_predict} {self.mode} -f"
+
+    def build_stage_graph(self):
+        scheduler = StageScheduler(self.max_parallel_jobs(), StageManifest(self.root_folder), self.trace)
+        self.cache = self.artifact_cache()
+        for map_path, clipped_path in self.tool_images.items():
+            scheduler.add_stage(Stage(
+                f"clip[{os.path.basename(map_path)}]",
+                partial(self.clipper.clip, map_path, clipped_path),
+                inputs=[map_path, self.work_area.work_area],
+                outputs=[clipped_path]))
+
+        # Without the original file (queue workers on other nodes only see the store) the copy is used as is.
+        if self.indexed_vector != self.vector_source and os.path.exists(self.vector_source):
+            scheduler.add_stage(Stage(
+                "reference_ingest", self.ingest_reference_vector,
+                inputs=[self.vector_source],
+                outputs=[self.indexed_vector]))
+        if self.reference_vector != self.indexed_vector:
+            scheduler.add_stage(Stage(
+                "reference_clip", partial(self.clip_reference_vector, self.reference_vector),
+                inputs=[self.indexed_vector, self.work_area.work_area],
+                outputs=[self.reference_vector]))
+
+        inliers_path = os.path.join(self.root_folder, "inliers.shp")
+        inliers_command = self.inliers_command()
+        inliers_tool = self.settings.value("raster_inliers_extractor")
+        inliers_inputs = [self.tool_image(self.work_area.image_path[0]), self.reference_vector, self.work_area.work_area]
+        scheduler.add_stage(Stage(
+            "inliers",
+            partial(self.run_cached_stage_command, inliers_command, inliers_tool, inliers_inputs, [inliers_path]),
+            inputs=inliers_inputs,
+            outputs=[inliers_path],
+            command=inliers_command, tool=inliers_tool))
+
+        roofs = []
+        bounds = []
+        roof_variants = []
+        structure_variants = []
+        # Containers the variant stages pack their WKT files into, see pack_variant_geometries.
+        roof_packs = []
+        structure_packs = []
+        shades_and_projes = []
+        for index, map_path in enumerate(self.all_images):
+            image_result_folder = self.image_result_folder(map_path)
+            image_name = os.path.basename(map_path)
+            variants_folder = os.path.join(image_result_folder, "variants")
+            bounds.append(image_result_folder + "bounds.shp")
+            roofs.append(image_result_folder + "roofs.shp")
+            roof_variants.append(os.path.join(variants_folder, "roofs"))
+            structure_variants.append(os.path.join(variants_folder, "structures"))
+            roof_packs.append(pack_path(variants_folder, "roofs"))
+            structure_packs.append(pack_path(variants_folder, "structures"))
+            shades = image_result_folder + "shades.shp"
+            projes = image_result_folder + "projes.shp"
+            shades_and_projes += [shades, projes]
+
+            bounds_command = self.bounds_command(index, map_path)
+            bounds_tool = self.settings.value("objects_bounds_finder")
+            bounds_inputs = [inliers_path, self.tool_image(map_path), self.work_area.vector_path[index]]
+            scheduler.add_stage(Stage(
+                f"bounds[{image_name}]",
+                partial(self.run_cached_stage_command, bounds_command, bounds_tool, bounds_inputs, [bounds[-1]]),
+                inputs=bounds_inputs,
+                outputs=[bounds[-1]],
+                command=bounds_command, tool=bounds_tool))
+            roofs_command = self.roofs_command(map_path)
+            scheduler.add_stage(Stage(
+                f"roofs[{image_name}]",
+                partial(self.run_variant_stage_command, roofs_command, [roofs[-1], shades, projes, variants_folder],
+                        [(variants_folder, "roofs")]),
+                inputs=[bounds[-1], self.tool_image(map_path)],
+                outputs=[roof_variants[-1], roof_packs[-1]],
+                command=roofs_command, tool=self.settings.value("roof_locator")))
+
+        scheduler.add_stage(Stage("picker", self.pick_roofs, inputs=roof_variants + roof_packs, outputs=roofs,
+                                  main_thread=True))
+        multiview_command = self.multiview_command()
+        scheduler.add_stage(Stage(
+            "multiview", partial(self.run_variant_stage_command, multiview_command,
+                                 shades_and_projes + structure_variants + structure_packs,
+                                 [(os.path.dirname(folder), "structures") for folder in structure_variants]),
+            inputs=roofs + bounds + [self.tool_image(map_path) for map_path in self.all_images],
+            outputs=structure_variants + structure_packs,
+            command=multiview_command, tool=self.settings.value("multiview_building_reconstructor")))
+        scheduler.add_stage(Stage("structure_picker", self.pick_structures, inputs=structure_variants + structure_packs,
+                                  outputs=shades_and_projes, main_thread=True))
+        layers_inputs = roofs + shades_and_projes
+        geopackage_path = self.results_geopackage()
+        if geopackage_path:
+            scheduler.add_stage(Stage(
+                "results_geopackage",
+                partial(update_results_geopackage, self.root_folder, self.feature_chunk_size()),
+                inputs=roofs + shades_and_projes,
+                outputs=[geopackage_path]))
+            layers_inputs.append(geopackage_path)
+        scheduler.add_stage(Stage("layers", self.load_layers, inputs=layers_inputs, main_thread=True))
+        return scheduler
+
+    def execute(self, iface):
+        print("Executing Console Command Tool")
+        self.iface = iface
+        self.start_run()
+
+        running_tools.append(self)
+        self.start_task()
+
+    def start_run(self):
+        self.prepare()
+        self.trace = TraceRecorder(os.path.join(self.root_folder, "trace.json"))
+        self.scheduler = self.build_stage_graph()
+
+    def max_parallel_jobs(self):
+        return max(int(self.settings.value("max_parallel_jobs", default_max_parallel_jobs())), 1)
+
+    def start_task(self):
+        self.main_thread_stages = []
+        self.task = PipelineTask(f"Buildings pipeline: {self.work_area.name}", self.run_background_stages,
+                                 self.on_task_finished, self.scheduler.pending_background_count())
+        self.task.stageStarted.connect(self.show_stage)
+        QgsApplication.taskManager().addTask(self.task)
+
+    def show_stage(self, name):
+        self.iface.statusBarIface().showMessage(f"{self.work_area.name}: {name}", 5000)
+
+    def run_background_stages(self, task):
+        self.main_thread_stages = self.scheduler.run(task)
+
+    def on_task_finished(self, result, exception):
+        if not result:
+            self.report_failure("Buildings pipeline", exception)
+            return
+
+        main_thread_stages = self.main_thread_stages
+        try:
+            while main_thread_stages:
+                for stage in main_thread_stages:
+                    self.scheduler.run_main_thread_stage(stage)
+                ready_stages = self.scheduler.take_ready_stages()
+                if any(not stage.main_thread for stage in ready_stages):
+                    self.start_task()
+                    return
+                main_thread_stages = ready_stages
+        except Exception as e:
+            self.report_failure("Buildings pipeline", e)
+            return
+
+        print(f"Buildings pipeline for '{self.work_area.name}' finished.")
+        self.release()
+
+    def feature_chunk_size(self):
+        return int(self.settings.value("feature_chunk_size", default_feature_chunk_size))
+
+    def results_geopackage(self):
+        if not self.settings.value("results_geopackage", False):
+            return None
+        return results_geopackage_path(self.root_folder)
+
+    def wkt_read_workers(self):
+        return int(self.settings.value("wkt_read_workers", default_wkt_read_workers))
+
+    def pick_roofs(self):
+        with self.scheduler.span("ImagePicker", 'picker'):
+            ImagePicker(self.iface, self.root_folder + "/", self.work_area.id)
+        with self.scheduler.span("VectorLayerProcessor.run", 'postprocess'):
+            VectorLayerProcessor(work_area_folder=self.root_folder, chunk_size=self.feature_chunk_size(),
+                                 read_workers=self.wkt_read_workers()).run()
+
+    def pick_structures(self):
+        with self.scheduler.span("MultiImagePicker", 'picker'):
+            MultiImagePicker(iface=self.iface,
+                             root_folder=self.root_folder,
+                             work_area_id=self.work_area.id)
+        with self.scheduler.span("ShadesAndProjectionsLayerProcessor.run", 'postprocess'):
+            ShadesAndProjectionsLayerProcessor(
+                work_area_folder=self.root_folder, chunk_size=self.feature_chunk_size(),
+                read_workers=self.wkt_read_workers()).run()
+
+    def load_layers(self):
+        with self.scheduler.span("QGISLayerLoader.run", 'postprocess'):
+            QGISLayerLoader(root_folder=self.root_folder, geopackage_path=self.results_geopackage()).run()
+
+    def report_failure(self, title, exception):
+        self.release()
+        if exception is None:
+            print(f"{title} for '{self.work_area.name}' was canceled.")
+            return
+        print(f"{title} failed: {exception}")
+        message = f"{title} for '{self.work_area.name}' failed: {exception}"
+        if isinstance(exception, CommandFailed):
+            message += "\n\n" + "\n".join(exception.result.stderr_tail[-20:])
+        QMessageBox.critical(None, "Error", message)
+
+    def release(self):
+        self.trace.save()
+        if self in running_tools:
+            running_tools.remove(self)
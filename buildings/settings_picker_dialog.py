@@ -3,13 +3,31 @@ from PyQt5.QtWidgets import QDialog, QFileDialog
 import os
 import json
 from .json_settings import JsonSettings
+from .run_console_command_tool import default_max_parallel_jobs, default_cache_max_size_gb, \
+    default_resource_sample_interval
+from .raster_clipper import default_raster_clip_margin
+from .tiling import default_tile_overlap
+from .variant_selector import selection_policies
 
 class Ui_SettingsPickerDialog(object):
     def setupUi(self, SettingsPickerDialog):
         SettingsPickerDialog.setObjectName("SettingsPickerDialog")
-        SettingsPickerDialog.setFixedSize(400, 500)
+        SettingsPickerDialog.resize(420, 600)
+        SettingsPickerDialog.setMinimumWidth(400)
 
-        self.verticalLayout = QtWidgets.QVBoxLayout(SettingsPickerDialog)
+        # The settings scroll, so the dialog fits small screens and can be resized.
+        self.dialogLayout = QtWidgets.QVBoxLayout(SettingsPickerDialog)
+        self.dialogLayout.setObjectName("dialogLayout")
+        self.scrollArea = QtWidgets.QScrollArea(SettingsPickerDialog)
+        self.scrollArea.setObjectName("scrollArea")
+        self.scrollArea.setWidgetResizable(True)
+        self.scrollArea.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        self.dialogLayout.addWidget(self.scrollArea)
+        self.scrollAreaWidgetContents = QtWidgets.QWidget()
+        self.scrollAreaWidgetContents.setObjectName("scrollAreaWidgetContents")
+        self.scrollArea.setWidget(self.scrollAreaWidgetContents)
+
+        self.verticalLayout = QtWidgets.QVBoxLayout(self.scrollAreaWidgetContents)
         self.verticalLayout.setObjectName("verticalLayout")
 
         self.labelRasterInliersExtractor = QtWidgets.QLabel("Path for \"raster_inliers_extractor\":", SettingsPickerDialog)
@@ -92,6 +110,107 @@ class Ui_SettingsPickerDialog(object):
         self.pushButtonBrowseResultFolder.setObjectName("pushButtonBrowseResultFolder")
         self.verticalLayout.addWidget(self.pushButtonBrowseResultFolder)
 
+        self.separator5 = QtWidgets.QFrame(SettingsPickerDialog)
+        self.separator5.setFrameShape(QtWidgets.QFrame.HLine)
+        self.separator5.setFrameShadow(QtWidgets.QFrame.Sunken)
+        self.verticalLayout.addWidget(self.separator5)
+
+        self.labelMaxParallelJobs = QtWidgets.QLabel("Maximum parallel jobs:", SettingsPickerDialog)
+        self.labelMaxParallelJobs.setObjectName("labelMaxParallelJobs")
+        self.verticalLayout.addWidget(self.labelMaxParallelJobs)
+
+        self.spinBoxMaxParallelJobs = QtWidgets.QSpinBox(SettingsPickerDialog)
+        self.spinBoxMaxParallelJobs.setObjectName("spinBoxMaxParallelJobs")
+        self.spinBoxMaxParallelJobs.setRange(1, 64)
+        self.verticalLayout.addWidget(self.spinBoxMaxParallelJobs)
+
+        self.labelCacheMaxSize = QtWidgets.QLabel("Artifact cache size limit, GB (0 disables):", SettingsPickerDialog)
+        self.labelCacheMaxSize.setObjectName("labelCacheMaxSize")
+        self.verticalLayout.addWidget(self.labelCacheMaxSize)
+
+        self.spinBoxCacheMaxSize = QtWidgets.QSpinBox(SettingsPickerDialog)
+        self.spinBoxCacheMaxSize.setObjectName("spinBoxCacheMaxSize")
+        self.spinBoxCacheMaxSize.setRange(0, 10000)
+        self.verticalLayout.addWidget(self.spinBoxCacheMaxSize)
+
+        self.labelResourceSampleInterval = QtWidgets.QLabel("Resource sampling interval, s (0 disables):", SettingsPickerDialog)
+        self.labelResourceSampleInterval.setObjectName("labelResourceSampleInterval")
+        self.verticalLayout.addWidget(self.labelResourceSampleInterval)
+
+        self.spinBoxResourceSampleInterval = QtWidgets.QDoubleSpinBox(SettingsPickerDialog)
+        self.spinBoxResourceSampleInterval.setObjectName("spinBoxResourceSampleInterval")
+        self.spinBoxResourceSampleInterval.setRange(0.0, 60.0)
+        self.spinBoxResourceSampleInterval.setSingleStep(0.5)
+        self.verticalLayout.addWidget(self.spinBoxResourceSampleInterval)
+
+        self.separator6 = QtWidgets.QFrame(SettingsPickerDialog)
+        self.separator6.setFrameShape(QtWidgets.QFrame.HLine)
+        self.separator6.setFrameShadow(QtWidgets.QFrame.Sunken)
+        self.verticalLayout.addWidget(self.separator6)
+
+        self.labelTileSize = QtWidgets.QLabel("Tile size, map units (0 disables tiling):", SettingsPickerDialog)
+        self.labelTileSize.setObjectName("labelTileSize")
+        self.verticalLayout.addWidget(self.labelTileSize)
+
+        self.spinBoxTileSize = QtWidgets.QSpinBox(SettingsPickerDialog)
+        self.spinBoxTileSize.setObjectName("spinBoxTileSize")
+        self.spinBoxTileSize.setRange(0, 1000000)
+        self.spinBoxTileSize.setSingleStep(500)
+        self.verticalLayout.addWidget(self.spinBoxTileSize)
+
+        self.labelTileOverlap = QtWidgets.QLabel("Tile overlap, map units:", SettingsPickerDialog)
+        self.labelTileOverlap.setObjectName("labelTileOverlap")
+        self.verticalLayout.addWidget(self.labelTileOverlap)
+
+        self.spinBoxTileOverlap = QtWidgets.QSpinBox(SettingsPickerDialog)
+        self.spinBoxTileOverlap.setObjectName("spinBoxTileOverlap")
+        self.spinBoxTileOverlap.setRange(0, 10000)
+        self.spinBoxTileOverlap.setSingleStep(10)
+        self.verticalLayout.addWidget(self.spinBoxTileOverlap)
+
+        self.labelTiledSelectionPolicy = QtWidgets.QLabel("Variant selection in tiled runs:", SettingsPickerDialog)
+        self.labelTiledSelectionPolicy.setObjectName("labelTiledSelectionPolicy")
+        self.verticalLayout.addWidget(self.labelTiledSelectionPolicy)
+
+        self.comboBoxTiledSelectionPolicy = QtWidgets.QComboBox(SettingsPickerDialog)
+        self.comboBoxTiledSelectionPolicy.setObjectName("comboBoxTiledSelectionPolicy")
+        self.comboBoxTiledSelectionPolicy.addItems(selection_policies)
+        self.verticalLayout.addWidget(self.comboBoxTiledSelectionPolicy)
+
+        self.labelTiledSelectionNotice = QtWidgets.QLabel(
+            "Tiled runs do not show the variant pickers: \"first\" selects the first variant of every "
+            "building, \"skip\" selects none.", SettingsPickerDialog)
+        self.labelTiledSelectionNotice.setObjectName("labelTiledSelectionNotice")
+        self.labelTiledSelectionNotice.setWordWrap(True)
+        self.verticalLayout.addWidget(self.labelTiledSelectionNotice)
+
+        self.checkBoxClipRasters = QtWidgets.QCheckBox("Clip images to the work region", SettingsPickerDialog)
+        self.checkBoxClipRasters.setObjectName("checkBoxClipRasters")
+        self.verticalLayout.addWidget(self.checkBoxClipRasters)
+
+        self.checkBoxClipReferenceVector = QtWidgets.QCheckBox("Clip OSM vector to the work region", SettingsPickerDialog)
+        self.checkBoxClipReferenceVector.setObjectName("checkBoxClipReferenceVector")
+        self.verticalLayout.addWidget(self.checkBoxClipReferenceVector)
+
+        self.checkBoxIngestReferenceVector = QtWidgets.QCheckBox("Index OSM vectors in a GeoPackage", SettingsPickerDialog)
+        self.checkBoxIngestReferenceVector.setObjectName("checkBoxIngestReferenceVector")
+        self.verticalLayout.addWidget(self.checkBoxIngestReferenceVector)
+
+        self.checkBoxResultsGeoPackage = QtWidgets.QCheckBox("Write results to a GeoPackage", SettingsPickerDialog)
+        self.checkBoxResultsGeoPackage.setObjectName("checkBoxResultsGeoPackage")
+        self.verticalLayout.addWidget(self.checkBoxResultsGeoPackage)
+
+        self.labelRasterClipMargin = QtWidgets.QLabel("Clip margin, map units:", SettingsPickerDialog)
+        self.labelRasterClipMargin.setObjectName("labelRasterClipMargin")
+        self.verticalLayout.addWidget(self.labelRasterClipMargin)
+
+        self.spinBoxRasterClipMargin = QtWidgets.QSpinBox(SettingsPickerDialog)
+        self.spinBoxRasterClipMargin.setObjectName("spinBoxRasterClipMargin")
+        self.spinBoxRasterClipMargin.setRange(0, 10000)
+        self.spinBoxRasterClipMargin.setSingleStep(10)
+        self.verticalLayout.addWidget(self.spinBoxRasterClipMargin)
+        self.verticalLayout.addStretch()
+
         QtCore.QMetaObject.connectSlotsByName(SettingsPickerDialog)
 
 
@@ -107,6 +226,19 @@ class SettingsPickerDialog(QDialog):
         self.ui.lineEditRoofLocator.setText(self.settings.value("roof_locator", ""))
         self.ui.lineEditMultiviewBuildingReconstructor.setText(self.settings.value("multiview_building_reconstructor", ""))
         self.ui.lineEditResultFolder.setText(self.settings.value("result_folder", ""))
+        self.ui.spinBoxMaxParallelJobs.setValue(int(self.settings.value("max_parallel_jobs", default_max_parallel_jobs())))
+        self.ui.spinBoxCacheMaxSize.setValue(int(self.settings.value("cache_max_size_gb", default_cache_max_size_gb)))
+        self.ui.spinBoxResourceSampleInterval.setValue(
+            float(self.settings.value("resource_sample_interval", default_resource_sample_interval)))
+        self.ui.spinBoxTileSize.setValue(int(self.settings.value("tile_size", 0)))
+        self.ui.spinBoxTileOverlap.setValue(int(self.settings.value("tile_overlap", default_tile_overlap)))
+        self.ui.comboBoxTiledSelectionPolicy.setCurrentText(self.settings.value("tiled_selection_policy", "first"))
+        self.update_tiling_widgets(self.ui.spinBoxTileSize.value())
+        self.ui.checkBoxClipRasters.setChecked(bool(self.settings.value("clip_rasters", True)))
+        self.ui.checkBoxClipReferenceVector.setChecked(bool(self.settings.value("clip_reference_vector", True)))
+        self.ui.checkBoxIngestReferenceVector.setChecked(bool(self.settings.value("ingest_reference_vector", True)))
+        self.ui.checkBoxResultsGeoPackage.setChecked(bool(self.settings.value("results_geopackage", False)))
+        self.ui.spinBoxRasterClipMargin.setValue(int(self.settings.value("raster_clip_margin", default_raster_clip_margin)))
 
         self.ui.pushButtonBrowseRasterInliersExtractor.clicked.connect(
             lambda: self.browse_file(self.ui.lineEditRasterInliersExtractor, "raster_inliers_extractor"))
@@ -118,6 +250,34 @@ class SettingsPickerDialog(QDialog):
             lambda: self.browse_file(self.ui.lineEditMultiviewBuildingReconstructor, "multiview_building_reconstructor"))
         self.ui.pushButtonBrowseResultFolder.clicked.connect(
             lambda: self.browse_folder(self.ui.lineEditResultFolder, "result_folder"))
+        self.ui.spinBoxMaxParallelJobs.valueChanged.connect(
+            lambda value: self.settings.setValue("max_parallel_jobs", value))
+        self.ui.spinBoxCacheMaxSize.valueChanged.connect(
+            lambda value: self.settings.setValue("cache_max_size_gb", value))
+        self.ui.spinBoxResourceSampleInterval.valueChanged.connect(
+            lambda value: self.settings.setValue("resource_sample_interval", value))
+        self.ui.spinBoxTileSize.valueChanged.connect(
+            lambda value: self.settings.setValue("tile_size", value))
+        self.ui.spinBoxTileSize.valueChanged.connect(self.update_tiling_widgets)
+        self.ui.comboBoxTiledSelectionPolicy.currentTextChanged.connect(
+            lambda text: self.settings.setValue("tiled_selection_policy", text))
+        self.ui.spinBoxTileOverlap.valueChanged.connect(
+            lambda value: self.settings.setValue("tile_overlap", value))
+        self.ui.checkBoxClipRasters.toggled.connect(
+            lambda checked: self.settings.setValue("clip_rasters", checked))
+        self.ui.checkBoxClipReferenceVector.toggled.connect(
+            lambda checked: self.settings.setValue("clip_reference_vector", checked))
+        self.ui.checkBoxIngestReferenceVector.toggled.connect(
+            lambda checked: self.settings.setValue("ingest_reference_vector", checked))
+        self.ui.checkBoxResultsGeoPackage.toggled.connect(
+            lambda checked: self.settings.setValue("results_geopackage", checked))
+        self.ui.spinBoxRasterClipMargin.valueChanged.connect(
+            lambda value: self.settings.setValue("raster_clip_margin", value))
+
+    def update_tiling_widgets(self, tile_size):
+        for widget in [self.ui.spinBoxTileOverlap, self.ui.comboBoxTiledSelectionPolicy,
+                       self.ui.labelTiledSelectionNotice]:
+            widget.setEnabled(tile_size > 0)
 
     def browse_file(self, line_edit, key):
         file_path, _ = QFileDialog.getOpenFileName(self, "Select File", "", "All Files (*)")
@@ -5,34 +5,56 @@ from qgis.core import (
     QgsVectorLayer,
     QgsField,
     QgsFeature,
-    QgsGeometry,
     QgsProject,
     QgsVectorFileWriter,
     QgsCoordinateReferenceSystem
 )
 
+from .append_journal import AppendJournal, batch_id
+from .merge_vectors import default_feature_chunk_size, add_feature_chunks, commit_append
+from .variant_pack import VariantPacks
+from .wkt_reader import read_wkt_geometries, default_wkt_read_workers
+
 
 class ShadesAndProjectionsLayerProcessor:
-    def __init__(self, work_area_folder):
+    def __init__(self, work_area_folder, chunk_size=default_feature_chunk_size,
+                 read_workers=default_wkt_read_workers):
         print("ShadesAndProjectionsLayerProcessor initialized", work_area_folder)
         self.work_area_folder = work_area_folder
         self.crs = QgsCoordinateReferenceSystem('EPSG:3395')
-        self.unique_id = 1
+        # Next feature id per layer, keyed by (layers dict name, map folder).
+        self.next_ids = {}
         self.proj_layers = {}
         self.shade_layers = {}
-
-    def create_layer(self, map_folder, filename, layer_name):
+        self.chunk_size = max(int(chunk_size), 1)
+        self.read_workers = int(read_workers)
+        # Queued features per layer, keyed by (layers dict name, map folder).
+        self.pending_features = {}
+        # Existing shapefiles get new features appended in place, keyed like
+        # pending_features; see AppendJournal.
+        self.journals = {}
+        # Batch ids of the layers created in memory, recorded once they are saved.
+        self.batches = {}
+
+    def create_layer(self, map_folder, filename, layer_name, layers_name, batch):
         file_path = os.path.join(map_folder, filename)
+        journal = AppendJournal(file_path)
 
         if os.path.exists(file_path):
             print(f"Loading existing layer: {file_path}")
+            journal.recover()
+            if journal.is_applied(batch):
+                print(f"The selected features are already in {file_path}, skipping")
+                return None, None
             layer = QgsVectorLayer(file_path, layer_name, 'ogr')
             if not layer.isValid():
                 print(f"Failed to load layer: {file_path}")
                 return None, None
             else:
                 provider = layer.dataProvider()
-                self.unique_id = provider.featureCount() + 1
+                self.next_ids[(layers_name, map_folder)] = provider.featureCount() + 1
+                journal.begin(provider.featureCount(), batch)
+                self.journals[(layers_name, map_folder)] = journal
                 return layer, provider
         else:
             print(f"Creating new memory layer for: {map_folder}")
@@ -40,28 +62,34 @@ class ShadesAndProjectionsLayerProcessor:
             provider = layer.dataProvider()
             provider.addAttributes([QgsField('id', QVariant.Int)])
             layer.updateFields()
+            self.next_ids[(layers_name, map_folder)] = 1
+            self.batches[(layers_name, map_folder)] = batch
             return layer, provider
 
-    def add_features_from_wkt_file(self, wkt_file, provider):
-        if os.path.exists(wkt_file):
-            try:
-                with open(wkt_file, 'r') as file:
-                    wkt = file.read().strip()
-                    geom = QgsGeometry.fromWkt(wkt)
-                    if not geom.isNull():
-                        feature = QgsFeature()
-                        feature.setGeometry(geom)
-                        feature.setAttributes([self.unique_id])
-                        provider.addFeature(feature)
-                        self.unique_id += 1
-                    else:
-                        print(f"Invalid geometry: {wkt}")
-            except Exception as e:
-                print(f"Error reading {wkt_file}: {e}")
-        else:
-            print(f"File does not exist: {wkt_file}")
+    def add_feature(self, layers_name, map_folder, geom):
+        """Queues a feature with the layer's next id; layers get them in chunks of ``chunk_size``."""
+        key = (layers_name, map_folder)
+        feature = QgsFeature()
+        feature.setGeometry(geom)
+        feature.setAttributes([self.next_ids[key]])
+        self.next_ids[key] += 1
+        pending = self.pending_features.setdefault(key, [])
+        pending.append(feature)
+        if len(pending) >= self.chunk_size:
+            self.flush_features(key)
+
+    def flush_features(self, key=None):
+        keys = [key] if key is not None else list(self.pending_features)
+        for layers_name, map_folder in keys:
+            features = self.pending_features.pop((layers_name, map_folder), [])
+            if features:
+                layer = getattr(self, layers_name)[map_folder]
+                added = add_feature_chunks(layer.dataProvider(), features, self.chunk_size)
+                if (layers_name, map_folder) in self.journals:
+                    self.journals[(layers_name, map_folder)].added += added
 
     def process_proj_and_shade_files(self, selection_data):
+        wkt_files = []
         for entry in selection_data:
             map_folder = entry["map_folder"]
             image_path = entry.get("image_path")
@@ -73,15 +101,32 @@ class ShadesAndProjectionsLayerProcessor:
                 print(f"Processing proj file: {proj_file}")
                 print(f"Processing shade file: {shade_file}")
 
-                if map_folder not in self.proj_layers:
-                    self.proj_layers[map_folder], _ = self.create_layer(map_folder, 'projes.shp', 'proj_layer')
-                    self.shade_layers[map_folder], _ = self.create_layer(map_folder, 'shades.shp', 'shade_layer')
-
-                proj_layer, proj_provider = self.proj_layers[map_folder], self.proj_layers[map_folder].dataProvider()
-                shade_layer, shade_provider = self.shade_layers[map_folder], self.shade_layers[map_folder].dataProvider()
-
-                self.add_features_from_wkt_file(proj_file, proj_provider)
-                self.add_features_from_wkt_file(shade_file, shade_provider)
+                wkt_files.append((proj_file, 'proj_layers', map_folder))
+                wkt_files.append((shade_file, 'shade_layers', map_folder))
+
+        # Geometries are read before the layers are opened, the batch ids are taken from their WKB.
+        features = {(layers_name, map_folder): [] for _, layers_name, map_folder in wkt_files}
+        with VariantPacks() as packs:
+            geometries = read_wkt_geometries([wkt_file for wkt_file, _, _ in wkt_files], self.read_workers, packs)
+            for (wkt_file, layers_name, map_folder), (geom, message) in zip(wkt_files, geometries):
+                if geom is None:
+                    print(message)
+                    continue
+                features[(layers_name, map_folder)].append((wkt_file, geom))
+
+        # Ids continue from each layer's own feature count, in selection order.
+        for map_folder in dict.fromkeys(map_folder for _, _, map_folder in wkt_files):
+            for layers_name, filename, layer_name in [('proj_layers', 'projes.shp', 'proj_layer'),
+                                                      ('shade_layers', 'shades.shp', 'shade_layer')]:
+                entries = features[(layers_name, map_folder)]
+                batch = batch_id([(wkt_file, bytes(geom.asWkb())) for wkt_file, geom in entries])
+                layer, _ = self.create_layer(map_folder, filename, layer_name, layers_name, batch)
+                if layer is None:
+                    continue
+                getattr(self, layers_name)[map_folder] = layer
+                for _, geom in entries:
+                    self.add_feature(layers_name, map_folder, geom)
+        self.flush_features()
 
     def save_layer(self, layer, output_directory, filename):
         file_path = os.path.join(output_directory, filename)
@@ -95,8 +140,9 @@ class ShadesAndProjectionsLayerProcessor:
         )
         if error[0] != QgsVectorFileWriter.NoError:
             print(f"Error saving layer {filename}: {error}")
-        else:
-            print(f"Layer {filename} saved successfully at {file_path}")
+            return False
+        print(f"Layer {filename} saved successfully at {file_path}")
+        return True
 
     def load_selection_file(self):
         selection_file_path = os.path.join(self.work_area_folder, 'structure_selection_results.json')
@@ -130,9 +176,15 @@ class ShadesAndProjectionsLayerProcessor:
 
         self.process_proj_and_shade_files(selection_data)
 
-        for map_folder in self.proj_layers.keys():
-            self.save_layer(self.proj_layers[map_folder], map_folder, 'projes.shp')
-            self.save_layer(self.shade_layers[map_folder], map_folder, 'shades.shp')
+        for layers_name, filename in [('proj_layers', 'projes.shp'), ('shade_layers', 'shades.shp')]:
+            layers = getattr(self, layers_name)
+            for map_folder in list(layers):
+                journal = self.journals.pop((layers_name, map_folder), None)
+                if journal is not None:
+                    commit_append(journal, layers, map_folder)
+                elif self.save_layer(layers.pop(map_folder), map_folder, filename):
+                    AppendJournal(os.path.join(map_folder, filename)).record(
+                        self.batches.pop((layers_name, map_folder)))
 
         self.delete_selection_file()
 
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+shapefile_sidecars = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
+
+
+def related_files(path):
+    base, ext = os.path.splitext(path)
+    if ext.lower() == '.shp':
+        return [base + sidecar for sidecar in shapefile_sidecars]
+    return [path]
+
+
+def path_signature(path):
+    if not path:
+        return None
+    if os.path.isdir(path):
+        entries = []
+        for folder, subfolders, filenames in os.walk(path):
+            subfolders.sort()
+            for filename in sorted(filenames):
+                file_path = os.path.join(folder, filename)
+                stat = os.stat(file_path)
+                entries.append([os.path.relpath(file_path, path), stat.st_size, stat.st_mtime_ns])
+        return hashlib.sha256(json.dumps(entries).encode()).hexdigest()
+    signature = []
+    for file_path in related_files(path):
+        if os.path.exists(file_path):
+            stat = os.stat(file_path)
+            signature.append([os.path.basename(file_path), stat.st_size, stat.st_mtime_ns])
+    return signature or None
+
+
+class StageManifest:
+    """Per work area record of stage fingerprints, used to skip up-to-date stages.
+
+    A stage's fingerprint covers its command line, the tool binary and the
+    size and modification time of every input. A stage is up to date when its
+    last run finished with the same fingerprint and its outputs are unchanged.
+    """
+
+    def __init__(self, work_area_folder):
+        self.file_path = os.path.join(work_area_folder, 'stages.json')
+        self.lock = threading.Lock()
+        self.stages = self.load()
+
+    def load(self):
+        if os.path.exists(self.file_path):
+            with open(self.file_path, 'r') as f:
+                try:
+                    return json.load(f)
+                except json.JSONDecodeError:
+                    print(f"Error loading stage manifest: {self.file_path}")
+        return {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.stages, f, indent=4)
+        os.replace(temp_path, self.file_path)
+
+    def fingerprint(self, stage):
+        data = {
+            'command': stage.command,
+            'tool': path_signature(stage.tool) if stage.tool else None,
+            'inputs': [[path, path_signature(path)] for path in stage.inputs],
+        }
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+    def output_signatures(self, stage):
+        return {path: path_signature(path) for path in stage.outputs}
+
+    def is_up_to_date(self, stage):
+        if not stage.outputs:
+            return False
+        with self.lock:
+            entry = self.stages.get(stage.name)
+        if not entry or entry.get('status') != 'done':
+            return False
+        if entry.get('fingerprint') != self.fingerprint(stage):
+            return False
+        outputs = self.output_signatures(stage)
+        if any(signature is None for signature in outputs.values()):
+            return False
+        return outputs == entry.get('outputs')
+
+    def record(self, stage, status, **details):
+        with self.lock:
+            entry = {'status': status, 'time': time.time()}
+            if status == 'running':
+                entry['fingerprint'] = self.fingerprint(stage)
+            else:
+                entry['fingerprint'] = self.stages.get(stage.name, {}).get('fingerprint')
+            if status == 'done':
+                entry['outputs'] = self.output_signatures(stage)
+            entry.update(details)
+            self.stages[stage.name] = entry
+            self.save()
@@ -0,0 +1,154 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import nullcontext
+
+from .process_runner import CommandCanceled
+
+
+class Stage:
+    def __init__(self, name, action, inputs=None, outputs=None, main_thread=False, command=None, tool=None):
+        self.name = name
+        self.action = action
+        self.command = command
+        self.tool = tool
+        self.inputs = [os.path.normpath(path) for path in (inputs or [])]
+        self.outputs = [os.path.normpath(path) for path in (outputs or [])]
+        self.main_thread = main_thread
+        self.dependencies = set()
+        self.state = 'pending'
+
+
+class StageScheduler:
+    """Dependency graph of pipeline stages.
+
+    A stage depends on every stage that produces one of its inputs, so the
+    artifact paths are the edges of the graph. Background stages run on a
+    bounded thread pool as soon as their own dependencies are done; stages
+    flagged ``main_thread`` are handed back to the caller by ``run``. With a
+    ``manifest``, stages whose outputs are still up to date are skipped.
+
+    The first failing stage stops the run: no further stages are started and
+    ``abort`` is set so that running stages can kill their processes.
+    """
+
+    def __init__(self, max_workers=1, manifest=None, trace=None):
+        self.max_workers = max(max_workers, 1)
+        self.manifest = manifest
+        self.trace = trace
+        self.abort = threading.Event()
+        self.stages = {}
+        self.producers = {}
+
+    def add_stage(self, stage):
+        self.stages[stage.name] = stage
+        for output in stage.outputs:
+            self.producers[output] = stage.name
+        return stage
+
+    def resolve_dependencies(self):
+        for stage in self.stages.values():
+            stage.dependencies = {self.producers[path] for path in stage.inputs
+                                  if path in self.producers and self.producers[path] != stage.name}
+
+    def ready_stages(self):
+        return [stage for stage in self.stages.values() if stage.state == 'pending' and
+                all(self.stages[name].state == 'done' for name in stage.dependencies)]
+
+    def take_ready_stages(self):
+        while True:
+            ready = self.ready_stages()
+            skipped = [stage for stage in ready if self.manifest is not None and self.manifest.is_up_to_date(stage)]
+            if not skipped:
+                return ready
+            for stage in skipped:
+                print(f"Stage {stage.name} is up to date, skipping.")
+                if self.trace is not None:
+                    self.trace.instant(stage.name, status='up to date')
+                stage.state = 'done'
+
+    def pending_background_count(self):
+        return sum(1 for stage in self.stages.values() if stage.state == 'pending' and not stage.main_thread)
+
+    def is_finished(self):
+        return all(stage.state == 'done' for stage in self.stages.values())
+
+    def run(self, task=None):
+        """Runs background stages until only main thread stages are ready.
+
+        Returns the main thread stages that are ready to run; an empty list
+        means the graph is either finished or blocked by cancellation.
+        """
+        self.resolve_dependencies()
+        self.abort.clear()
+        running = {}
+        failure = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                if task is not None and task.isCanceled():
+                    self.abort.set()
+                if not self.abort.is_set():
+                    for stage in self.take_ready_stages():
+                        if not stage.main_thread:
+                            stage.state = 'running'
+                            running[executor.submit(self.run_stage, stage, task)] = stage
+                if not running:
+                    break
+                done, _ = wait(running, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        future.result()
+                    except CommandCanceled:
+                        stage.state = 'pending'
+                        continue
+                    except Exception as e:
+                        stage.state = 'failed'
+                        if failure is None:
+                            failure = e
+                            self.abort.set()
+                            print(f"Stage {stage.name} failed, stopping the pipeline: {e}")
+                        continue
+                    stage.state = 'done'
+
+        if failure is not None:
+            raise failure
+        if self.abort.is_set():
+            return []
+        return [stage for stage in self.take_ready_stages() if stage.main_thread]
+
+    def run_stage(self, stage, task):
+        if task is not None:
+            task.begin_stage(stage.name)
+        self.run_action(stage)
+        if task is not None:
+            task.end_stage()
+
+    def run_main_thread_stage(self, stage):
+        stage.state = 'running'
+        try:
+            self.run_action(stage)
+        except Exception:
+            stage.state = 'failed'
+            raise
+        stage.state = 'done'
+
+    def span(self, name, category='stage', **args):
+        if self.trace is None:
+            return nullcontext(args)
+        return self.trace.span(name, category, **args)
+
+    def run_action(self, stage):
+        if self.manifest is not None:
+            self.manifest.record(stage, 'running')
+        try:
+            with self.span(stage.name, main_thread=stage.main_thread) as span_args:
+                details = stage.action() or {}
+                span_args.update(details)
+        except Exception as e:
+            if self.manifest is not None:
+                status = 'canceled' if isinstance(e, CommandCanceled) else 'failed'
+                self.manifest.record(stage, status, error=str(e), **getattr(e, 'details', {}))
+            raise
+        if self.manifest is not None:
+            self.manifest.record(stage, 'done', **details)
@@ -0,0 +1,180 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from PyQt5.QtWidgets import QMessageBox
+from qgis.core import QgsApplication
+
+from .headless_runner import HeadlessConsoleCommandTool
+from .json_settings import JsonSettings
+from .merge_vectors import default_feature_chunk_size
+from .pipeline_task import PipelineTask
+from .process_runner import CommandFailed
+from .qgis_loader import QGISLayerLoader
+from .results_geopackage import update_results_geopackage, results_geopackage_path
+from .run_console_command_tool import ConsoleCommandTool, default_max_parallel_jobs, running_tools
+from .tiling import split_work_region, merge_tile_outputs, default_tile_overlap
+from .variant_selector import VariantSelector
+from .work_area import WorkArea
+
+
+def tile_size(settings):
+    return float(settings.value("tile_size", 0) or 0)
+
+
+class TileConsoleCommandTool(HeadlessConsoleCommandTool):
+    def max_parallel_jobs(self):
+        # Tiles already run in parallel, one stage at a time each.
+        return 1
+
+    def results_geopackage(self):
+        # Written once for the merged work area, not per tile.
+        return None
+
+
+class TiledPipeline:
+    """Runs the buildings pipeline per tile of a large work region.
+
+    Tiles are processed in ``<result_folder>/<work area>_tiles/<tile>``,
+    ``max_parallel_jobs`` of them at once, each with its own stage manifest
+    so finished tiles are skipped on a rerun. Picks are made by
+    ``variant_selector``. Once every tile is done their roofs, shades and
+    projes are merged into the work area folder, dropping seam duplicates.
+    Has the same ``task``/``run()`` interface as HeadlessConsoleCommandTool.
+    """
+
+    def __init__(self, work_area, settings, variant_selector, stop_requested=None):
+        self.work_area = work_area
+        self.settings = settings
+        self.variant_selector = variant_selector
+        self.stop_requested = stop_requested or threading.Event()
+        self.task = None
+        self.root_folder = os.path.join(settings.value("result_folder"), work_area.name)
+        self.tiles_folder = self.root_folder + "_tiles"
+
+    def tile_work_area(self, tile):
+        data = self.work_area.to_dict()
+        data.update(id=f"{self.work_area.id}-{tile.id}",
+                    name=os.path.relpath(tile.folder, self.settings.value("result_folder")),
+                    work_area=tile.work_region_path)
+        return WorkArea.from_dict(data)
+
+    def results_geopackage(self):
+        if not self.settings.value("results_geopackage", False):
+            return None
+        return results_geopackage_path(self.root_folder)
+
+    def max_parallel_tiles(self):
+        return max(int(self.settings.value("max_parallel_jobs", default_max_parallel_jobs())), 1)
+
+    def run_tile(self, tile):
+        if self.stop_requested.is_set():
+            return False
+        if self.task is not None:
+            self.task.begin_stage(tile.id)
+        finished = TileConsoleCommandTool(self.tile_work_area(tile), self.settings, self.variant_selector,
+                                          self.stop_requested).run()
+        if self.task is not None:
+            self.task.end_stage()
+        return finished
+
+    def run(self):
+        print(f"Running tiled buildings pipeline for '{self.work_area.name}'")
+        tiles = split_work_region(self.work_area.work_area, tile_size(self.settings),
+                                  float(self.settings.value("tile_overlap", default_tile_overlap)), self.tiles_folder)
+        if self.task is not None:
+            self.task.stage_count = len(tiles) + 1
+
+        failure = None
+        finished = True
+        with ThreadPoolExecutor(max_workers=self.max_parallel_tiles()) as executor:
+            pending = {executor.submit(self.run_tile, tile) for tile in tiles}
+            while pending:
+                if self.task is not None and self.task.isCanceled():
+                    self.stop_requested.set()
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        finished = future.result() and finished
+                    except Exception as e:
+                        self.stop_requested.set()
+                        if failure is None:
+                            failure = e
+                            print(f"Tile failed, stopping the tiled pipeline: {e}")
+
+        if failure is not None:
+            raise failure
+        if not finished or self.stop_requested.is_set():
+            return False
+
+        if self.task is not None:
+            self.task.begin_stage("merge")
+        merge_tile_outputs(tiles, self.root_folder)
+        if self.results_geopackage():
+            update_results_geopackage(self.root_folder,
+                                      int(self.settings.value("feature_chunk_size", default_feature_chunk_size)))
+        if self.task is not None:
+            self.task.end_stage()
+        return True
+
+
+class TiledConsoleCommandTool:
+    """Runs TiledPipeline in a background task from the GUI and loads the merged layers.
+
+    The pickers are not shown for tiles: variants are selected with the
+    ``tiled_selection_policy`` setting, which the user is told about when
+    the run starts.
+    """
+
+    def __init__(self, work_area, settings=None):
+        self.work_area = work_area
+        self.settings = settings or JsonSettings()
+        self.selection_policy = self.settings.value("tiled_selection_policy", "first")
+        self.pipeline = TiledPipeline(work_area, self.settings, VariantSelector(self.selection_policy))
+        self.task = None
+
+    def execute(self, iface):
+        self.iface = iface
+        self.iface.messageBar().pushInfo(
+            "Tiled buildings pipeline",
+            f"'{self.work_area.name}' runs in tiles without the variant pickers, variants are selected "
+            f"with the '{self.selection_policy}' policy (see Settings).")
+        self.task = PipelineTask(f"Tiled buildings pipeline: {self.work_area.name}", self.run_pipeline,
+                                 self.on_task_finished)
+        self.task.stageStarted.connect(
+            lambda name: self.iface.statusBarIface().showMessage(f"{self.work_area.name}: {name}", 5000))
+        running_tools.append(self)
+        QgsApplication.taskManager().addTask(self.task)
+
+    def run_pipeline(self, task):
+        self.pipeline.task = task
+        if not self.pipeline.run() and not task.isCanceled():
+            raise RuntimeError("Tiled pipeline did not finish")
+
+    def on_task_finished(self, result, exception):
+        running_tools.remove(self)
+        if result:
+            QGISLayerLoader(root_folder=self.pipeline.root_folder,
+                            geopackage_path=self.pipeline.results_geopackage()).run()
+            return
+        if exception is None:
+            print(f"Tiled buildings pipeline for '{self.work_area.name}' was canceled.")
+            return
+        message = f"Tiled buildings pipeline for '{self.work_area.name}' failed: {exception}"
+        if isinstance(exception, CommandFailed):
+            message += "\n\n" + "\n".join(exception.result.stderr_tail[-20:])
+        QMessageBox.critical(None, "Error", message)
+
+
+def create_pipeline_tool(work_area, settings=None):
+    """ConsoleCommandTool, or its tiled variant when tiling is enabled in the settings."""
+    settings = settings or JsonSettings()
+    if tile_size(settings) > 0:
+        return TiledConsoleCommandTool(work_area, settings)
+    return ConsoleCommandTool(work_area, settings)
+
+
+def create_headless_tool(work_area, settings, variant_selector, stop_requested=None):
+    if tile_size(settings) > 0:
+        return TiledPipeline(work_area, settings, variant_selector, stop_requested)
+    return HeadlessConsoleCommandTool(work_area, settings, variant_selector, stop_requested)
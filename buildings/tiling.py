@@ -0,0 +1,165 @@
+import math
+import os
+
+from qgis.core import (
+    QgsVectorLayer,
+    QgsFeature,
+    QgsGeometry,
+    QgsRectangle,
+    QgsSpatialIndex,
+    QgsVectorFileWriter,
+    QgsCoordinateTransformContext,
+    QgsWkbTypes
+)
+
+default_tile_overlap = 100
+merged_layers = ['roofs', 'shades', 'projes']
+# Share of the smaller polygon two features from different tiles must have
+# in common to be treated as the same building.
+seam_overlap_ratio = 0.5
+
+
+class Tile:
+    def __init__(self, tile_id, folder, core):
+        self.id = tile_id
+        self.folder = folder
+        self.core = core
+        self.work_region_path = os.path.join(folder, 'work_region.shp')
+
+
+def read_region(path):
+    layer = QgsVectorLayer(path, 'work_region', 'ogr')
+    if not layer.isValid():
+        raise ValueError(f"Cannot read work region {path}")
+    geometries = [feature.geometry() for feature in layer.getFeatures() if not feature.geometry().isNull()]
+    if not geometries:
+        raise ValueError(f"Work region {path} is empty")
+    return QgsGeometry.unaryUnion(geometries), layer.crs()
+
+
+def save_geometries(path, features, fields, wkb_type, crs):
+    layer = QgsVectorLayer(f'{QgsWkbTypes.displayString(wkb_type)}?crs={crs.authid()}', os.path.basename(path),
+                           'memory')
+    provider = layer.dataProvider()
+    provider.addAttributes(fields.toList() if fields is not None else [])
+    layer.updateFields()
+    provider.addFeatures(features)
+
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = "ESRI Shapefile"
+    error = QgsVectorFileWriter.writeAsVectorFormatV3(layer, path, QgsCoordinateTransformContext(), options)
+    if error[0] != QgsVectorFileWriter.NoError:
+        raise RuntimeError(f"Error saving {path}: {error[1]}")
+
+
+def split_work_region(work_region_path, tile_size, overlap, tiles_folder):
+    """Cuts the work region into a grid of ``tile_size`` squares.
+
+    Each tile's work region is its square grown by ``overlap`` on every side
+    and clipped to the region, so buildings on a seam are seen whole by at
+    least one tile. The squares themselves (``Tile.core``) do not overlap and
+    decide which tile owns a building. Tile regions are only rewritten when
+    they change, which keeps the per-tile stage manifests valid.
+    """
+    region, crs = read_region(work_region_path)
+    extent = region.boundingBox()
+    columns = max(math.ceil(extent.width() / tile_size), 1)
+    rows = max(math.ceil(extent.height() / tile_size), 1)
+
+    tiles = []
+    for row in range(rows):
+        for column in range(columns):
+            x = extent.xMinimum() + column * tile_size
+            y = extent.yMinimum() + row * tile_size
+            core = QgsRectangle(x, y, min(x + tile_size, extent.xMaximum()), min(y + tile_size, extent.yMaximum()))
+            if not region.intersects(QgsGeometry.fromRect(core)):
+                continue
+            grown = QgsRectangle(core)
+            grown.grow(overlap)
+            geometry = region.intersection(QgsGeometry.fromRect(grown))
+            if geometry.isEmpty():
+                continue
+
+            tile = Tile(f"tile_{row}_{column}", os.path.join(tiles_folder, f"tile_{row}_{column}"), core)
+            wkt_path = os.path.join(tile.folder, 'work_region.wkt')
+            wkt = geometry.asWkt()
+            previous_wkt = None
+            if os.path.exists(wkt_path) and os.path.exists(tile.work_region_path):
+                with open(wkt_path, 'r') as f:
+                    previous_wkt = f.read()
+            if wkt != previous_wkt:
+                os.makedirs(tile.folder, exist_ok=True)
+                feature = QgsFeature()
+                feature.setGeometry(geometry)
+                save_geometries(tile.work_region_path, [feature], None, geometry.wkbType(), crs)
+                with open(wkt_path, 'w') as f:
+                    f.write(wkt)
+            tiles.append(tile)
+
+    print(f"Work region split into {len(tiles)} tiles of {tile_size} with {overlap} overlap")
+    return tiles
+
+
+def deduplicate_seams(tile_features):
+    """Drops copies of the same building found by neighbouring tiles.
+
+    ``tile_features`` is a list of (tile, feature) pairs. Features whose
+    centroid lies in their own tile's core are considered first, larger
+    ones before smaller, so the copy a tile sees whole wins. A feature is
+    dropped when it overlaps an already kept feature of another tile by
+    more than ``seam_overlap_ratio``; candidates come from a spatial index,
+    so only neighbours are compared.
+    """
+    def priority(item):
+        tile, feature = item
+        geometry = feature.geometry()
+        owned = tile.core.contains(geometry.centroid().asPoint())
+        return not owned, -geometry.area()
+
+    index = QgsSpatialIndex()
+    kept = []
+    for tile, feature in sorted(tile_features, key=priority):
+        geometry = feature.geometry()
+        duplicate = False
+        for kept_id in index.intersects(geometry.boundingBox()):
+            other_tile, other = kept[kept_id]
+            if other_tile is tile:
+                continue
+            smaller_area = min(geometry.area(), other.geometry().area())
+            if smaller_area > 0 and \
+                    geometry.intersection(other.geometry()).area() > seam_overlap_ratio * smaller_area:
+                duplicate = True
+                break
+        if duplicate:
+            continue
+        index.addFeature(len(kept), geometry.boundingBox())
+        kept.append((tile, feature))
+    return [feature for _, feature in kept]
+
+
+def merge_tile_outputs(tiles, root_folder):
+    """Merges roofs/shades/projes of every map folder of every tile into root_folder."""
+    map_folders = sorted({name for tile in tiles if os.path.isdir(tile.folder)
+                          for name in os.listdir(tile.folder) if os.path.isdir(os.path.join(tile.folder, name))})
+    for map_folder in map_folders:
+        for layer_name in merged_layers:
+            tile_features = []
+            template = None
+            for tile in tiles:
+                path = os.path.join(tile.folder, map_folder, f'{layer_name}.shp')
+                if not os.path.exists(path):
+                    continue
+                layer = QgsVectorLayer(path, layer_name, 'ogr')
+                if not layer.isValid():
+                    print(f"Skipping unreadable tile output {path}")
+                    continue
+                template = template or layer
+                tile_features += [(tile, feature) for feature in layer.getFeatures() if feature.hasGeometry()]
+            if template is None:
+                continue
+
+            features = deduplicate_seams(tile_features)
+            output_path = os.path.join(root_folder, map_folder, f'{layer_name}.shp')
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            save_geometries(output_path, features, template.fields(), template.wkbType(), template.crs())
+            print(f"Merged {len(features)} of {len(tile_features)} features from {len(tiles)} tiles into {output_path}")
@@ -0,0 +1,66 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class TraceRecorder:
+    """Collects timing spans of a pipeline run in Chrome trace-event format.
+
+    The resulting file can be opened in chrome://tracing or Perfetto.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.pid = os.getpid()
+        self.events = []
+        self.thread_ids = {}
+        self.lock = threading.Lock()
+
+    def timestamp(self):
+        return time.time_ns() // 1000
+
+    def thread_id(self):
+        thread = threading.current_thread()
+        with self.lock:
+            if thread.ident not in self.thread_ids:
+                self.thread_ids[thread.ident] = len(self.thread_ids) + 1
+                self.events.append({
+                    'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': self.thread_ids[thread.ident],
+                    'args': {'name': thread.name},
+                })
+            return self.thread_ids[thread.ident]
+
+    @contextmanager
+    def span(self, name, category='stage', **args):
+        tid = self.thread_id()
+        begin = self.timestamp()
+        try:
+            yield args
+        finally:
+            event = {
+                'name': name, 'cat': category, 'ph': 'X', 'pid': self.pid, 'tid': tid,
+                'ts': begin, 'dur': self.timestamp() - begin, 'args': args,
+            }
+            with self.lock:
+                self.events.append(event)
+
+    def instant(self, name, category='stage', **args):
+        tid = self.thread_id()
+        event = {
+            'name': name, 'cat': category, 'ph': 'i', 's': 't', 'pid': self.pid, 'tid': tid,
+            'ts': self.timestamp(), 'args': args,
+        }
+        with self.lock:
+            self.events.append(event)
+
+    def save(self):
+        with self.lock:
+            data = {'traceEvents': list(self.events), 'displayTimeUnit': 'ms'}
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.file_path)
+        print(f"Trace saved to {self.file_path}")
@@ -0,0 +1,93 @@
+import os
+import struct
+import threading
+
+from qgis.core import QgsGeometry
+
+from .wkb_pack import pack_path, wkt_extensions, variants_folder_of, pack_key, VariantPack, write_pack
+from .wkt_reader import read_wkt_geometries, default_wkt_read_workers
+
+
+def pack_variant_geometries(variants_folder, subfolder, read_workers=default_wkt_read_workers, remove_loose=True):
+    """Packs the WKT files under ``variants_folder/subfolder`` into the subfolder's container.
+
+    Each subfolder has its own container, so the roofs stage and the
+    multiview stage each own the file they write (see pack_path). Packed
+    WKT files are removed with ``remove_loose``; files that do not parse
+    stay loose, so readers report them as before.
+    """
+    output_path = pack_path(variants_folder, subfolder)
+    entries = {}
+    wkt_files = []
+    for folder, subfolders, filenames in os.walk(os.path.join(variants_folder, subfolder)):
+        subfolders.sort()
+        wkt_files += [os.path.join(folder, filename) for filename in sorted(filenames)
+                      if os.path.splitext(filename)[1] in wkt_extensions]
+
+    packed_files = []
+    for wkt_file, (geom, message) in zip(wkt_files, read_wkt_geometries(wkt_files, read_workers)):
+        if geom is None:
+            continue
+        entries[pack_key(variants_folder, wkt_file)] = bytes(geom.asWkb())
+        packed_files.append(wkt_file)
+
+    os.makedirs(variants_folder, exist_ok=True)
+    write_pack(output_path, entries)
+    if remove_loose:
+        for wkt_file in packed_files:
+            os.remove(wkt_file)
+    print(f"Packed {len(packed_files)} of {len(wkt_files)} variant geometries into {output_path}")
+    return {'packed': len(packed_files)}
+
+
+class VariantPacks:
+    """Looks variant WKT paths up in their subfolder's container.
+
+    ``geometry(path)`` returns None when there is no container or the path
+    is not in it, and the caller reads the loose file instead. Containers
+    are opened once and shared between reader threads.
+    """
+
+    def __init__(self):
+        self.packs = {}
+        self.lock = threading.Lock()
+
+    def pack(self, path):
+        with self.lock:
+            if path not in self.packs:
+                pack = None
+                if os.path.exists(path):
+                    try:
+                        pack = VariantPack(path)
+                    except (OSError, ValueError, struct.error) as e:
+                        print(f"Ignoring unreadable variant pack {path}: {e}")
+                self.packs[path] = pack
+            return self.packs[path]
+
+    def geometry(self, path):
+        variants_folder = variants_folder_of(path)
+        if variants_folder is None:
+            return None
+        key = pack_key(variants_folder, path)
+        pack = self.pack(pack_path(variants_folder, key.split('/')[0]))
+        if pack is None:
+            return None
+        wkb = pack.read(key)
+        if wkb is None:
+            return None
+        geom = QgsGeometry()
+        geom.fromWkb(wkb)
+        return geom
+
+    def close(self):
+        with self.lock:
+            for pack in self.packs.values():
+                if pack is not None:
+                    pack.close()
+            self.packs = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,99 @@
+import json
+import os
+import re
+
+image_extensions = ('.jpg', '.jpeg', '.png', '.tif', '.tiff')
+selection_policies = ['first', 'skip']
+
+
+class VariantSelector:
+    """Makes the ImagePicker/MultiImagePicker choices without a GUI.
+
+    Decisions are read from a JSON file of the form::
+
+        {
+            "roofs": {"<map folder>/<roof subfolder>": "<image file name>" or null},
+            "structures": {"<structure subfolder>": <variant index> or null}
+        }
+
+    where null skips the subfolder. Subfolders without a decision fall back
+    to ``policy``: ``first`` selects the first variant, ``skip`` none.
+    The selection files are written in the same format as the pickers do.
+    """
+
+    def __init__(self, policy='first', decisions_file=None):
+        if policy not in selection_policies:
+            raise ValueError(f"Unknown selection policy: {policy}")
+        self.policy = policy
+        self.decisions = {'roofs': {}, 'structures': {}}
+        if decisions_file:
+            with open(decisions_file, 'r') as f:
+                self.decisions.update(json.load(f))
+
+    def natural_sort_key(self, s):
+        return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)]
+
+    def list_images(self, folder, exclude=()):
+        return sorted([os.path.join(folder, f) for f in os.listdir(folder)
+                       if f.lower().endswith(image_extensions) and f.lower() not in exclude],
+                      key=self.natural_sort_key)
+
+    def list_subfolders(self, folder):
+        if not os.path.isdir(folder):
+            return []
+        return sorted([d for d in os.listdir(folder) if os.path.isdir(os.path.join(folder, d))],
+                      key=self.natural_sort_key)
+
+    def choose(self, images, decision_key, decisions):
+        if decision_key in decisions:
+            decision = decisions[decision_key]
+            if decision is None:
+                return None
+            if isinstance(decision, int):
+                return images[decision] if decision < len(images) else None
+            matches = [image for image in images if os.path.basename(image) == decision]
+            if not matches:
+                print(f"Decision '{decision}' for {decision_key} does not match any variant, skipping.")
+            return matches[0] if matches else None
+        if self.policy == 'first' and images:
+            return images[0]
+        return None
+
+    def select_roofs(self, root_folder):
+        selection_data = []
+        for map_folder in os.listdir(root_folder):
+            variants_roofs_folder = os.path.join(root_folder, map_folder, "variants", "roofs")
+            for roof_folder in self.list_subfolders(variants_roofs_folder):
+                images = self.list_images(os.path.join(variants_roofs_folder, roof_folder), exclude=('src.jpg',))
+                image_path = self.choose(images, f"{map_folder}/{roof_folder}", self.decisions['roofs'])
+                if image_path:
+                    selection_data.append({"map_folder": map_folder, "image_path": image_path})
+
+        self.save(os.path.join(root_folder, 'selection_results.json'), selection_data)
+
+    def select_structures(self, root_folder):
+        map_folders = sorted([os.path.join(root_folder, d) for d in os.listdir(root_folder)
+                              if os.path.isdir(os.path.join(root_folder, d))], key=self.natural_sort_key)
+        selection_data = []
+        if map_folders:
+            for subfolder in self.list_subfolders(os.path.join(map_folders[0], "variants", "structures")):
+                images_per_map = []
+                for map_folder in map_folders:
+                    structure_folder = os.path.join(map_folder, "variants", "structures", subfolder)
+                    images_per_map.append(self.list_images(structure_folder) if os.path.exists(structure_folder) else [])
+
+                longest = max(images_per_map, key=len)
+                chosen = self.choose(longest, subfolder, self.decisions['structures'])
+                if chosen is None:
+                    continue
+                index = longest.index(chosen)
+                for map_folder, images in zip(map_folders, images_per_map):
+                    if len(images) > index:
+                        selection_data.append({"map_folder": map_folder, "image_path": images[index]})
+
+        self.save(os.path.join(root_folder, 'structure_selection_results.json'), selection_data)
+
+    def save(self, json_path, selection_data):
+        with open(json_path, 'w') as f:
+            json.dump(selection_data, f, indent=4)
+        print(f"Selection saved to {json_path}")
@@ -0,0 +1,58 @@
+from qgis.core import (
+    QgsVectorLayer,
+    QgsFeatureRequest,
+    QgsGeometry,
+    QgsCoordinateTransform,
+    QgsProject,
+    QgsVectorFileWriter,
+    QgsCoordinateTransformContext
+)
+
+from .raster_clipper import default_raster_clip_margin
+
+
+class VectorClipper:
+    """Extracts the part of a large reference vector that covers a work region.
+
+    Candidates are fetched with a bounding box request, which OGR answers
+    from the source's spatial index (.qix, GeoPackage R-tree) when it has
+    one; each candidate is then tested against the region grown by
+    ``margin`` with a prepared geometry. Features are kept whole. The result
+    is written as a shapefile with its own .qix index.
+    """
+
+    def __init__(self, work_region_path, margin=default_raster_clip_margin):
+        region = QgsVectorLayer(work_region_path, 'work_region', 'ogr')
+        if not region.isValid():
+            raise ValueError(f"Cannot read work region {work_region_path}")
+        geometries = [feature.geometry() for feature in region.getFeatures() if feature.hasGeometry()]
+        self.region = QgsGeometry.unaryUnion(geometries).buffer(margin, 8)
+        self.region_crs = region.crs()
+
+    def clip(self, source_path, output_path):
+        source = QgsVectorLayer(source_path, 'reference', 'ogr')
+        if not source.isValid():
+            raise ValueError(f"Cannot read reference vector {source_path}")
+
+        region = QgsGeometry(self.region)
+        if source.crs().isValid() and source.crs() != self.region_crs:
+            region.transform(QgsCoordinateTransform(self.region_crs, source.crs(), QgsProject.instance()))
+        engine = QgsGeometry.createGeometryEngine(region.constGet())
+        engine.prepareGeometry()
+
+        request = QgsFeatureRequest().setFilterRect(region.boundingBox())
+        clipped = source.materialize(QgsFeatureRequest().setFilterFids(
+            [feature.id() for feature in source.getFeatures(request)
+             if feature.hasGeometry() and engine.intersects(feature.geometry().constGet())]))
+
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = "ESRI Shapefile"
+        error = QgsVectorFileWriter.writeAsVectorFormatV3(clipped, output_path, QgsCoordinateTransformContext(),
+                                                          options)
+        if error[0] != QgsVectorFileWriter.NoError:
+            raise RuntimeError(f"Error saving {output_path}: {error[1]}")
+
+        output = QgsVectorLayer(output_path, 'reference', 'ogr')
+        output.dataProvider().createSpatialIndex()
+        print(f"Clipped {source_path} to {clipped.featureCount()} features: {output_path}")
+        return {'features': clipped.featureCount()}
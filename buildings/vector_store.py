@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from qgis.core import (
+    QgsVectorLayer,
+    QgsVectorFileWriter,
+    QgsCoordinateTransformContext
+)
+
+from .stage_manifest import path_signature
+
+
+def source_fingerprint(source_path):
+    return hashlib.sha256(json.dumps([os.path.abspath(source_path),
+                                      path_signature(source_path)]).encode()).hexdigest()
+
+
+def settings_vector_store(settings):
+    """The store configured in the settings, None when ingestion is disabled."""
+    if not settings.value("ingest_reference_vector", True):
+        return None
+    return VectorStore(settings.value("vector_store_folder") or
+                       os.path.join(settings.value("result_folder"), ".vector_store"))
+
+
+class VectorStore:
+    """GeoPackage copies of large OSM vectors, shared by all work areas.
+
+    A source is ingested once into ``<folder>/<name>_<fingerprint>.gpkg``
+    with an R-tree spatial index, next to a JSON file recording the source
+    path and fingerprint (path, size and modification time of every
+    sidecar). A changed source gets a new fingerprint and therefore a new
+    copy; work areas pointing at a store copy are redirected to the current
+    one by ``resolve``.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def store_path(self, source_path):
+        name = os.path.splitext(os.path.basename(source_path))[0]
+        return os.path.join(self.folder, f"{name}_{source_fingerprint(source_path)[:16]}.gpkg")
+
+    def metadata_path(self, store_path):
+        return os.path.splitext(store_path)[0] + '.json'
+
+    def read_metadata(self, store_path):
+        metadata_path = self.metadata_path(store_path)
+        if not os.path.exists(metadata_path):
+            return None
+        with open(metadata_path, 'r') as f:
+            return json.load(f)
+
+    def is_ingested(self, store_path):
+        return os.path.exists(store_path) and self.read_metadata(store_path) is not None
+
+    def resolve(self, path):
+        """Returns (source path, store path) for a source or a store copy."""
+        metadata = self.read_metadata(path) if path.endswith('.gpkg') else None
+        if metadata is None:
+            return path, self.store_path(path)
+        source_path = metadata['source']
+        if not os.path.exists(source_path):
+            return source_path, path
+        return source_path, self.store_path(source_path)
+
+    def ingest(self, source_path, feedback=None):
+        store_path = self.store_path(source_path)
+        if self.is_ingested(store_path):
+            return store_path
+
+        source = QgsVectorLayer(source_path, 'reference', 'ogr')
+        if not source.isValid():
+            raise ValueError(f"Cannot read vector {source_path}")
+
+        os.makedirs(self.folder, exist_ok=True)
+        temp_path = f"{os.path.splitext(store_path)[0]}.{uuid.uuid4().hex}.tmp.gpkg"
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = "GPKG"
+        options.layerName = 'reference'
+        options.layerOptions = ['SPATIAL_INDEX=YES']
+        options.feedback = feedback
+        started = time.time()
+        error = QgsVectorFileWriter.writeAsVectorFormatV3(source, temp_path, QgsCoordinateTransformContext(), options)
+        if error[0] != QgsVectorFileWriter.NoError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise RuntimeError(f"Error ingesting {source_path}: {error[1]}")
+        os.replace(temp_path, store_path)
+
+        metadata = {
+            'source': os.path.abspath(source_path),
+            'fingerprint': source_fingerprint(source_path),
+            'features': source.featureCount(),
+            'crs': source.crs().authid(),
+            'ingested_at': time.time(),
+            'seconds': round(time.time() - started, 1),
+        }
+        with open(self.metadata_path(store_path), 'w') as f:
+            json.dump(metadata, f, indent=4)
+        print(f"Ingested {metadata['features']} features of {source_path} into {store_path}")
+        return store_path
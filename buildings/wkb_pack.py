@@ -0,0 +1,80 @@
+import json
+import os
+import struct
+import uuid
+
+# Each variants subfolder (roofs, structures) is packed into <variants folder>/<subfolder>.wkbpack.
+pack_suffix = '.wkbpack'
+pack_magic = b'RSAIWKB1'
+# Magic, index offset, index length.
+pack_header = struct.Struct('<8sQQ')
+wkt_extensions = ('.roof', '.proj', '.shade')
+
+
+def variants_folder_of(path):
+    """The ``variants`` folder a variant file lives in, or None."""
+    folder = os.path.dirname(os.path.abspath(path))
+    while True:
+        if os.path.basename(folder) == 'variants':
+            return folder
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            return None
+        folder = parent
+
+
+def pack_key(variants_folder, path):
+    return os.path.relpath(os.path.abspath(path), variants_folder).replace(os.sep, '/')
+
+
+def pack_path(variants_folder, subfolder):
+    """The container of the variants under ``variants_folder/subfolder``, written by the stage producing them."""
+    return os.path.join(variants_folder, subfolder + pack_suffix)
+
+
+class VariantPack:
+    """Reader for the geometry container of one subfolder of a map folder's variants.
+
+    The file holds the WKB of every packed variant back to back, followed
+    by a JSON index of ``{key: [offset, length]}`` where the key is the
+    WKT file's path relative to the variants folder. Reads use pread on
+    one descriptor, so threads can share a pack.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        try:
+            magic, index_offset, index_length = pack_header.unpack(os.pread(self.fd, pack_header.size, 0))
+            if magic != pack_magic:
+                raise ValueError(f"Not a variant geometry pack: {path}")
+            self.index = json.loads(os.pread(self.fd, index_length, index_offset))
+        except Exception:
+            os.close(self.fd)
+            raise
+
+    def read(self, key):
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        offset, length = entry
+        return os.pread(self.fd, length, offset)
+
+    def close(self):
+        os.close(self.fd)
+
+
+def write_pack(pack_path, entries):
+    temp_path = f"{pack_path}.{uuid.uuid4().hex}.tmp"
+    index = {}
+    with open(temp_path, 'wb') as f:
+        f.write(pack_header.pack(pack_magic, 0, 0))
+        for key, wkb in entries.items():
+            index[key] = [f.tell(), len(wkb)]
+            f.write(wkb)
+        index_offset = f.tell()
+        index_data = json.dumps(index).encode()
+        f.write(index_data)
+        f.seek(0)
+        f.write(pack_header.pack(pack_magic, index_offset, len(index_data)))
+    os.replace(temp_path, pack_path)
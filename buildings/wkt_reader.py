@@ -0,0 +1,54 @@
+import collections
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from qgis.core import QgsGeometry
+
+default_wkt_read_workers = 8
+
+
+def read_wkt_geometry(path, packs=None):
+    """Returns (geometry, None) or (None, message) for a variant WKT file.
+
+    With ``packs`` (VariantPacks) the geometry is taken from the map
+    folder's packed container when it is there, from the loose file
+    otherwise.
+    """
+    if packs is not None:
+        geom = packs.geometry(path)
+        if geom is not None:
+            return geom, None
+    if not os.path.exists(path):
+        return None, f"File does not exist: {path}"
+    try:
+        with open(path, 'r') as file:
+            wkt = file.read().strip()
+    except Exception as e:
+        return None, f"Error reading {path}: {e}"
+    geom = QgsGeometry.fromWkt(wkt)
+    if geom.isNull():
+        return None, f"Invalid geometry: {wkt}"
+    return geom, None
+
+
+def read_wkt_geometries(paths, max_workers=default_wkt_read_workers, packs=None):
+    """Reads and parses WKT files on a thread pool, yielding (geometry, message) in the order of ``paths``.
+
+    File opens overlap, which is what matters on network-mounted result
+    folders. At most ``4 * max_workers`` files are in flight, so memory
+    stays bounded however many variants are selected. Results are consumed
+    on the calling thread.
+    """
+    if max_workers <= 1:
+        for path in paths:
+            yield read_wkt_geometry(path, packs)
+        return
+
+    in_flight = collections.deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for path in paths:
+            if len(in_flight) >= 4 * max_workers:
+                yield in_flight.popleft().result()
+            in_flight.append(executor.submit(read_wkt_geometry, path, packs))
+        while in_flight:
+            yield in_flight.popleft().result()
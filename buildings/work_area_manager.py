@@ -2,9 +2,9 @@ import json
 import os
 
 class WorkAreaManager:
-    def __init__(self, plugin_dir):
+    def __init__(self, plugin_dir, data_file=None):
         self.plugin_dir = plugin_dir
-        self.data_file = os.path.join(plugin_dir, 'work_areas.json')
+        self.data_file = data_file or os.path.join(plugin_dir, 'work_areas.json')
         self.work_areas = []
 
         if not os.path.exists(plugin_dir):
@@ -3,49 +3,8 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtWidgets import QDialog, QVBoxLayout, QPushButton, QListWidget, QListWidgetItem, QWidget, QLabel, \
     QHBoxLayout
 from .create_work_area_dialog import CreateWorkAreaDialog
+from .work_area import WorkArea
 from .work_area_manager import WorkAreaManager
-import uuid
-
-
-class WorkArea:
-    def __init__(self, id=None, name="", image_path=None, vector_path=None, work_mode="Manual", work_area="",
-                 vectors="", use_segment_anything=False, predict=False):
-        self.id = id if id else str(uuid.uuid4())
-        self.name = name
-        self.image_path = image_path if image_path else []
-        self.vector_path = vector_path if vector_path else []
-        self.work_mode = work_mode
-        self.work_area = work_area
-        self.vectors = vectors
-        self.use_segment_anything = use_segment_anything
-        self.predict = predict
-
-    @staticmethod
-    def from_dict(data):
-        return WorkArea(
-            id=data.get("id"),
-            name=data.get("name"),
-            image_path=data.get("image_path"),
-            vector_path=data.get("vector_path"),
-            work_mode=data.get("work_mode"),
-            work_area=data.get("work_area"),
-            vectors=data.get("vectors"),
-            use_segment_anything=data.get("use_segment_anything"),
-            predict=data.get("predict")
-        )
-
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "image_path": self.image_path,
-            "vector_path": self.vector_path,
-            "work_mode": self.work_mode,
-            "work_area": self.work_area,
-            "vectors": self.vectors,
-            "use_segment_anything": self.use_segment_anything,
-            "predict": self.predict
-        }
 
 
 class Ui_WorkAreasDialog(object):
@@ -0,0 +1,172 @@
+import os
+from datetime import datetime
+
+from PyQt5 import QtCore
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QListWidget, QListWidgetItem, QPushButton, \
+    QSpinBox, QTableWidget, QTableWidgetItem, QAbstractItemView, QHeaderView
+
+from .batch_queue import default_batch_max_concurrent
+from .work_area_manager import WorkAreaManager
+
+
+class Ui_BatchQueueDialog(object):
+    def setupUi(self, BatchQueueDialog):
+        BatchQueueDialog.setObjectName("BatchQueueDialog")
+        BatchQueueDialog.setFixedSize(600, 520)
+
+        self.verticalLayout = QVBoxLayout(BatchQueueDialog)
+        self.verticalLayout.setObjectName("verticalLayout")
+
+        self.labelWorkAreas = QLabel("Saved work areas:", BatchQueueDialog)
+        self.verticalLayout.addWidget(self.labelWorkAreas)
+
+        self.listWidgetWorkAreas = QListWidget(BatchQueueDialog)
+        self.listWidgetWorkAreas.setObjectName("listWidgetWorkAreas")
+        self.listWidgetWorkAreas.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.verticalLayout.addWidget(self.listWidgetWorkAreas)
+
+        self.horizontalLayoutEnqueue = QHBoxLayout()
+        self.labelPriority = QLabel("Priority:", BatchQueueDialog)
+        self.horizontalLayoutEnqueue.addWidget(self.labelPriority)
+        self.spinBoxPriority = QSpinBox(BatchQueueDialog)
+        self.spinBoxPriority.setObjectName("spinBoxPriority")
+        self.spinBoxPriority.setRange(-100, 100)
+        self.horizontalLayoutEnqueue.addWidget(self.spinBoxPriority)
+        self.pushButtonEnqueue = QPushButton("Enqueue selected", BatchQueueDialog)
+        self.horizontalLayoutEnqueue.addWidget(self.pushButtonEnqueue)
+        self.pushButtonSetPriority = QPushButton("Set priority of queued", BatchQueueDialog)
+        self.horizontalLayoutEnqueue.addWidget(self.pushButtonSetPriority)
+        self.verticalLayout.addLayout(self.horizontalLayoutEnqueue)
+
+        self.labelQueue = QLabel("Queue:", BatchQueueDialog)
+        self.verticalLayout.addWidget(self.labelQueue)
+
+        self.tableWidgetQueue = QTableWidget(0, 5, BatchQueueDialog)
+        self.tableWidgetQueue.setObjectName("tableWidgetQueue")
+        self.tableWidgetQueue.setHorizontalHeaderLabels(["Work area", "Priority", "Status", "Finished", "Message"])
+        self.tableWidgetQueue.horizontalHeader().setSectionResizeMode(4, QHeaderView.Stretch)
+        self.tableWidgetQueue.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.tableWidgetQueue.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.verticalLayout.addWidget(self.tableWidgetQueue)
+
+        self.horizontalLayoutConcurrent = QHBoxLayout()
+        self.labelMaxConcurrent = QLabel("Work areas run at once:", BatchQueueDialog)
+        self.horizontalLayoutConcurrent.addWidget(self.labelMaxConcurrent)
+        self.spinBoxMaxConcurrent = QSpinBox(BatchQueueDialog)
+        self.spinBoxMaxConcurrent.setObjectName("spinBoxMaxConcurrent")
+        self.spinBoxMaxConcurrent.setRange(1, 16)
+        self.horizontalLayoutConcurrent.addWidget(self.spinBoxMaxConcurrent)
+        self.verticalLayout.addLayout(self.horizontalLayoutConcurrent)
+
+        self.horizontalLayoutButtons = QHBoxLayout()
+        self.pushButtonStart = QPushButton("Start", BatchQueueDialog)
+        self.pushButtonPause = QPushButton("Pause", BatchQueueDialog)
+        self.pushButtonCancel = QPushButton("Cancel", BatchQueueDialog)
+        self.pushButtonRetry = QPushButton("Retry", BatchQueueDialog)
+        self.pushButtonRemove = QPushButton("Remove", BatchQueueDialog)
+        self.pushButtonClearFinished = QPushButton("Clear finished", BatchQueueDialog)
+        for button in [self.pushButtonStart, self.pushButtonPause, self.pushButtonCancel, self.pushButtonRetry,
+                       self.pushButtonRemove, self.pushButtonClearFinished]:
+            self.horizontalLayoutButtons.addWidget(button)
+        self.verticalLayout.addLayout(self.horizontalLayoutButtons)
+
+        BatchQueueDialog.setWindowTitle("Batch queue")
+        QtCore.QMetaObject.connectSlotsByName(BatchQueueDialog)
+
+
+class BatchQueueDialog(QDialog):
+    def __init__(self, batch_queue, settings, parent=None):
+        super().__init__(parent)
+        self.ui = Ui_BatchQueueDialog()
+        self.ui.setupUi(self)
+        self.batch_queue = batch_queue
+        self.settings = settings
+        self.work_area_manager = WorkAreaManager(os.path.dirname(__file__))
+
+        self.ui.spinBoxMaxConcurrent.setValue(int(self.settings.value('batch_max_concurrent',
+                                                                      default_batch_max_concurrent)))
+        self.ui.spinBoxMaxConcurrent.valueChanged.connect(self.save_max_concurrent)
+        self.ui.pushButtonEnqueue.clicked.connect(self.enqueue_selected)
+        self.ui.pushButtonSetPriority.clicked.connect(self.set_priority)
+        self.ui.pushButtonStart.clicked.connect(self.batch_queue.start)
+        self.ui.pushButtonPause.clicked.connect(self.batch_queue.pause)
+        self.ui.pushButtonCancel.clicked.connect(lambda: self.for_selected_items(self.batch_queue.cancel))
+        self.ui.pushButtonRetry.clicked.connect(lambda: self.for_selected_items(self.batch_queue.retry))
+        self.ui.pushButtonRemove.clicked.connect(lambda: self.for_selected_items(self.batch_queue.remove))
+        self.ui.pushButtonClearFinished.clicked.connect(self.batch_queue.remove_finished)
+
+        # Progress of running items is not reported as a queue change.
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.update_queue_table)
+        self.timer.start(1000)
+
+        self.batch_queue.listeners.append(self.update_queue_table)
+        self.finished.connect(self.detach)
+        self.update_work_area_list()
+        self.update_queue_table()
+
+    def detach(self):
+        self.timer.stop()
+        if self.update_queue_table in self.batch_queue.listeners:
+            self.batch_queue.listeners.remove(self.update_queue_table)
+
+    def save_max_concurrent(self, value):
+        self.settings.setValue('batch_max_concurrent', value)
+        self.batch_queue.schedule()
+
+    def update_work_area_list(self):
+        self.ui.listWidgetWorkAreas.clear()
+        for work_area_data in self.work_area_manager.get_all_work_areas():
+            item = QListWidgetItem(work_area_data.get("name", "Unnamed Work Area"))
+            item.setData(QtCore.Qt.UserRole, work_area_data["id"])
+            self.ui.listWidgetWorkAreas.addItem(item)
+
+    def enqueue_selected(self):
+        for list_item in self.ui.listWidgetWorkAreas.selectedItems():
+            work_area_data = self.work_area_manager.get_work_area(list_item.data(QtCore.Qt.UserRole))
+            if work_area_data:
+                self.batch_queue.enqueue(work_area_data, self.ui.spinBoxPriority.value())
+
+    def selected_item_ids(self):
+        rows = sorted({index.row() for index in self.ui.tableWidgetQueue.selectionModel().selectedRows()})
+        return [self.ui.tableWidgetQueue.item(row, 0).data(QtCore.Qt.UserRole) for row in rows]
+
+    def for_selected_items(self, action):
+        for item_id in self.selected_item_ids():
+            action(item_id)
+
+    def set_priority(self):
+        for item_id in self.selected_item_ids():
+            self.batch_queue.set_priority(item_id, self.ui.spinBoxPriority.value())
+
+    def status_text(self, item):
+        task = self.batch_queue.tasks.get(item['id'])
+        if item['status'] == 'running' and task is not None:
+            return f"running {task.progress():.0f}%"
+        return item['status']
+
+    def update_queue_table(self):
+        selected = set(self.selected_item_ids())
+        items = [item for item in self.batch_queue.items if item['status'] == 'running'] + \
+            self.batch_queue.pending_items() + \
+            [item for item in self.batch_queue.items if item['status'] not in ('running', 'pending')]
+
+        table = self.ui.tableWidgetQueue
+        table.clearSelection()
+        table.setRowCount(len(items))
+        for row, item in enumerate(items):
+            finished_at = datetime.fromtimestamp(item['finished_at']).strftime('%H:%M:%S') \
+                if item['finished_at'] else ''
+            values = [item['name'], str(item['priority']), self.status_text(item), finished_at, item['message']]
+            for column, value in enumerate(values):
+                table_item = QTableWidgetItem(value)
+                table_item.setToolTip(value)
+                table.setItem(row, column, table_item)
+            table.item(row, 0).setData(QtCore.Qt.UserRole, item['id'])
+            if item['id'] in selected:
+                table.selectionModel().select(table.model().index(row, 0),
+                                              QtCore.QItemSelectionModel.Select | QtCore.QItemSelectionModel.Rows)
+
+        state = "running" if self.batch_queue.active else "paused"
+        self.ui.labelQueue.setText(f"Queue ({state}, {self.batch_queue.running_count()} running, "
+                                   f"{len(self.batch_queue.pending_items())} pending):")
@@ -1,13 +1,18 @@
 import os
-import subprocess
 from PyQt5 import QtCore, QtGui
-from PyQt5.QtWidgets import QDialog, QFileDialog, QVBoxLayout, QLabel, QLineEdit, QPushButton, QHBoxLayout, QMessageBox
-from qgis.core import QgsRasterLayer, QgsVectorLayer, QgsProject
+from PyQt5.QtCore import QCoreApplication
+from PyQt5.QtWidgets import QDialog, QFileDialog, QVBoxLayout, QLabel, QLineEdit, QPushButton, QHBoxLayout, \
+    QMessageBox, QProgressDialog
+from qgis.core import QgsRasterLayer, QgsVectorLayer, QgsProject, QgsMessageLog, Qgis
 
 from .draw_work_region_tool import DrawWorkRegionTool
 from .json_settings import JsonSettings
+from .detector_runner import DetectorRunner
+from .process_runner import CommandFailed, CommandCanceled
 from .work_area_manager import WorkAreaManager
 
+LOG_TAG = 'Greenery AI Detector'
+
 
 class Ui_CreateWorkAreaDialog(object):
     def setupUi(self, CreateWorkAreaDialog):
@@ -217,61 +222,42 @@ class CreateWorkAreaDialog(QDialog):
             return
 
         self.save_work_area()
-        self.delete_old_shapefiles()
-        self.run_console_command()
+        if not self.run_console_command():
+            return
         self.load_shapefile()
         self.accept()
 
-    def delete_old_shapefiles(self):
-        shapefiles = ['green']
-        for shapefile in shapefiles:
-            base_path = os.path.join(self.settings.value('result_folder'), self.work_area.name, shapefile)
-            for ext in ['.shp', '.shx', '.dbf', '.prj', '.cpg']:
-                file_path = base_path + ext
-                if os.path.exists(file_path):
-                    try:
-                        os.remove(file_path)
-                        print(f"Deleted {file_path}")
-                    except OSError as e:
-                        print(f"Error deleting {file_path}: {e}")
-
     def run_console_command(self):
-        not_empty_images_paths = [path for path in self.images_paths if path]
-        work_area_folder = os.path.join (self.settings.value('result_folder'), self.work_area.name)
-
-        # Define the command to activate the Conda environment and run the script
-        conda_activate_command = 'source ~/anaconda3/bin/activate'
-        activate_env_command = 'conda activate open_rsai_detectors'
-        deactivate_env_command = 'conda deactivate'
-        script_path = f"{self.settings.value('python_script')}"
-        script_args = [
-            f"{work_area_folder}",
-            f"{self.settings.value('weights')}",
-            f"{self.work_area.work_area_path}",
-            f"{' '.join(not_empty_images_paths)}"
-        ]
-
-        # Build the command to run
-        command = f'{conda_activate_command} && {activate_env_command} && python {" ".join([script_path] + script_args)} && {deactivate_env_command}'
-
-        # Use subprocess to run the command
-        process = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=True,
-            executable='/bin/bash'
+        progress_dialog = QProgressDialog("Running detector...", "Cancel", 0, 0, self)
+        progress_dialog.setWindowTitle("Greenery AI Detector")
+        progress_dialog.setWindowModality(QtCore.Qt.WindowModal)
+        progress_dialog.show()
+
+        def show_progress(percent):
+            progress_dialog.setMaximum(100)
+            progress_dialog.setValue(int(percent))
+
+        detector = DetectorRunner(
+            self.settings,
+            on_line=lambda stream, line: QgsMessageLog.logMessage(
+                line, LOG_TAG, Qgis.Warning if stream == 'stderr' else Qgis.Info),
+            on_progress=show_progress,
+            on_poll=QCoreApplication.processEvents,
+            should_cancel=progress_dialog.wasCanceled
         )
-
-        # Communicate with the subprocess to get the output and errors
-        stdout, stderr = process.communicate()
-
-        if process.returncode != 0:
-            print(f'Error: {stderr.decode().strip()}')
-        else:
-            print(f'Output: {stdout.decode().strip()}')
-
-        print("console_command", command)
+        try:
+            detector.run(self.work_area)
+        except CommandCanceled:
+            print("Detector run canceled.")
+            return False
+        except CommandFailed as e:
+            print(f'Error: {e.result.stderr()}')
+            QMessageBox.critical(self, "Detector Error",
+                                 f"{e}\n\n" + "\n".join(e.result.stderr_tail[-20:]))
+            return False
+        finally:
+            progress_dialog.close()
+        return True
 
     def load_shapefile(self):
         result_folder = os.path.join(self.settings.value('result_folder'), self.work_area.name)
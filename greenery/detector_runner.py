@@ -0,0 +1,394 @@
+import collections
+import hashlib
+import json
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+
+from .conda_environment import CondaEnvironment
+from .process_runner import ProcessRunner, ProcessResult, CommandFailed, CommandCanceled, parse_progress
+from .shard_merge import merge_shapefiles, merged_layer, dissolve_polygons, save_shapefile
+
+result_name = 'green'
+shapefile_extensions = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
+default_worker_idle_timeout = 1800
+default_worker_start_timeout = 300
+# How long a canceled worker job is waited for to stop.
+default_worker_cancel_timeout = 30
+# Worker jobs write here and their outputs are moved into the work area once they finish.
+worker_jobs_folder = '.worker_jobs'
+default_detector_shards = 1
+default_shard_memory_mb = 4096
+
+
+def available_memory_mb():
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+class WorkerUnavailable(Exception):
+    pass
+
+
+class DetectorRunner:
+    """Builds and runs the detector command for a work area.
+
+    Used by CreateWorkAreaDialog and by the batch queue, so interactive and
+    unattended runs produce the same results. ``runner_options`` are passed
+    to ProcessRunner (callbacks, timeouts).
+
+    With the ``detector_worker`` setting, jobs go to a resident worker
+    (detector_worker.py) that keeps the script and its weights loaded; one
+    worker is started per script and weights file and exits after
+    ``detector_worker_idle_timeout`` seconds without a job. When the worker
+    cannot be started or reached, the one-shot command is run instead.
+    A worker job writes to its own folder under ``<work area>/.worker_jobs``
+    and its outputs are moved into the work area only when it succeeds, so
+    a canceled job still running in the worker cannot touch the results of
+    a rerun.
+    Both exec the conda environment's interpreter directly, see
+    CondaEnvironment.
+
+    With ``detector_shards`` above 1 the images are split across that many
+    one-shot detector processes, limited by the CPU count and by the
+    available memory divided by ``detector_shard_memory_mb``. Each shard
+    writes to ``<work area>/shards/<n>`` and the per-shard results are
+    merged into the work area's result layer, dissolving polygons split
+    between shards. ``dissolve_results`` dissolves single-process results too.
+    """
+
+    def __init__(self, settings, **runner_options):
+        self.settings = settings
+        self.runner_options = runner_options
+        self.poll_interval = runner_options.get('poll_interval', 0.1)
+        self.environment = CondaEnvironment(settings, runner_options)
+
+    def work_area_folder(self, work_area):
+        return os.path.join(self.settings.value('result_folder'), work_area.name)
+
+    def result_path(self, work_area):
+        return os.path.join(self.work_area_folder(work_area), result_name + '.shp')
+
+    def images_paths(self, work_area):
+        return [path for path in work_area.images_paths if path]
+
+    def command(self, work_area, output_folder=None, images_paths=None):
+        script_path = f"{self.settings.value('python_script')}"
+        script_args = [
+            f"{output_folder or self.work_area_folder(work_area)}",
+            f"{self.settings.value('weights')}",
+            f"{work_area.work_area_path}",
+        ] + (self.images_paths(work_area) if images_paths is None else images_paths)
+        return [self.environment.python(), script_path] + script_args
+
+    def worker_socket_path(self):
+        # Unix socket paths are limited to ~100 characters, so they live in the temp folder.
+        key = hashlib.sha256(json.dumps([os.path.abspath(self.settings.value('python_script')),
+                                         os.path.abspath(self.settings.value('weights'))]).encode()).hexdigest()
+        return os.path.join(tempfile.gettempdir(), f"open_rsai_{result_name}_{key[:16]}.sock")
+
+    def worker_command(self, socket_path):
+        worker_script = os.path.join(os.path.dirname(__file__), 'detector_worker.py')
+        idle_timeout = self.settings.value('detector_worker_idle_timeout', default_worker_idle_timeout)
+        return [self.environment.python(), worker_script,
+                '--socket', socket_path,
+                '--script', self.settings.value('python_script'),
+                '--weights', self.settings.value('weights'),
+                '--idle-timeout', str(idle_timeout)]
+
+    def should_cancel(self):
+        should_cancel = self.runner_options.get('should_cancel')
+        return should_cancel is not None and should_cancel()
+
+    def poll(self):
+        on_poll = self.runner_options.get('on_poll')
+        if on_poll:
+            on_poll()
+
+    def connect_worker(self, socket_path):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(socket_path)
+        except OSError:
+            connection.close()
+            return None
+        return connection
+
+    def start_worker(self, socket_path):
+        log_path = os.path.splitext(socket_path)[0] + '.log'
+        print(f"Starting detector worker, log: {log_path}")
+        with open(log_path, 'a') as log:
+            process = subprocess.Popen(self.worker_command(socket_path), env=self.environment.variables(),
+                                       stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                                       start_new_session=True)
+        start_timeout = float(self.settings.value('detector_worker_start_timeout', default_worker_start_timeout))
+        started = time.monotonic()
+        while time.monotonic() - started < start_timeout:
+            connection = self.connect_worker(socket_path)
+            if connection is not None:
+                return connection
+            if process.poll() is not None:
+                raise WorkerUnavailable(f"Detector worker exited with code {process.returncode}, see {log_path}")
+            if self.should_cancel():
+                raise CommandCanceled("Detector worker start canceled")
+            self.poll()
+            time.sleep(self.poll_interval)
+        raise WorkerUnavailable(f"Detector worker did not start in {start_timeout:.0f} s, see {log_path}")
+
+    def request_worker(self, connection, request):
+        """Sends a request and yields the worker's messages; raises WorkerUnavailable if it goes away."""
+        connection.settimeout(self.poll_interval)
+        connection.sendall((json.dumps(request) + '\n').encode())
+        pending = b''
+        while True:
+            try:
+                data = connection.recv(65536)
+            except socket.timeout:
+                yield None
+                continue
+            except OSError as e:
+                raise WorkerUnavailable(f"Lost the detector worker: {e}")
+            if not data:
+                raise WorkerUnavailable("The detector worker closed the connection before finishing the job")
+            pending += data
+            while b'\n' in pending:
+                line, pending = pending.split(b'\n', 1)
+                yield json.loads(line)
+
+    def move_job_outputs(self, job_folder, output_folder):
+        for name in os.listdir(job_folder):
+            target = os.path.join(output_folder, name)
+            if os.path.isdir(target) and not os.path.islink(target):
+                shutil.rmtree(target)
+            os.replace(os.path.join(job_folder, name), target)
+        self.discard_job_folder(job_folder)
+
+    def discard_job_folder(self, job_folder):
+        shutil.rmtree(job_folder, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(job_folder))
+        except OSError:
+            pass
+
+    def run_in_worker(self, work_area):
+        socket_path = self.worker_socket_path()
+        connection = self.connect_worker(socket_path) or self.start_worker(socket_path)
+        description = f"detector worker {socket_path}: {work_area.name}"
+        jobs_folder = os.path.join(self.work_area_folder(work_area), worker_jobs_folder)
+        # Left by canceled jobs; a worker still running one only writes into its own folder.
+        shutil.rmtree(jobs_folder, ignore_errors=True)
+        job_folder = os.path.join(jobs_folder, uuid.uuid4().hex)
+        os.makedirs(job_folder)
+        request = {
+            'command': 'detect',
+            'output_folder': job_folder,
+            'work_area': work_area.work_area_path,
+            'images': self.images_paths(work_area),
+        }
+        tail_size = self.runner_options.get('tail_size', 500)
+        tails = {
+            'stdout': collections.deque(maxlen=tail_size),
+            'stderr': collections.deque(maxlen=tail_size),
+        }
+        on_line = self.runner_options.get('on_line')
+        on_progress = self.runner_options.get('on_progress')
+        cancel_timeout = float(self.settings.value('detector_worker_cancel_timeout', default_worker_cancel_timeout))
+        canceled_at = None
+        print("detector_worker", description)
+        try:
+            with connection:
+                for message in self.request_worker(connection, request):
+                    if canceled_at is None and self.should_cancel():
+                        canceled_at = time.monotonic()
+                        connection.sendall((json.dumps({'command': 'cancel'}) + '\n').encode())
+                    if canceled_at is not None and time.monotonic() - canceled_at > cancel_timeout:
+                        print(f"The detector worker did not stop the canceled job in {cancel_timeout:.0f} s, "
+                              f"its output stays in {job_folder}")
+                        raise CommandCanceled(f"Command canceled: {description}")
+                    self.poll()
+                    if message is None:
+                        continue
+                    if 'status' in message:
+                        if message['status'] == 'canceled' or canceled_at is not None:
+                            self.discard_job_folder(job_folder)
+                            raise CommandCanceled(f"Command canceled: {description}")
+                        result = ProcessResult(description, 0 if message['status'] == 'ok' else 1,
+                                               list(tails['stdout']), list(tails['stderr']))
+                        if result.returncode != 0:
+                            raise CommandFailed(result)
+                        self.move_job_outputs(job_folder, self.work_area_folder(work_area))
+                        return result
+                    stream, line = message['stream'], message['line']
+                    tails[stream].append(line)
+                    if on_line:
+                        on_line(stream, line)
+                    percent = parse_progress(line)
+                    if percent is not None and on_progress:
+                        on_progress(percent)
+        except (WorkerUnavailable, CommandFailed):
+            self.discard_job_folder(job_folder)
+            raise
+
+    def stop_worker(self):
+        connection = self.connect_worker(self.worker_socket_path())
+        if connection is None:
+            return
+        with connection:
+            connection.sendall((json.dumps({'command': 'shutdown'}) + '\n').encode())
+
+    def delete_old_shapefiles(self, work_area):
+        base_path = os.path.join(self.work_area_folder(work_area), result_name)
+        for ext in shapefile_extensions:
+            file_path = base_path + ext
+            if os.path.exists(file_path):
+                try:
+                    os.remove(file_path)
+                    print(f"Deleted {file_path}")
+                except OSError as e:
+                    print(f"Error deleting {file_path}: {e}")
+
+    def shard_count(self, images_paths):
+        count = min(int(self.settings.value('detector_shards', default_detector_shards) or 1),
+                    len(images_paths), os.cpu_count() or 1)
+        shard_memory = int(self.settings.value('detector_shard_memory_mb', default_shard_memory_mb) or 0)
+        available = available_memory_mb()
+        if shard_memory > 0 and available is not None:
+            count = min(count, available // shard_memory)
+        return max(count, 1)
+
+    def split_images(self, images_paths, count):
+        """Spreads the images over ``count`` shards, largest first, balancing total file size."""
+        def size(path):
+            try:
+                return os.path.getsize(path)
+            except OSError:
+                return 0
+
+        shards = [[] for _ in range(count)]
+        totals = [0] * count
+        for path in sorted(images_paths, key=size, reverse=True):
+            smallest = totals.index(min(totals))
+            shards[smallest].append(path)
+            totals[smallest] += size(path)
+        # Keep the work area's image order within a shard.
+        return [sorted(shard, key=images_paths.index) for shard in shards if shard]
+
+    def run_sharded(self, work_area, shards):
+        shards_folder = os.path.join(self.work_area_folder(work_area), 'shards')
+        if os.path.isdir(shards_folder):
+            shutil.rmtree(shards_folder)
+        env = self.environment.variables()
+        if 'OMP_NUM_THREADS' not in env:
+            # Keep the shards from oversubscribing the cores between them.
+            env['OMP_NUM_THREADS'] = str(max((os.cpu_count() or 1) // len(shards), 1))
+
+        stop = threading.Event()
+        messages = queue.Queue()
+        progress = [0.0] * len(shards)
+        results = [None] * len(shards)
+        failures = []
+
+        def run_shard(index, output_folder, images_paths):
+            os.makedirs(output_folder, exist_ok=True)
+            command = self.command(work_area, output_folder, images_paths)
+            runner = ProcessRunner(on_line=lambda stream, line: messages.put((index, stream, line)),
+                                   on_progress=lambda percent: progress.__setitem__(index, percent),
+                                   should_cancel=stop.is_set,
+                                   stall_timeout=self.runner_options.get('stall_timeout', 600))
+            try:
+                results[index] = runner.run(command, shell=False, env=env, check=True)
+            except CommandCanceled:
+                pass
+            except Exception as e:
+                failures.append(e)
+                stop.set()
+
+        output_folders = [os.path.join(shards_folder, str(index)) for index in range(len(shards))]
+        threads = [threading.Thread(target=run_shard, args=(index, output_folders[index], shard), daemon=True)
+                   for index, shard in enumerate(shards)]
+        print(f"Running the detector in {len(shards)} shards: {shards}")
+        for thread in threads:
+            thread.start()
+
+        on_line = self.runner_options.get('on_line')
+        on_progress = self.runner_options.get('on_progress')
+        canceled = False
+        while any(thread.is_alive() for thread in threads) or not messages.empty():
+            if not canceled and self.should_cancel():
+                canceled = True
+                stop.set()
+            try:
+                index, stream, line = messages.get(timeout=self.poll_interval)
+                if on_line:
+                    on_line(stream, f"[shard {index}] {line}")
+            except queue.Empty:
+                pass
+            if on_progress:
+                on_progress(sum(progress) / len(progress))
+            self.poll()
+
+        if failures:
+            raise failures[0]
+        if canceled:
+            raise CommandCanceled(f"Sharded detector run canceled: {work_area.name}")
+
+        count = merge_shapefiles([os.path.join(folder, result_name + '.shp') for folder in output_folders],
+                                 self.result_path(work_area), dissolve=True)
+        if count is None:
+            print(f"No shard produced {result_name}.shp")
+        else:
+            print(f"Merged {count} features from {len(shards)} shards into {self.result_path(work_area)}")
+            shutil.rmtree(shards_folder)
+        return ProcessResult(f"{len(shards)} detector shards: {work_area.name}", 0,
+                             [line for result in results for line in result.stdout_tail],
+                             [line for result in results for line in result.stderr_tail])
+
+    def run_single(self, work_area):
+        if self.settings.value('detector_worker', False):
+            try:
+                return self.run_in_worker(work_area)
+            except WorkerUnavailable as e:
+                print(f"{e}; running the detector command instead")
+                self.delete_old_shapefiles(work_area)
+        command = self.command(work_area)
+        print("console_command", ' '.join(command))
+        result = ProcessRunner(**self.runner_options).run(command, shell=False, env=self.environment.variables(),
+                                                          check=True)
+        print(f'Output: {result.stdout()}')
+        return result
+
+    def dissolve_result(self, work_area):
+        layer = merged_layer([self.result_path(work_area)])
+        if layer is None:
+            return
+        dissolved = dissolve_polygons(layer)
+        del layer
+        self.delete_old_shapefiles(work_area)
+        save_shapefile(dissolved, self.result_path(work_area))
+
+    def run(self, work_area):
+        """Runs the detector, raises CommandFailed or CommandCanceled."""
+        self.delete_old_shapefiles(work_area)
+        images_paths = self.images_paths(work_area)
+        shard_count = self.shard_count(images_paths)
+        if shard_count > 1:
+            return self.run_sharded(work_area, self.split_images(images_paths, shard_count))
+        result = self.run_single(work_area)
+        if self.settings.value('dissolve_results', False):
+            self.dissolve_result(work_area)
+        return result
@@ -0,0 +1,75 @@
+import threading
+import traceback
+
+from qgis.PyQt.QtCore import pyqtSignal
+from qgis.core import QgsTask, QgsMessageLog, Qgis
+
+LOG_TAG = 'Greenery AI Detector'
+
+
+class PipelineTask(QgsTask):
+    """Runs a group of pipeline stages off the GUI thread.
+
+    ``function`` receives the task itself and reports stages through
+    ``begin_stage``/``end_stage``. ``on_finished(result, exception)`` is called
+    on the main thread once the task completes, fails or is canceled.
+    """
+
+    stageStarted = pyqtSignal(str)
+
+    def __init__(self, description, function, on_finished, stage_count=1):
+        super().__init__(description, QgsTask.CanCancel)
+        self.function = function
+        self.on_finished = on_finished
+        self.stage_count = max(stage_count, 1)
+        self.stages_done = 0
+        self.stages_lock = threading.Lock()
+        self.stage_fractions = {}
+        self.current = threading.local()
+        self.exception = None
+
+    def begin_stage(self, name):
+        self.current.stage = name
+        with self.stages_lock:
+            self.stage_fractions[name] = 0.0
+        QgsMessageLog.logMessage(f"{self.description()}: {name}", LOG_TAG, Qgis.Info)
+        self.stageStarted.emit(name)
+
+    def stage_progress(self, percent):
+        name = getattr(self.current, 'stage', None)
+        with self.stages_lock:
+            if name not in self.stage_fractions:
+                return
+            self.stage_fractions[name] = percent / 100.0
+        self.update_progress()
+
+    def log_output(self, stream, line):
+        name = getattr(self.current, 'stage', None)
+        level = Qgis.Warning if stream == 'stderr' else Qgis.Info
+        QgsMessageLog.logMessage(f"[{name}] {line}", LOG_TAG, level)
+
+    def end_stage(self):
+        name = getattr(self.current, 'stage', None)
+        with self.stages_lock:
+            self.stage_fractions.pop(name, None)
+            self.stages_done += 1
+        self.current.stage = None
+        self.update_progress()
+
+    def update_progress(self):
+        with self.stages_lock:
+            done = self.stages_done + sum(self.stage_fractions.values())
+        self.setProgress(min(100.0 * done / self.stage_count, 100.0))
+
+    def run(self):
+        try:
+            self.function(self)
+        except Exception as e:
+            if not self.isCanceled():
+                self.exception = e
+                QgsMessageLog.logMessage(traceback.format_exc(), LOG_TAG, Qgis.Critical)
+            return False
+        return not self.isCanceled()
+
+    def finished(self, result):
+        self.on_finished(result, self.exception)
@@ -0,0 +1,27 @@
+class DisjointSets:
+    """Union-find over the indexes ``0 .. size - 1``, with path halving."""
+
+    def __init__(self, size):
+        self.parents = list(range(size))
+
+    def find(self, i):
+        parents = self.parents
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    def union(self, i, j):
+        """Joins the sets of ``i`` and ``j``; returns False when they were already one set."""
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i == root_j:
+            return False
+        self.parents[root_j] = root_i
+        return True
+
+    def groups(self):
+        """The sets as lists of indexes, in order of their smallest index."""
+        groups = {}
+        for i in range(len(self.parents)):
+            groups.setdefault(self.find(i), []).append(i)
+        return list(groups.values())
@@ -1,33 +1,9 @@
 import os
 from PyQt5 import QtCore, QtWidgets
 from PyQt5.QtWidgets import QDialog, QVBoxLayout, QPushButton, QListWidget, QListWidgetItem, QWidget, QLabel, QHBoxLayout
-import uuid
 from .work_area_manager import WorkAreaManager
 from .create_work_area_dialog import CreateWorkAreaDialog
-
-class WorkArea:
-    def __init__(self, id=None, name="", images_paths=None, work_area_path=""):
-        self.id = id if id else str(uuid.uuid4())
-        self.name = name
-        self.images_paths = images_paths if images_paths else []
-        self.work_area_path = work_area_path
-
-    @staticmethod
-    def from_dict(data):
-        return WorkArea(
-            id=data.get("id"),
-            name=data.get("name"),
-            images_paths=data.get("images_paths", []),
-            work_area_path=data.get("work_area_path", "")
-        )
-
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "images_paths": self.images_paths,
-            "work_area_path": self.work_area_path
-        }
+from .work_area import WorkArea
 
 
 class Ui_WorkAreasDialog(object):
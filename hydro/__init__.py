@@ -2,6 +2,9 @@ import os.path
 from PyQt5.QtWidgets import QAction, QDialog, QVBoxLayout, QPushButton, QMessageBox
 from qgis.core import QgsProject
 
+from .batch_queue import BatchQueue
+from .batch_queue_dialog import BatchQueueDialog
+from .detector_runner import DetectorRunner
 from .json_settings import JsonSettings
 from .settings_picker_dialog import SettingsPickerDialog
 from .work_areas_dialog import WorkAreasDialog
@@ -13,6 +16,7 @@ class WaterPlugin:
         self.actions = []
         self.work_areas = []
         self.settings = JsonSettings()
+        self.batch_queue = None
 
     def add_action(self, text, callback, enabled_flag=True, add_to_toolbar=True, status_tip=None, parent=None):
         action = QAction(text, parent)
@@ -27,6 +31,8 @@ class WaterPlugin:
 
     def initGui(self):
         print("Initializing GUI")
+        self.batch_queue = BatchQueue(self.plugin_dir, self.settings)
+        self.batch_queue.schedule()
         self.add_action(
             text='💧',
             callback=self.run,
@@ -35,30 +41,38 @@ class WaterPlugin:
 
     def run(self):
         print("Running plugin")
-        self.dialog = WaterDialog(self.work_areas, self.iface, self.settings)
-        self.dialog.setFixedSize(200, 100)
+        self.dialog = WaterDialog(self.work_areas, self.iface, self.settings, self.batch_queue)
+        self.dialog.setFixedSize(200, 130)
         self.dialog.show()
 
     def unload(self):
         print("Unloading plugin")
+        if self.batch_queue:
+            self.batch_queue.shutdown()
+        if self.settings.value('detector_worker', False) and \
+                self.settings.check_keys_have_values(['python_script', 'weights']):
+            DetectorRunner(self.settings).stop_worker()
         for action in self.actions:
             self.iface.removeToolBarIcon(action)
 
 
 class WaterDialog(QDialog):
-    def __init__(self, work_areas, iface, settings, parent=None):
+    def __init__(self, work_areas, iface, settings, batch_queue, parent=None):
         super().__init__(parent)
         self.work_areas = work_areas
         self.iface = iface
         self.settings = settings
+        self.batch_queue = batch_queue
         self.setWindowTitle('Hydro Detector')
         layout = QVBoxLayout()
 
         self.create_sample_button = QPushButton('Workflow')
+        self.batch_queue_button = QPushButton('Batch Queue')
         self.settings_button = QPushButton('Settings')
         self.clear_layers_button = QPushButton('Clear Layers')
 
         layout.addWidget(self.create_sample_button)
+        layout.addWidget(self.batch_queue_button)
         layout.addWidget(self.settings_button)
         layout.addWidget(self.clear_layers_button)
 
@@ -67,6 +81,7 @@ class WaterDialog(QDialog):
         self.update_training_button_state()
 
         self.create_sample_button.clicked.connect(self.create_sample)
+        self.batch_queue_button.clicked.connect(self.open_batch_queue)
         self.settings_button.clicked.connect(self.open_settings)
         self.clear_layers_button.clicked.connect(self.clear_layers)
 
@@ -75,6 +90,11 @@ class WaterDialog(QDialog):
         self.work_areas_dialog = WorkAreasDialog(self.iface)
         self.work_areas_dialog.show()
 
+    def open_batch_queue(self):
+        self.close()
+        self.batch_queue_dialog = BatchQueueDialog(self.batch_queue, self.settings)
+        self.batch_queue_dialog.show()
+
     def open_settings(self):
         self.close()
         self.settings_dialog = SettingsPickerDialog(self)
@@ -98,8 +118,10 @@ class WaterDialog(QDialog):
         keys_to_check = ['python_script', 'weights', 'result_folder']
         if self.settings.check_keys_have_values(keys_to_check):
             self.create_sample_button.setEnabled(True)
+            self.batch_queue_button.setEnabled(True)
         else:
             self.create_sample_button.setEnabled(False)
+            self.batch_queue_button.setEnabled(False)
 
 
 def classFactory(iface):
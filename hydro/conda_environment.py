@@ -0,0 +1,90 @@
+import json
+import os
+import shlex
+
+from .process_runner import ProcessRunner
+
+default_conda_activate = '~/anaconda3/bin/activate'
+default_conda_env = 'open_rsai_detectors'
+environment_marker = 'OPEN_RSAI_ENVIRONMENT='
+# Printed by the environment's interpreter after activation.
+environment_probe = (f"import json, os, sys; print({environment_marker!r} + "
+                     "json.dumps({'python': sys.executable, 'variables': dict(os.environ)}))")
+
+
+class CondaEnvironment:
+    """The detector's conda environment, activated once and cached in the settings.
+
+    Activating conda from a shell costs seconds per run. Instead the
+    environment is activated once, its interpreter and the variables the
+    activation changes are stored under ``conda_environment`` in the
+    settings, and later runs exec the interpreter directly with those
+    variables. The cache is resolved again when ``conda_activate`` or
+    ``conda_env`` change or when the interpreter is replaced or removed.
+    """
+
+    def __init__(self, settings, runner_options=None):
+        self.settings = settings
+        self.runner_options = runner_options or {}
+        self.activate_path = os.path.expanduser(settings.value('conda_activate', default_conda_activate))
+        self.name = settings.value('conda_env', default_conda_env)
+
+    def is_valid(self, cached):
+        if not cached or cached.get('activate') != self.activate_path or cached.get('name') != self.name:
+            return False
+        python = cached.get('python', '')
+        if not os.path.isfile(python) or not os.access(python, os.X_OK):
+            return False
+        return os.stat(python).st_mtime_ns == cached.get('python_mtime')
+
+    def resolve(self):
+        command = f'source {shlex.quote(self.activate_path)} && conda activate {shlex.quote(self.name)} && python -c "{environment_probe}"'
+        print(f"Resolving conda environment '{self.name}'")
+        result = ProcessRunner(**self.runner_options).run(command, check=True)
+        probe = [line for line in result.stdout_tail if line.startswith(environment_marker)]
+        if not probe:
+            raise RuntimeError(f"Conda environment '{self.name}' did not report its interpreter")
+        resolved = json.loads(probe[-1][len(environment_marker):])
+
+        variables = {}
+        path_prefixes = {}
+        for key, value in resolved['variables'].items():
+            current = os.environ.get(key)
+            if value == current:
+                continue
+            # Keep only what activation prepended to PATH-like variables, so the
+            # rest follows the environment QGIS is started with.
+            if current and value.endswith(os.pathsep + current):
+                path_prefixes[key] = value[:-len(os.pathsep + current)]
+            else:
+                variables[key] = value
+
+        cached = {
+            'activate': self.activate_path,
+            'name': self.name,
+            'python': resolved['python'],
+            'python_mtime': os.stat(resolved['python']).st_mtime_ns,
+            'variables': variables,
+            'path_prefixes': path_prefixes,
+        }
+        self.settings.setValue('conda_environment', cached)
+        print(f"Conda environment '{self.name}': {resolved['python']}")
+        return cached
+
+    def cached(self):
+        cached = self.settings.value('conda_environment')
+        if self.is_valid(cached):
+            return cached
+        return self.resolve()
+
+    def python(self):
+        return self.cached()['python']
+
+    def variables(self):
+        """os.environ with the environment's activation applied."""
+        cached = self.cached()
+        env = dict(os.environ)
+        env.update(cached['variables'])
+        for key, prefix in cached['path_prefixes'].items():
+            env[key] = prefix + os.pathsep + env[key] if env.get(key) else prefix
+        return env
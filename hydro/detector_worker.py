@@ -0,0 +1,228 @@
+"""Keeps the detector script loaded between runs.
+
+Started by DetectorRunner inside the detector's conda environment:
+
+    python detector_worker.py --socket PATH --script SCRIPT --weights WEIGHTS
+
+The worker listens on a Unix socket and runs one job at a time. A client
+sends one JSON line, ``{"command": "detect", "output_folder": ...,
+"work_area": ..., "images": [...]}``, ``{"command": "ping"}`` or
+``{"command": "shutdown"}``, and reads JSON lines back: ``{"stream":
+"stdout"|"stderr", "line": ...}`` for the job's output, then ``{"status":
+"ok"}``, ``{"status": "error", "message": ...}`` or ``{"status":
+"canceled"}``.
+
+While a detect job runs the client may send ``{"command": "cancel"}`` on
+the same connection; closing the connection cancels too. The job is
+stopped at its next line of output, which detectors print per image, and
+the worker acknowledges with the ``canceled`` status.
+
+If the script defines ``load_model(weights)`` and ``detect(model,
+output_folder, weights, work_area, images)``, the model is loaded once and
+kept resident. Otherwise the script is run as ``__main__`` with the same
+arguments as the one-shot command; its imports stay loaded, only the script
+body runs again. The worker exits after ``--idle-timeout`` seconds without
+a job.
+
+Only the standard library is used: this file runs outside QGIS.
+"""
+import argparse
+import io
+import json
+import os
+import runpy
+import socket
+import sys
+import threading
+import traceback
+
+
+def send(connection, message):
+    try:
+        connection.sendall((json.dumps(message) + '\n').encode())
+    except OSError:
+        # The client went away, the job is canceled at its next output.
+        pass
+
+
+class JobCanceled(BaseException):
+    """Stops a canceled job; not an Exception, so detector code catching Exception lets it through."""
+
+
+class CancelListener(threading.Thread):
+    """Reads the client's messages while a job runs and sets ``canceled`` on a cancel or a closed connection."""
+
+    def __init__(self, reader):
+        super().__init__(name='cancel-listener', daemon=True)
+        self.reader = reader
+        self.canceled = threading.Event()
+
+    def run(self):
+        try:
+            for line in self.reader:
+                try:
+                    if json.loads(line).get('command') == 'cancel':
+                        break
+                except ValueError:
+                    continue
+        except (OSError, ValueError):
+            pass
+        self.canceled.set()
+
+
+class LineWriter(io.TextIOBase):
+    """Forwards everything printed during a job to the client line by line.
+
+    Raises JobCanceled on the first write after ``canceled`` is set; set
+    ``canceled`` to None once the job is over.
+    """
+
+    def __init__(self, connection, stream, canceled):
+        self.connection = connection
+        self.stream = stream
+        self.canceled = canceled
+        self.pending = ''
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if self.canceled is not None and self.canceled.is_set():
+            raise JobCanceled()
+        self.pending += text
+        while '\n' in self.pending:
+            line, self.pending = self.pending.split('\n', 1)
+            send(self.connection, {'stream': self.stream, 'line': line})
+        return len(text)
+
+    def flush(self):
+        if self.pending:
+            send(self.connection, {'stream': self.stream, 'line': self.pending})
+            self.pending = ''
+
+
+class DetectorWorker:
+    def __init__(self, script_path, weights_path):
+        self.script_path = script_path
+        self.weights_path = weights_path
+        self.script = runpy.run_path(script_path, run_name='detector_script')
+        self.model = None
+        if callable(self.script.get('load_model')) and callable(self.script.get('detect')):
+            print(f"Loading {weights_path}", flush=True)
+            self.model = self.script['load_model'](weights_path)
+
+    def detect(self, output_folder, work_area_path, images_paths):
+        if self.model is not None:
+            self.script['detect'](self.model, output_folder, self.weights_path, work_area_path, images_paths)
+            return
+        saved_argv = sys.argv
+        sys.argv = [self.script_path, output_folder, self.weights_path, work_area_path] + images_paths
+        try:
+            runpy.run_path(self.script_path, run_name='__main__')
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                raise RuntimeError(f"Detector exited with code {e.code}")
+        finally:
+            sys.argv = saved_argv
+
+    def handle(self, connection, reader, request):
+        command = request.get('command')
+        if command == 'ping':
+            send(connection, {'status': 'ok', 'pid': os.getpid(), 'resident_model': self.model is not None})
+            return True
+        if command == 'shutdown':
+            send(connection, {'status': 'ok'})
+            return False
+        if command != 'detect':
+            send(connection, {'status': 'error', 'message': f"Unknown command {command!r}"})
+            return True
+
+        listener = CancelListener(reader)
+        listener.start()
+        writers = (LineWriter(connection, 'stdout', listener.canceled),
+                   LineWriter(connection, 'stderr', listener.canceled))
+        saved_streams = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = writers
+        trace = None
+        try:
+            self.detect(request['output_folder'], request['work_area'], request['images'])
+            message = {'status': 'ok'}
+        except JobCanceled:
+            message = {'status': 'canceled'}
+        except Exception as e:
+            trace = traceback.format_exc()
+            message = {'status': 'error', 'message': str(e)}
+        finally:
+            sys.stdout, sys.stderr = saved_streams
+            for writer in writers:
+                writer.canceled = None
+                writer.flush()
+        if trace:
+            for line in trace.splitlines():
+                send(connection, {'stream': 'stderr', 'line': line})
+        print(f"Job {request['output_folder']}: {message['status']}", flush=True)
+        send(connection, message)
+        # Wakes the listener, which must be gone before its descriptor is closed and reused.
+        try:
+            connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        listener.join()
+        return True
+
+    def serve(self, socket_path, idle_timeout):
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server.bind(socket_path)
+        server.listen()
+        server.settimeout(idle_timeout or None)
+        print(f"Detector worker {os.getpid()} listening on {socket_path}", flush=True)
+        try:
+            while True:
+                try:
+                    connection, _ = server.accept()
+                except socket.timeout:
+                    print(f"Idle for {idle_timeout} s, exiting", flush=True)
+                    return
+                connection.settimeout(None)
+                with connection, connection.makefile('r') as reader:
+                    line = reader.readline()
+                    if not line:
+                        continue
+                    if not self.handle(connection, reader, json.loads(line)):
+                        return
+        finally:
+            server.close()
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+def is_listening(socket_path):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident detector worker")
+    parser.add_argument('--socket', required=True)
+    parser.add_argument('--script', required=True)
+    parser.add_argument('--weights', required=True)
+    parser.add_argument('--idle-timeout', type=float, default=1800)
+    args = parser.parse_args()
+
+    if is_listening(args.socket):
+        print(f"A worker is already listening on {args.socket}")
+        return
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    DetectorWorker(args.script, args.weights).serve(args.socket, args.idle_timeout)
+
+
+if __name__ == '__main__':
+    main()
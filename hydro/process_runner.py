@@ -0,0 +1,174 @@
+import collections
+import os
+import queue
+import re
+import signal
+import subprocess
+import threading
+import time
+
+progress_patterns = [
+    re.compile(r'(\d+(?:\.\d+)?)\s*%'),
+    re.compile(r'\[\s*(\d+)\s*/\s*(\d+)\s*\]'),
+    re.compile(r'\b(\d+)\s+(?:of|/)\s+(\d+)\b'),
+]
+
+
+def parse_progress(line):
+    for pattern in progress_patterns:
+        match = pattern.search(line)
+        if not match:
+            continue
+        if len(match.groups()) == 1:
+            return min(float(match.group(1)), 100.0)
+        total = int(match.group(2))
+        if total > 0:
+            return min(100.0 * int(match.group(1)) / total, 100.0)
+    return None
+
+
+class CommandFailed(Exception):
+    def __init__(self, result):
+        super().__init__(f"Command exited with code {result.returncode}: {result.command}")
+        self.result = result
+        self.details = {'returncode': result.returncode, 'stderr': result.stderr_tail}
+
+
+class CommandCanceled(Exception):
+    pass
+
+
+class ProcessResult:
+    def __init__(self, command, returncode, stdout_tail, stderr_tail):
+        self.command = command
+        self.returncode = returncode
+        self.stdout_tail = stdout_tail
+        self.stderr_tail = stderr_tail
+
+    def stdout(self):
+        return '\n'.join(self.stdout_tail)
+
+    def stderr(self):
+        return '\n'.join(self.stderr_tail)
+
+
+class ProcessRunner:
+    """Runs a command and streams its stdout/stderr line by line.
+
+    Only the last ``tail_size`` lines of each stream are kept. Callbacks run
+    on the calling thread: ``on_line(stream, line)`` for every line,
+    ``on_start(process)`` once the process is spawned,
+    ``on_progress(percent)`` for every progress marker, ``on_poll()`` every
+    ``poll_interval`` seconds and ``on_stall(seconds)`` once when the process
+    has been silent for ``stall_timeout`` seconds.
+
+    The command runs in its own session. When ``should_cancel()`` returns True
+    the whole process group is terminated and ``CommandCanceled`` is raised;
+    with ``check`` a non-zero exit status raises ``CommandFailed``.
+    """
+
+    def __init__(self, on_line=None, on_progress=None, on_poll=None, on_stall=None, should_cancel=None,
+                 on_start=None, tail_size=500, poll_interval=0.1, stall_timeout=600, kill_grace_period=5):
+        self.on_start = on_start
+        self.on_line = on_line
+        self.on_progress = on_progress
+        self.on_poll = on_poll
+        self.on_stall = on_stall
+        self.should_cancel = should_cancel
+        self.tail_size = tail_size
+        self.poll_interval = poll_interval
+        self.stall_timeout = stall_timeout
+        self.kill_grace_period = kill_grace_period
+
+    def kill_process_tree(self, process):
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        try:
+            process.wait(timeout=self.kill_grace_period)
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def read_stream(self, name, stream, lines):
+        for line in iter(stream.readline, ''):
+            lines.put((name, line.rstrip('\n')))
+        stream.close()
+        lines.put((name, None))
+
+    def run(self, command, shell=True, env=None, cwd=None, check=False):
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            shell=shell,
+            executable='/bin/bash' if shell else None,
+            env=env,
+            cwd=cwd,
+            text=True,
+            errors='replace',
+            bufsize=1,
+            start_new_session=True
+        )
+        if self.on_start:
+            self.on_start(process)
+        tails = {
+            'stdout': collections.deque(maxlen=self.tail_size),
+            'stderr': collections.deque(maxlen=self.tail_size),
+        }
+        lines = queue.Queue()
+        for name in tails:
+            threading.Thread(target=self.read_stream, args=(name, getattr(process, name), lines),
+                             daemon=True).start()
+
+        open_streams = len(tails)
+        last_output = last_poll = time.monotonic()
+        stall_reported = False
+        canceled = False
+        while open_streams:
+            if not canceled and self.should_cancel and self.should_cancel():
+                canceled = True
+                print(f"Canceling: {command}")
+                self.kill_process_tree(process)
+            try:
+                name, line = lines.get(timeout=self.poll_interval)
+            except queue.Empty:
+                name, line = None, None
+
+            now = time.monotonic()
+            if self.on_poll and now - last_poll >= self.poll_interval:
+                last_poll = now
+                self.on_poll()
+
+            if name is None:
+                silent_for = now - last_output
+                if self.stall_timeout and silent_for > self.stall_timeout and not stall_reported:
+                    stall_reported = True
+                    print(f"No output for {silent_for:.0f} s from: {command}")
+                    if self.on_stall:
+                        self.on_stall(silent_for)
+                continue
+
+            if line is None:
+                open_streams -= 1
+                continue
+
+            last_output = now
+            stall_reported = False
+            tails[name].append(line)
+            if self.on_line:
+                self.on_line(name, line)
+            percent = parse_progress(line)
+            if percent is not None and self.on_progress:
+                self.on_progress(percent)
+
+        returncode = process.wait()
+        result = ProcessResult(command, returncode, list(tails['stdout']), list(tails['stderr']))
+        if canceled:
+            raise CommandCanceled(f"Command canceled: {command}")
+        if check and returncode != 0:
+            raise CommandFailed(result)
+        return result
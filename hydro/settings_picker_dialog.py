@@ -7,7 +7,7 @@ from .json_settings import JsonSettings
 class Ui_SettingsPickerDialog(object):
     def setupUi(self, SettingsPickerDialog):
         SettingsPickerDialog.setObjectName("SettingsPickerDialog")
-        SettingsPickerDialog.setFixedSize(400, 300)
+        SettingsPickerDialog.setFixedSize(400, 415)
 
         self.verticalLayout = QtWidgets.QVBoxLayout(SettingsPickerDialog)
         self.verticalLayout.setObjectName("verticalLayout")
@@ -58,6 +58,28 @@ class Ui_SettingsPickerDialog(object):
         self.pushButtonBrowseResultFolder.setObjectName("pushButtonBrowseResultFolder")
         self.verticalLayout.addWidget(self.pushButtonBrowseResultFolder)
 
+        self.separator3 = QtWidgets.QFrame(SettingsPickerDialog)
+        self.separator3.setFrameShape(QtWidgets.QFrame.HLine)
+        self.separator3.setFrameShadow(QtWidgets.QFrame.Sunken)
+        self.verticalLayout.addWidget(self.separator3)
+
+        self.checkBoxDetectorWorker = QtWidgets.QCheckBox("Keep detector loaded between runs", SettingsPickerDialog)
+        self.checkBoxDetectorWorker.setObjectName("checkBoxDetectorWorker")
+        self.verticalLayout.addWidget(self.checkBoxDetectorWorker)
+
+        self.labelDetectorShards = QtWidgets.QLabel("Parallel detector processes:", SettingsPickerDialog)
+        self.labelDetectorShards.setObjectName("labelDetectorShards")
+        self.verticalLayout.addWidget(self.labelDetectorShards)
+
+        self.spinBoxDetectorShards = QtWidgets.QSpinBox(SettingsPickerDialog)
+        self.spinBoxDetectorShards.setObjectName("spinBoxDetectorShards")
+        self.spinBoxDetectorShards.setRange(1, 64)
+        self.verticalLayout.addWidget(self.spinBoxDetectorShards)
+
+        self.checkBoxDissolveResults = QtWidgets.QCheckBox("Dissolve touching polygons", SettingsPickerDialog)
+        self.checkBoxDissolveResults.setObjectName("checkBoxDissolveResults")
+        self.verticalLayout.addWidget(self.checkBoxDissolveResults)
+
         QtCore.QMetaObject.connectSlotsByName(SettingsPickerDialog)
 
 
@@ -71,6 +93,9 @@ class SettingsPickerDialog(QDialog):
         self.ui.lineEditPythonScript.setText(self.settings.value("python_script", ""))
         self.ui.lineEditWeights.setText(self.settings.value("weights", ""))
         self.ui.lineEditResultFolder.setText(self.settings.value("result_folder", ""))
+        self.ui.checkBoxDetectorWorker.setChecked(bool(self.settings.value("detector_worker", False)))
+        self.ui.spinBoxDetectorShards.setValue(int(self.settings.value("detector_shards", 1)))
+        self.ui.checkBoxDissolveResults.setChecked(bool(self.settings.value("dissolve_results", False)))
 
         self.ui.pushButtonBrowsePythonScript.clicked.connect(
             lambda: self.browse_file(self.ui.lineEditPythonScript, "python_script"))
@@ -78,6 +103,12 @@ class SettingsPickerDialog(QDialog):
             lambda: self.browse_file(self.ui.lineEditWeights, "weights"))
         self.ui.pushButtonBrowseResultFolder.clicked.connect(
             lambda: self.browse_folder(self.ui.lineEditResultFolder, "result_folder"))
+        self.ui.checkBoxDetectorWorker.toggled.connect(
+            lambda checked: self.settings.setValue("detector_worker", checked))
+        self.ui.spinBoxDetectorShards.valueChanged.connect(
+            lambda value: self.settings.setValue("detector_shards", value))
+        self.ui.checkBoxDissolveResults.toggled.connect(
+            lambda checked: self.settings.setValue("dissolve_results", checked))
 
     def browse_file(self, line_edit, key):
         file_path, _ = QFileDialog.getOpenFileName(self, "Select File", "", "Python Files (*.py);;All Files (*)")
@@ -0,0 +1,167 @@
+import hashlib
+import os
+
+from qgis.core import (
+    QgsVectorLayer,
+    QgsFeature,
+    QgsField,
+    QgsGeometry,
+    QgsSpatialIndex,
+    QgsVectorFileWriter,
+    QgsCoordinateTransformContext,
+    QgsWkbTypes
+)
+from PyQt5.QtCore import QVariant
+
+from .union_find import DisjointSets
+
+# Grid the dissolved geometry is snapped to before hashing it into its id.
+dissolve_id_precision = 0.01
+
+
+def memory_layer(name, wkb_type, crs, fields):
+    layer = QgsVectorLayer(f'{QgsWkbTypes.displayString(wkb_type)}?crs={crs.authid()}', name, 'memory')
+    layer.dataProvider().addAttributes(fields.toList())
+    layer.updateFields()
+    return layer
+
+
+def merged_layer(paths):
+    """Reads the features of every shapefile in ``paths`` into one memory layer.
+
+    The first readable file provides the geometry type, CRS and fields;
+    attributes of the others are copied by field name. Returns None when no
+    file could be read.
+    """
+    layers = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        layer = QgsVectorLayer(path, os.path.basename(path), 'ogr')
+        if not layer.isValid():
+            print(f"Skipping unreadable shard output {path}")
+            continue
+        layers.append(layer)
+    if not layers:
+        return None
+
+    template = layers[0]
+    merged = memory_layer('merged', template.wkbType(), template.crs(), template.fields())
+    fields = merged.fields()
+    for layer in layers:
+        features = []
+        for source in layer.getFeatures():
+            feature = QgsFeature(fields)
+            feature.setGeometry(source.geometry())
+            for field in layer.fields():
+                if fields.indexOf(field.name()) >= 0:
+                    feature.setAttribute(field.name(), source.attribute(field.name()))
+            features.append(feature)
+        merged.dataProvider().addFeatures(features)
+    return merged
+
+
+def connected_groups(geometries):
+    """Groups the indexes of touching or overlapping geometries.
+
+    Candidates come from a spatial index and are confirmed with
+    a prepared geometry, so only neighbours are compared; groups are kept
+    in a union-find.
+    """
+    index = QgsSpatialIndex()
+    for i, geometry in enumerate(geometries):
+        index.addFeature(i, geometry.boundingBox())
+
+    sets = DisjointSets(len(geometries))
+    for i, geometry in enumerate(geometries):
+        engine = None
+        for j in index.intersects(geometry.boundingBox()):
+            if j <= i or sets.find(i) == sets.find(j):
+                continue
+            if engine is None:
+                engine = QgsGeometry.createGeometryEngine(geometry.constGet())
+                engine.prepareGeometry()
+            if engine.intersects(geometries[j].constGet()):
+                sets.union(i, j)
+
+    return sets.groups()
+
+
+def dissolve_id(geometry):
+    snapped = geometry.snappedToGrid(dissolve_id_precision, dissolve_id_precision)
+    return hashlib.sha1(bytes(snapped.asWkb())).hexdigest()[:16]
+
+
+def dissolve_polygons(layer):
+    """Dissolves touching or overlapping polygons of ``layer`` into a new memory layer.
+
+    Each connected group is merged with one unary union, so the cost grows
+    with the number of neighbours rather than with every pair. A dissolved
+    polygon keeps the attributes of its largest part and gets ``parts``
+    (number of merged polygons) and ``dissolve_id``, a hash of its geometry
+    that stays the same between runs producing the same shape. Output
+    features are ordered by position.
+    """
+    features = [feature for feature in layer.getFeatures() if feature.hasGeometry()]
+    geometries = []
+    for feature in features:
+        geometry = feature.geometry()
+        if not geometry.isGeosValid():
+            geometry = geometry.makeValid()
+        geometries.append(geometry)
+
+    fields = layer.fields()
+    for name, field_type, length in [('parts', QVariant.Int, 10), ('dissolve_id', QVariant.String, 16)]:
+        if fields.indexOf(name) < 0:
+            fields.append(QgsField(name, field_type, '', length))
+    output = memory_layer(layer.name(), QgsWkbTypes.multiType(layer.wkbType()), layer.crs(), fields)
+
+    dissolved = []
+    for group in connected_groups(geometries):
+        if len(group) == 1:
+            geometry = geometries[group[0]]
+        else:
+            geometry = QgsGeometry.unaryUnion([geometries[i] for i in group])
+        if geometry.isEmpty():
+            continue
+        geometry.convertToMultiType()
+        largest = max(group, key=lambda i: geometries[i].area())
+        feature = QgsFeature(output.fields())
+        feature.setGeometry(geometry)
+        for field in layer.fields():
+            feature.setAttribute(field.name(), features[largest].attribute(field.name()))
+        feature.setAttribute('parts', len(group))
+        feature.setAttribute('dissolve_id', dissolve_id(geometry))
+        dissolved.append(feature)
+
+    dissolved.sort(key=lambda feature: (feature.geometry().boundingBox().yMinimum(),
+                                        feature.geometry().boundingBox().xMinimum(),
+                                        feature.attribute('dissolve_id')))
+    output.dataProvider().addFeatures(dissolved)
+    print(f"Dissolved {len(features)} polygons into {len(dissolved)}")
+    return output
+
+
+def save_shapefile(layer, output_path):
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = "ESRI Shapefile"
+    error = QgsVectorFileWriter.writeAsVectorFormatV3(layer, output_path, QgsCoordinateTransformContext(), options)
+    if error[0] != QgsVectorFileWriter.NoError:
+        raise RuntimeError(f"Error saving {output_path}: {error[1]}")
+
+
+def merge_shapefiles(paths, output_path, dissolve=False):
+    """Writes the features of every shapefile in ``paths`` into one shapefile.
+
+    With ``dissolve`` touching or overlapping polygons, such as the halves
+    of a lake cut by a shard or tile edge, are merged, see dissolve_polygons.
+    Returns the number of written features, or None when no file could be
+    read.
+    """
+    layer = merged_layer(paths)
+    if layer is None:
+        return None
+    if dissolve:
+        layer = dissolve_polygons(layer)
+    save_shapefile(layer, output_path)
+    return layer.featureCount()
@@ -0,0 +1,155 @@
+import os
+import struct
+
+from buildings.append_journal import AppendJournal, batch_id, journal_files
+
+
+def write_shapefile(base, record_count):
+    """Writes .shp/.shx/.dbf files with the header layout AppendJournal relies on."""
+    with open(base + '.shp', 'wb') as f:
+        f.write(b'S' * 100 + b'r' * 20 * record_count)
+    with open(base + '.shx', 'wb') as f:
+        f.write(b'X' * 100 + b'i' * 8 * record_count)
+    with open(base + '.dbf', 'wb') as f:
+        f.write(b'\x03\x7a\x0a\x12' + struct.pack('<I', record_count) + b'D' * 24 + b'd' * 10 * record_count + b'\x1a')
+
+
+def append_records(base, record_count, total):
+    """Appends records the way OGR does: new bytes at the end and rewritten headers."""
+    with open(base + '.shp', 'r+b') as f:
+        f.write(b'T' * 100)
+        f.seek(0, os.SEEK_END)
+        f.write(b'r' * 20 * record_count)
+    with open(base + '.shx', 'ab') as f:
+        f.write(b'i' * 8 * record_count)
+    with open(base + '.dbf', 'r+b') as f:
+        f.seek(4)
+        f.write(struct.pack('<I', total))
+        f.seek(-1, os.SEEK_END)
+        f.write(b'd' * 10 * record_count + b'\x1a')
+
+
+def read_files(base):
+    result = {}
+    for ext in ('.shp', '.shx', '.dbf'):
+        with open(base + ext, 'rb') as f:
+            result[ext] = f.read()
+    return result
+
+
+def test_record_counts_are_read_from_the_files(tmp_path):
+    base = str(tmp_path / 'roofs')
+    write_shapefile(base, 3)
+    journal = AppendJournal(base + '.shp')
+    assert journal.record_counts() == (3, 3)
+
+    append_records(base, 2, 5)
+    assert journal.record_counts() == (5, 5)
+
+
+def test_recover_restores_an_interrupted_append(tmp_path):
+    base = str(tmp_path / 'roofs')
+    write_shapefile(base, 3)
+    with open(base + '.qix', 'wb') as f:
+        f.write(b'index')
+    before = read_files(base)
+
+    journal = AppendJournal(base + '.shp')
+    journal.begin(3, batch_id([('a.roof', b'\x01'), ('b.roof', b'\x02')]))
+    assert not os.path.exists(base + '.qix')
+    append_records(base, 2, 5)
+
+    assert AppendJournal(base + '.shp').recover()
+    assert read_files(base) == before
+    assert journal.load()['batches'] == [] and journal.load()['pending'] is None
+    assert not journal.recover()
+
+
+def test_commit_records_the_batch(tmp_path):
+    base = str(tmp_path / 'roofs')
+    write_shapefile(base, 3)
+    first, second = batch_id([('a.roof', b'\x01')]), batch_id([('b.roof', b'\x02')])
+
+    journal = AppendJournal(base + '.shp')
+    journal.record(first)
+    journal.begin(3, second)
+    assert not journal.is_applied(second)
+    append_records(base, 1, 4)
+    journal.commit()
+
+    assert journal.load()['batches'] == [first, second]
+    assert journal.is_applied(first) and journal.is_applied(second)
+    assert not journal.recover()
+    assert journal.record_counts() == (4, 4)
+
+    journal.record(second)
+    assert journal.load()['batches'] == [second]
+
+
+def test_batch_id_depends_on_the_files_their_order_and_geometries():
+    first, second = ('a.roof', b'\x01\x03'), ('b.roof', b'\x01\x06')
+    assert batch_id([first, second]) == batch_id([first, second])
+    assert batch_id([first, second]) != batch_id([second, first])
+    assert batch_id([first]) != batch_id([first, second])
+    assert batch_id([first]) != batch_id([('a.roof', b'\x01\x06')])
+
+
+def test_journal_of_a_regenerated_shapefile_is_ignored(tmp_path):
+    base = str(tmp_path / 'roofs')
+    write_shapefile(base, 3)
+    batch = batch_id([('a.roof', b'\x01')])
+    AppendJournal(base + '.shp').record(batch)
+
+    # A tool writes roofs.shp again and leaves the journal behind.
+    for ext in ('.shp', '.shx', '.dbf'):
+        os.remove(base + ext)
+    write_shapefile(base, 2)
+
+    journal = AppendJournal(base + '.shp')
+    assert not journal.is_applied(batch)
+    assert not journal.recover()
+    assert journal.record_counts() == (2, 2)
+
+
+def test_pending_append_of_a_regenerated_shapefile_is_not_rolled_back(tmp_path):
+    base = str(tmp_path / 'roofs')
+    write_shapefile(base, 3)
+    journal = AppendJournal(base + '.shp')
+    journal.begin(3, batch_id([('a.roof', b'\x01')]))
+    append_records(base, 2, 5)
+
+    for ext in ('.shp', '.shx', '.dbf'):
+        os.remove(base + ext)
+    write_shapefile(base, 1)
+    regenerated = read_files(base)
+
+    assert not AppendJournal(base + '.shp').recover()
+    assert read_files(base) == regenerated
+
+
+def test_journal_files_belong_to_shapefiles():
+    assert journal_files('/work/a/roofs.shp') == ['/work/a/roofs.append.json', '/work/a/roofs.qix']
+    assert journal_files('/work/a/selection.json') == []
+
+
+def test_generation_is_renewed_only_when_the_shapefile_is_rewritten(tmp_path):
+    base = str(tmp_path / 'roofs')
+    write_shapefile(base, 3)
+    batch = batch_id([('a.roof', b'\x01')])
+    journal = AppendJournal(base + '.shp')
+    journal.record(batch)
+    generation = journal.load()['generation']
+
+    journal.begin(3, batch_id([('b.roof', b'\x02')]))
+    append_records(base, 1, 4)
+    journal.commit()
+    assert journal.load()['generation'] == generation
+
+    journal.begin(4, batch_id([('c.roof', b'\x03')]))
+    append_records(base, 1, 5)
+    assert journal.recover()
+    assert journal.load()['generation'] == generation
+
+    # Rewriting the file with the same selection still starts a new generation.
+    journal.record(batch)
+    assert journal.load()['generation'] != generation
@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+
+from buildings.artifact_cache import ArtifactCache, entry_file_name
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def read(path):
+    with open(path, 'r') as f:
+        return f.read()
+
+
+def set_last_used(cache, key, timestamp):
+    os.utime(cache.metadata_path(key), (timestamp, timestamp))
+
+
+def test_store_and_fetch_into_another_work_area(tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'), 1024 ** 2)
+    output = str(tmp_path / 'first' / 'bounds.txt')
+    write(output, 'bounds')
+    key = cache.key('tool', ['--x'], [])
+    cache.store(key, [output])
+
+    restored = str(tmp_path / 'second' / 'bounds.txt')
+    assert cache.fetch(key, [restored])
+    assert read(restored) == 'bounds'
+    assert not cache.fetch(cache.key('tool', ['--y'], []), [restored])
+
+
+def test_shapefile_sidecars_are_cached(tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'), 1024 ** 2)
+    base = str(tmp_path / 'first' / 'inliers')
+    for ext in ['.shp', '.shx', '.dbf']:
+        write(base + ext, ext)
+    cache.store('ab' * 32, [base + '.shp'])
+
+    restored = str(tmp_path / 'second' / 'inliers')
+    assert cache.fetch('ab' * 32, [restored + '.shp'])
+    assert [read(restored + ext) for ext in ['.shp', '.shx', '.dbf']] == ['.shp', '.shx', '.dbf']
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'), 25)
+    keys = ['a' * 64, 'b' * 64, 'c' * 64]
+    for i, key in enumerate(keys[:2]):
+        output = str(tmp_path / key[:1] / 'out.txt')
+        write(output, 'x' * 10)
+        cache.store(key, [output])
+        set_last_used(cache, key, 1000 + i)
+    # Fetching the older entry makes it the most recently used one.
+    assert cache.fetch(keys[0], [str(tmp_path / 'restored' / 'out.txt')])
+
+    output = str(tmp_path / 'c' / 'out.txt')
+    write(output, 'x' * 10)
+    cache.store(keys[2], [output])
+
+    assert os.path.isdir(cache.entry_folder(keys[0]))
+    assert not os.path.exists(cache.entry_folder(keys[1]))
+    assert os.path.isdir(cache.entry_folder(keys[2]))
+
+
+def test_abandoned_folders_are_swept(tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'), 1024 ** 2)
+    abandoned = cache.entry_folder('d' * 64)
+    write(os.path.join(abandoned, 'out.txt'), 'x')
+    fresh_temp = cache.entry_folder('e' * 64) + '.0123.tmp'
+    write(os.path.join(fresh_temp, 'out.txt'), 'x')
+    old_temp = cache.entry_folder('f' * 64) + '.4567.tmp'
+    write(os.path.join(old_temp, 'out.txt'), 'x')
+    os.utime(old_temp, (1000, 1000))
+
+    assert cache.entries() == []
+    assert not os.path.exists(abandoned)
+    assert os.path.isdir(fresh_temp)
+    assert not os.path.exists(old_temp)
+
+
+def store_entries(cache_folder, work_folder, worker):
+    cache = ArtifactCache(cache_folder, 1024 ** 3)
+    for i in range(20):
+        output = os.path.join(work_folder, f'{worker}-{i}', 'out.txt')
+        write(output, f'{worker}-{i}')
+        cache.store(cache.key('tool', [worker, i], []), [output])
+
+
+def test_concurrent_processes_keep_every_entry(tmp_path):
+    cache_folder = str(tmp_path / 'cache')
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=store_entries, args=(cache_folder, str(tmp_path / 'work'), worker))
+               for worker in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+
+    cache = ArtifactCache(cache_folder, 1024 ** 3)
+    assert len(cache.entries()) == 80
+    for worker in range(4):
+        for i in range(20):
+            restored = str(tmp_path / 'restored' / f'{worker}-{i}' / 'out.txt')
+            assert cache.fetch(cache.key('tool', [worker, i], []), [restored])
+            assert read(restored) == f'{worker}-{i}'
+            assert os.path.exists(os.path.join(cache.entry_folder(cache.key('tool', [worker, i], [])),
+                                               entry_file_name))
@@ -0,0 +1,126 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytest
+
+root_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+detector_script = '''
+import os
+import sys
+import time
+
+
+def main(output_folder, weights, work_area, images):
+    for index, image in enumerate(images):
+        time.sleep(float(os.environ.get('TEST_IMAGE_SECONDS', '0')))
+        with open(os.path.join(output_folder, 'processed.txt'), 'a') as f:
+            f.write(image + '\\n')
+        print(f"{index + 1}/{len(images)} {image}")
+    if 'fail' in images:
+        raise RuntimeError('detector failed')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4:])
+'''
+
+
+@pytest.fixture(params=['hydro', 'greenery'])
+def worker(request, tmp_path):
+    script_path = tmp_path / 'detector.py'
+    script_path.write_text(detector_script)
+    # Unix socket paths are limited to ~100 characters.
+    socket_path = os.path.join(tempfile.mkdtemp(prefix='worker'), 'w.sock')
+    env = dict(os.environ, TEST_IMAGE_SECONDS='0.2')
+    process = subprocess.Popen([sys.executable, os.path.join(root_folder, request.param, 'detector_worker.py'),
+                                '--socket', socket_path, '--script', str(script_path), '--weights', 'weights',
+                                '--idle-timeout', '60'], env=env)
+    for _ in range(100):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.05)
+    yield socket_path
+    process.kill()
+    process.wait()
+
+
+def connect(socket_path):
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.connect(socket_path)
+    return connection
+
+
+def send(connection, message):
+    connection.sendall((json.dumps(message) + '\n').encode())
+
+
+def messages(connection):
+    with connection.makefile('r') as reader:
+        for line in reader:
+            yield json.loads(line)
+
+
+def detect(output_folder, images):
+    return {'command': 'detect', 'output_folder': str(output_folder), 'work_area': 'area.shp', 'images': images}
+
+
+def test_job_output_and_status(worker, tmp_path):
+    connection = connect(worker)
+    send(connection, detect(tmp_path, ['a', 'b']))
+    received = list(messages(connection))
+
+    assert [message['line'] for message in received if 'line' in message] == ['1/2 a', '2/2 b']
+    assert received[-1] == {'status': 'ok'}
+    assert (tmp_path / 'processed.txt').read_text().split() == ['a', 'b']
+
+
+def test_failing_job_reports_an_error(worker, tmp_path):
+    connection = connect(worker)
+    send(connection, detect(tmp_path, ['fail']))
+    received = list(messages(connection))
+
+    assert received[-1] == {'status': 'error', 'message': 'detector failed'}
+    assert any('RuntimeError' in message.get('line', '') for message in received)
+
+
+def test_cancel_stops_the_job_between_images(worker, tmp_path):
+    connection = connect(worker)
+    send(connection, detect(tmp_path, [f'image{i}' for i in range(20)]))
+    received = []
+    for message in messages(connection):
+        received.append(message)
+        if message.get('line', '').startswith('1/'):
+            send(connection, {'command': 'cancel'})
+        if 'status' in message:
+            break
+
+    assert received[-1] == {'status': 'canceled'}
+    processed = (tmp_path / 'processed.txt').read_text().split()
+    time.sleep(0.5)
+    assert (tmp_path / 'processed.txt').read_text().split() == processed
+    assert len(processed) < 20
+
+    # The worker takes the next job.
+    connection = connect(worker)
+    send(connection, {'command': 'ping'})
+    assert next(messages(connection))['status'] == 'ok'
+
+
+def test_closed_connection_cancels_the_job(worker, tmp_path):
+    connection = connect(worker)
+    send(connection, detect(tmp_path, [f'image{i}' for i in range(20)]))
+    time.sleep(0.3)
+    connection.close()
+
+    connection = connect(worker)
+    send(connection, {'command': 'ping'})
+    started = time.monotonic()
+    assert next(messages(connection))['status'] == 'ok'
+    assert time.monotonic() - started < 2
+    assert len((tmp_path / 'processed.txt').read_text().split()) < 20
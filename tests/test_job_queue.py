@@ -0,0 +1,145 @@
+import json
+import multiprocessing
+import os
+import time
+
+from buildings.job_queue import JobQueue
+
+
+def expire(path, age):
+    past = time.time() - age
+    os.utime(path, (past, past))
+
+
+def claim_token(job_queue, job_id):
+    with open(job_queue.claim_path(job_id), 'r') as f:
+        return json.load(f)['token']
+
+
+def test_claim_is_exclusive(tmp_path):
+    job_queue = JobQueue(str(tmp_path))
+    job = job_queue.enqueue({'name': 'area'})
+
+    claim = job_queue.claim(job, 'a')
+    assert claim is not None
+    assert job_queue.claim(job, 'b') is None
+    assert claim.is_held()
+    assert job_queue.pending_jobs() == []
+
+
+def test_stale_claim_is_taken_over(tmp_path):
+    job_queue = JobQueue(str(tmp_path), lease_timeout=60)
+    job = job_queue.enqueue({'name': 'area'})
+    first = job_queue.claim(job, 'a')
+    expire(first.path, 120)
+
+    second = job_queue.claim(job, 'b')
+    assert second is not None
+    assert second.job['attempts'] == 2
+    assert not first.heartbeat()
+    assert second.heartbeat()
+    assert not job_queue.complete(first)
+    assert job_queue.complete(second)
+    assert job_queue.job_ids('done') == [job['id']]
+
+
+def test_takeover_does_not_break_a_renewed_claim(tmp_path):
+    job_queue = JobQueue(str(tmp_path), lease_timeout=60)
+    job = job_queue.enqueue({'name': 'area'})
+    first = job_queue.claim(job, 'a')
+    expire(first.path, 120)
+    stale_token = job_queue.stale_claim_token(first.path)
+    assert stale_token == first.token
+
+    # Worker a renews its lease after worker b judged it stale.
+    assert first.heartbeat()
+    assert not job_queue.break_stale_claim(first.path, stale_token, 'b')
+    assert first.is_held()
+
+
+def test_takeover_does_not_break_a_newer_claim(tmp_path):
+    job_queue = JobQueue(str(tmp_path), lease_timeout=60)
+    job = job_queue.enqueue({'name': 'area'})
+    first = job_queue.claim(job, 'a')
+    expire(first.path, 120)
+
+    # Workers b and c both judge the claim stale; b takes the job over first.
+    stale_token = job_queue.stale_claim_token(first.path)
+    second = job_queue.claim(job, 'b')
+    assert second is not None
+
+    assert not job_queue.break_stale_claim(second.path, stale_token, 'c')
+    assert second.is_held()
+    assert claim_token(job_queue, job['id']) == second.token
+    assert job_queue.claim(job, 'c') is None
+
+
+def test_expired_leases_fail_the_job(tmp_path):
+    job_queue = JobQueue(str(tmp_path), lease_timeout=60, max_attempts=2)
+    job = job_queue.enqueue({'name': 'area'})
+    for worker_id in ['a', 'b']:
+        claim = job_queue.claim(job, worker_id)
+        assert claim is not None
+        expire(claim.path, 120)
+
+    assert job_queue.claim(job, 'c') is None
+    assert job_queue.job_ids('failed') == [job['id']]
+    assert job_queue.job_ids() == []
+
+
+def test_release_puts_the_job_back(tmp_path):
+    job_queue = JobQueue(str(tmp_path))
+    job = job_queue.enqueue({'name': 'area'})
+    claim = job_queue.claim(job, 'a')
+    job_queue.release(claim)
+
+    assert [pending['id'] for pending in job_queue.pending_jobs()] == [job['id']]
+
+
+def test_jobs_are_claimed_by_priority(tmp_path):
+    job_queue = JobQueue(str(tmp_path))
+    low = job_queue.enqueue({'name': 'low'}, priority=0)
+    high = job_queue.enqueue({'name': 'high'}, priority=5)
+
+    assert job_queue.claim_next('a').job['id'] == high['id']
+    assert job_queue.claim_next('a').job['id'] == low['id']
+    assert job_queue.claim_next('a') is None
+
+
+def run_worker(folder, worker_id, log_path, lease_timeout):
+    job_queue = JobQueue(folder, lease_timeout=lease_timeout)
+    while True:
+        claim = job_queue.claim_next(worker_id)
+        if claim is None:
+            if not job_queue.pending_jobs():
+                return
+            time.sleep(0.01)
+            continue
+        time.sleep(0.005)
+        if job_queue.complete(claim):
+            with open(log_path, 'a') as f:
+                f.write(f"{claim.job['id']} {worker_id}\n")
+
+
+def test_several_worker_processes_finish_each_job_once(tmp_path):
+    folder = str(tmp_path / 'queue')
+    job_queue = JobQueue(folder, lease_timeout=60)
+    jobs = [job_queue.enqueue({'name': f'area-{i}'}) for i in range(40)]
+    # Half of the jobs hold expired leases of a dead worker, so workers race on takeovers too.
+    for job in jobs[::2]:
+        expire(job_queue.claim(job, 'dead').path, 120)
+    log_path = str(tmp_path / 'finished.log')
+
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=run_worker, args=(folder, f'worker-{i}', log_path, 60)) for i in range(6)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+
+    with open(log_path, 'r') as f:
+        finished = [line.split()[0] for line in f]
+    assert sorted(finished) == sorted(job['id'] for job in jobs)
+    assert job_queue.job_ids('done') == sorted(job['id'] for job in jobs)
+    assert job_queue.job_ids() == []
@@ -0,0 +1,89 @@
+import os
+import time
+
+from buildings.stage_manifest import StageManifest, path_signature, related_files
+from buildings.stage_scheduler import Stage
+
+
+def write(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def touch_later(path):
+    later = time.time() + 10
+    os.utime(path, (later, later))
+
+
+def finished_stage(tmp_path, command='tool --x'):
+    source, output = str(tmp_path / 'source.txt'), str(tmp_path / 'output.txt')
+    if not os.path.exists(source):
+        write(source, 'input')
+    write(output, 'output')
+    stage = Stage('stage', None, inputs=[source], outputs=[output], command=command)
+    manifest = StageManifest(str(tmp_path))
+    manifest.record(stage, 'running')
+    manifest.record(stage, 'done')
+    return stage, source, output
+
+
+def test_finished_stage_is_up_to_date(tmp_path):
+    stage, _, _ = finished_stage(tmp_path)
+    assert StageManifest(str(tmp_path)).is_up_to_date(stage)
+
+
+def test_changed_input_invalidates_the_stage(tmp_path):
+    stage, source, _ = finished_stage(tmp_path)
+    write(source, 'other input')
+    assert not StageManifest(str(tmp_path)).is_up_to_date(stage)
+
+
+def test_touched_input_invalidates_the_stage(tmp_path):
+    stage, source, _ = finished_stage(tmp_path)
+    touch_later(source)
+    assert not StageManifest(str(tmp_path)).is_up_to_date(stage)
+
+
+def test_changed_command_invalidates_the_stage(tmp_path):
+    finished_stage(tmp_path)
+    stage = Stage('stage', None, inputs=[str(tmp_path / 'source.txt')], outputs=[str(tmp_path / 'output.txt')],
+                  command='tool --y')
+    assert not StageManifest(str(tmp_path)).is_up_to_date(stage)
+
+
+def test_changed_or_missing_output_invalidates_the_stage(tmp_path):
+    stage, _, output = finished_stage(tmp_path)
+    touch_later(output)
+    assert not StageManifest(str(tmp_path)).is_up_to_date(stage)
+    os.remove(output)
+    assert not StageManifest(str(tmp_path)).is_up_to_date(stage)
+
+
+def test_failed_stage_is_not_up_to_date(tmp_path):
+    stage, _, _ = finished_stage(tmp_path)
+    manifest = StageManifest(str(tmp_path))
+    manifest.record(stage, 'running')
+    manifest.record(stage, 'failed', error='tool failed')
+    assert not StageManifest(str(tmp_path)).is_up_to_date(stage)
+    assert manifest.stages['stage']['error'] == 'tool failed'
+
+
+def test_shapefile_signature_covers_its_sidecars(tmp_path):
+    base = str(tmp_path / 'roofs')
+    for ext in ['.shp', '.shx', '.dbf']:
+        write(base + ext, ext)
+    assert related_files(base + '.shp')[:3] == [base + '.shp', base + '.shx', base + '.dbf']
+
+    signature = path_signature(base + '.shp')
+    write(base + '.dbf', 'changed attributes')
+    assert path_signature(base + '.shp') != signature
+
+
+def test_folder_signature_covers_its_files(tmp_path):
+    folder = tmp_path / 'variants'
+    (folder / 'roofs').mkdir(parents=True)
+    write(str(folder / 'roofs' / '1.roof'), 'POLYGON')
+    signature = path_signature(str(folder))
+    write(str(folder / 'roofs' / '2.roof'), 'POLYGON')
+    assert path_signature(str(folder)) != signature
+    assert path_signature(str(tmp_path / 'missing')) is None
@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+
+import pytest
+
+from buildings.process_runner import CommandCanceled
+from buildings.stage_manifest import StageManifest
+from buildings.stage_scheduler import Stage, StageScheduler
+
+
+def writer(path, log, name, content='x'):
+    def action():
+        log.append(name)
+        with open(path, 'w') as f:
+            f.write(content)
+    return action
+
+
+def test_stages_run_after_the_producers_of_their_inputs(tmp_path):
+    a, b, c = [str(tmp_path / name) for name in 'abc']
+    log = []
+    scheduler = StageScheduler(max_workers=4)
+    scheduler.add_stage(Stage('c', writer(c, log, 'c'), inputs=[a, b], outputs=[c]))
+    scheduler.add_stage(Stage('b', writer(b, log, 'b'), inputs=[a], outputs=[b]))
+    scheduler.add_stage(Stage('a', writer(a, log, 'a'), outputs=[a]))
+
+    assert scheduler.run() == []
+    assert log == ['a', 'b', 'c']
+    assert scheduler.is_finished()
+
+
+def test_independent_stages_run_in_parallel(tmp_path):
+    # Each stage waits for the other two, which only finishes when all three run at once.
+    barrier = threading.Barrier(3, timeout=5)
+
+    def meet():
+        barrier.wait()
+
+    scheduler = StageScheduler(max_workers=3)
+    for name in 'abc':
+        scheduler.add_stage(Stage(name, meet, outputs=[str(tmp_path / name)]))
+
+    scheduler.run()
+    assert scheduler.is_finished()
+
+
+def test_main_thread_stages_are_handed_back(tmp_path):
+    a, b, c = [str(tmp_path / name) for name in 'abc']
+    log = []
+    scheduler = StageScheduler()
+    scheduler.add_stage(Stage('a', writer(a, log, 'a'), outputs=[a]))
+    scheduler.add_stage(Stage('picker', writer(b, log, 'picker'), inputs=[a], outputs=[b], main_thread=True))
+    scheduler.add_stage(Stage('c', writer(c, log, 'c'), inputs=[b], outputs=[c]))
+
+    ready = scheduler.run()
+    assert [stage.name for stage in ready] == ['picker']
+    assert log == ['a']
+
+    scheduler.run_main_thread_stage(ready[0])
+    assert scheduler.run() == []
+    assert log == ['a', 'picker', 'c']
+
+
+def test_first_failure_stops_the_pipeline(tmp_path):
+    a, b = str(tmp_path / 'a'), str(tmp_path / 'b')
+    log = []
+
+    def fail():
+        raise RuntimeError('tool failed')
+
+    scheduler = StageScheduler()
+    scheduler.add_stage(Stage('a', fail, outputs=[a]))
+    scheduler.add_stage(Stage('b', writer(b, log, 'b'), inputs=[a], outputs=[b]))
+
+    with pytest.raises(RuntimeError, match='tool failed'):
+        scheduler.run()
+    assert scheduler.stages['a'].state == 'failed'
+    assert scheduler.stages['b'].state == 'pending'
+    assert log == []
+
+
+class CanceledTask:
+    def __init__(self):
+        self.canceled = threading.Event()
+
+    def isCanceled(self):
+        return self.canceled.is_set()
+
+    def begin_stage(self, name):
+        pass
+
+    def end_stage(self):
+        pass
+
+
+def test_canceled_stages_stay_pending(tmp_path):
+    a, b = str(tmp_path / 'a'), str(tmp_path / 'b')
+    task = CanceledTask()
+    log = []
+
+    def cancel():
+        task.canceled.set()
+        time.sleep(0.1)
+        raise CommandCanceled('canceled')
+
+    scheduler = StageScheduler()
+    scheduler.add_stage(Stage('a', cancel, outputs=[a]))
+    scheduler.add_stage(Stage('b', writer(b, log, 'b'), inputs=[a], outputs=[b]))
+
+    assert scheduler.run(task) == []
+    assert scheduler.stages['a'].state == 'pending'
+    assert scheduler.abort.is_set()
+    assert log == []
+
+
+def test_up_to_date_stages_are_skipped(tmp_path):
+    source, a, b = str(tmp_path / 'source'), str(tmp_path / 'a'), str(tmp_path / 'b')
+    with open(source, 'w') as f:
+        f.write('input')
+
+    def build(log):
+        scheduler = StageScheduler(manifest=StageManifest(str(tmp_path)))
+        scheduler.add_stage(Stage('a', writer(a, log, 'a'), inputs=[source], outputs=[a], command='tool a'))
+        scheduler.add_stage(Stage('b', writer(b, log, 'b'), inputs=[a], outputs=[b], command='tool b'))
+        return scheduler
+
+    log = []
+    build(log).run()
+    assert log == ['a', 'b']
+
+    log = []
+    build(log).run()
+    assert log == []
+
+    os.remove(b)
+    log = []
+    build(log).run()
+    assert log == ['b']
@@ -0,0 +1,80 @@
+import importlib
+import random
+
+import pytest
+
+packages = ['hydro', 'greenery']
+
+
+@pytest.fixture(params=packages)
+def package(request):
+    return request.param
+
+
+@pytest.fixture
+def DisjointSets(package):
+    return importlib.import_module(f'{package}.union_find').DisjointSets
+
+
+def test_singletons(DisjointSets):
+    assert DisjointSets(3).groups() == [[0], [1], [2]]
+    assert DisjointSets(0).groups() == []
+
+
+def test_union_joins_sets(DisjointSets):
+    sets = DisjointSets(6)
+    assert sets.union(0, 3)
+    assert sets.union(4, 3)
+    assert not sets.union(0, 4)
+    assert sets.union(1, 5)
+
+    assert sets.find(0) == sets.find(3) == sets.find(4)
+    assert sets.find(1) == sets.find(5) != sets.find(0)
+    assert sets.groups() == [[0, 3, 4], [1, 5], [2]]
+
+
+def test_long_chain_is_one_group(DisjointSets):
+    size = 10000
+    sets = DisjointSets(size)
+    for i in range(size - 1):
+        sets.union(i + 1, i)
+    assert sets.groups() == [list(range(size))]
+
+
+def test_matches_a_graph_search(DisjointSets):
+    rng = random.Random(7)
+    size = 200
+    edges = [(rng.randrange(size), rng.randrange(size)) for _ in range(150)]
+    sets = DisjointSets(size)
+    for i, j in edges:
+        sets.union(i, j)
+
+    neighbours = {i: set() for i in range(size)}
+    for i, j in edges:
+        neighbours[i].add(j)
+        neighbours[j].add(i)
+    expected, seen = [], set()
+    for start in range(size):
+        if start in seen:
+            continue
+        component, stack = [], [start]
+        seen.add(start)
+        while stack:
+            i = stack.pop()
+            component.append(i)
+            for j in neighbours[i] - seen:
+                seen.add(j)
+                stack.append(j)
+        expected.append(sorted(component))
+    assert sets.groups() == expected
+
+
+def test_connected_groups_of_touching_squares(package):
+    core = pytest.importorskip('qgis.core')
+    shard_merge = importlib.import_module(f'{package}.shard_merge')
+
+    def square(x):
+        return core.QgsGeometry.fromWkt(f'POLYGON(({x} 0, {x + 1} 0, {x + 1} 1, {x} 1, {x} 0))')
+
+    geometries = [square(0), square(5), square(1), square(10), square(6), square(2)]
+    assert shard_merge.connected_groups(geometries) == [[0, 2, 5], [1, 4], [3]]
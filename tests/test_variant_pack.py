@@ -0,0 +1,85 @@
+import os
+import struct
+
+import pytest
+
+from buildings.wkb_pack import VariantPack, write_pack, pack_key, pack_path, variants_folder_of, pack_header
+
+pack_file_name = 'roofs.wkbpack'
+
+
+def test_container_round_trip(tmp_path):
+    container_path = str(tmp_path / pack_file_name)
+    entries = {'roofs/1/a.roof': b'\x01\x03' + bytes(range(40)), 'roofs/1/b.roof': b'', 'structures/2/c.proj': b'xyz'}
+    write_pack(container_path, entries)
+
+    pack = VariantPack(container_path)
+    try:
+        assert {key: pack.read(key) for key in pack.index} == entries
+        assert pack.read('roofs/1/missing.roof') is None
+    finally:
+        pack.close()
+    assert os.listdir(str(tmp_path)) == [pack_file_name]
+
+
+def test_rewritten_container_replaces_the_previous_one(tmp_path):
+    container_path = str(tmp_path / pack_file_name)
+    write_pack(container_path, {'roofs/a.roof': b'old'})
+    write_pack(container_path, {'roofs/a.roof': b'new', 'roofs/b.roof': b'added'})
+
+    pack = VariantPack(container_path)
+    try:
+        assert pack.read('roofs/a.roof') == b'new'
+        assert pack.read('roofs/b.roof') == b'added'
+    finally:
+        pack.close()
+
+
+def test_foreign_file_is_rejected(tmp_path):
+    container_path = str(tmp_path / pack_file_name)
+    with open(container_path, 'wb') as f:
+        f.write(pack_header.pack(b'NOTAPACK', 0, 0))
+    with pytest.raises(ValueError):
+        VariantPack(container_path)
+
+    with open(container_path, 'wb') as f:
+        f.write(b'short')
+    with pytest.raises(struct.error):
+        VariantPack(container_path)
+
+
+def test_keys_are_relative_to_the_variants_folder(tmp_path):
+    variants_folder = str(tmp_path / 'map' / 'variants')
+    path = os.path.join(variants_folder, 'roofs', '12', 'image_3.roof')
+
+    assert variants_folder_of(path) == variants_folder
+    assert pack_key(variants_folder, path) == 'roofs/12/image_3.roof'
+    assert variants_folder_of(str(tmp_path / 'map' / 'roofs.shp')) is None
+    assert pack_path(variants_folder, 'roofs') == os.path.join(variants_folder, 'roofs.wkbpack')
+    assert pack_path(variants_folder, 'structures') == os.path.join(variants_folder, 'structures.wkbpack')
+
+
+def test_variant_files_round_trip_through_the_pack(tmp_path):
+    pytest.importorskip('qgis.core')
+    from buildings.variant_pack import pack_variant_geometries, VariantPacks
+
+    variants_folder = tmp_path / 'map' / 'variants'
+    roof_folder = variants_folder / 'roofs' / '1'
+    roof_folder.mkdir(parents=True)
+    (roof_folder / 'a.roof').write_text('POLYGON((0 0, 1 0, 1 1, 0 0))')
+    (roof_folder / 'broken.roof').write_text('not wkt')
+    structure_folder = variants_folder / 'structures' / '1'
+    structure_folder.mkdir(parents=True)
+    (structure_folder / 'a.shade').write_text('POLYGON((0 0, 2 0, 2 2, 0 0))')
+
+    assert pack_variant_geometries(str(variants_folder), 'roofs', read_workers=2) == {'packed': 1}
+    roofs_pack = (variants_folder / 'roofs.wkbpack').read_bytes()
+    assert pack_variant_geometries(str(variants_folder), 'structures', read_workers=2) == {'packed': 1}
+    # Each stage owns its container, packing the structures leaves the roofs one untouched.
+    assert (variants_folder / 'roofs.wkbpack').read_bytes() == roofs_pack
+    assert sorted(os.listdir(str(roof_folder))) == ['broken.roof']
+    with VariantPacks() as packs:
+        geometry = packs.geometry(str(roof_folder / 'a.roof'))
+        assert geometry.area() == pytest.approx(0.5)
+        assert packs.geometry(str(structure_folder / 'a.shade')).area() == pytest.approx(2)
+        assert packs.geometry(str(roof_folder / 'broken.roof')) is None